@@ -1,6 +1,8 @@
 import pandas as pd
 import numpy as np
 import sys
+import time
+from collections import OrderedDict
 
 
 
@@ -9,11 +11,16 @@ class Patrol():
     #fixing a threshold
     threshold=0.62
 
-    def __init__(self, data=None, model=None, features=None, threshold=None):
+    def __init__(self, data=None, model=None, features=None, threshold=None, transaction_column=None,
+                 cache_size=None, cache_ttl=None):
         """
         data:  The pandas dataframe containing all the necessary columns for model calculation.
         model: This should be a pretrained model that has the .predict_proba() method available.
         features: List of predictors for the model to produce the final score.
+        transaction_column: Optional column with the transaction ids, indexed right away (otherwise
+                            the index is built on the first check for that column).
+        cache_size: Optional maximum number of transaction scores kept in memory (see c()).
+        cache_ttl: Optional lifetime of a cached score in seconds.
         """
 
         if data is None or type(data) is not pd.DataFrame:
@@ -28,20 +35,114 @@ class Patrol():
         if pd.Series(features).isin(data.columns).all() is False:
             raise Exception('The features provided are not all present in the data provided!')
 
+        # Bumped whenever the data, model or features are replaced, the feature matrix, the id
+        # indexes and the cached scores are rebuilt on the next check when it moved
+        self._generation=0
+        self._built=None
         self.data=data
         self.model=model
         self.features=features
+        self._sync()
+        if transaction_column is not None:
+            self._index(transaction_column)
 
         if type(threshold) is float:
             self.threshold=threshold
 
+        self.c(cache_size, cache_ttl)
 
-    def d(self, data=None):
+
+    @property
+    def data(self):
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data=data
+        self._generation+=1
+
+    @property
+    def model(self):
+        return self._model
+
+    @model.setter
+    def model(self, model):
+        self._model=model
+        self._generation+=1
+
+    @property
+    def features(self):
+        return self._features
+
+    @features.setter
+    def features(self, features):
+        # A copy, so appending to the caller's list does not change the features behind our back
+        self._features=list(features)
+        self._generation+=1
+
+
+    def _sync(self):
+        """Rebuilding the feature matrix and dropping the id indexes and cached scores when the data,
+        model or features were assigned since they were built (through the setters or directly).
+        A dataframe edited in place is not detected, hand it back with d() to rebuild them."""
+
+        if self._built!=self._generation:
+            self._build_matrix()
+            self._indexes={}
+            self._cache=OrderedDict()
+            self._built=self._generation
+
+
+    def _build_matrix(self):
+        """Contiguous feature matrix of the data, so a lookup never has to copy a dataframe row.
+        Only built when all the features are numeric, otherwise rows are taken from the dataframe."""
+
+        features=self.data[self.features]
+        if all(pd.api.types.is_numeric_dtype(dtype) for dtype in features.dtypes):
+            self._matrix=np.ascontiguousarray(features.to_numpy(dtype=np.float64))
+        else:
+            self._matrix=None
+
+
+    def _index(self, transaction_column):
+        """Hash index transaction id -> row position for the given column, built once per data.
+        Duplicated ids are detected here and kept aside, so lookups never have to count matches."""
+
+        self._sync()
+        if transaction_column not in self._indexes:
+            if transaction_column not in self.data.columns:
+                raise Exception(f'Column {transaction_column} is not present in the data provided!')
+
+            ids=self.data[transaction_column]
+            duplicated=ids.duplicated(keep=False).to_numpy()
+            self._indexes[transaction_column]=(
+                pd.Index(ids[~duplicated]),
+                np.flatnonzero(~duplicated),
+                set(ids[duplicated])
+            )
+
+        return self._indexes[transaction_column]
+
+
+    def _rows(self, positions):
+        """Feature rows at the given positions, as a dataframe keeping the feature names."""
+
+        if self._matrix is not None:
+            return pd.DataFrame(self._matrix[positions], columns=self.features)
+        return self.data.iloc[positions][self.features]
+
+
+    def d(self, data=None, transaction_column=None):
         """additional method for adding new dataframe"""
         if data is None or type(data) is not pd.DataFrame:
             raise Exception('Dataframe provided is not a valid pandas.DataFrame!')       
-        
+
+        if pd.Series(self.features).isin(data.columns).all() == False:
+            raise Exception('The features provided are not all present in the data provided!')
+
         self.data=data
+        if transaction_column is not None:
+            self._index(transaction_column)
         return self       
 
     def m(self, model=None):
@@ -59,7 +160,7 @@ class Patrol():
         if features is None or isinstance(features, list) is False:
             raise Exception('The features provided are non-existent or they are not a list!')
 
-        if pd.Series(features).isin(data.columns).all() is False:
+        if pd.Series(features).isin(self.data.columns).all() == False:
             raise Exception('The features provided are not all present in the data provided!')
 
         self.features=features
@@ -70,28 +171,97 @@ class Patrol():
 
         if type(threshold) is float:
             self.threshold=threshold
+            self._clear_cache()
         
         return self   
 
+    def c(self, cache_size=1024, cache_ttl=None):
+        """additional method for enabling the score cache (cache_size=None disables it)
+        cache_size: Maximum number of transaction scores kept, the least recently used are evicted first.
+        cache_ttl: Optional lifetime of a cached score in seconds."""
+
+        if cache_size is not None and (type(cache_size) is not int or cache_size<1):
+            raise Exception('The cache size provided is not a positive integer!')
+
+        self.cache_size=cache_size
+        self.cache_ttl=cache_ttl
+        self.cache_hits=0
+        self.cache_misses=0
+        self._clear_cache()
+        return self
+
+    def cache_info(self):
+        """Hit/miss counters and current size of the score cache."""
+
+        return {
+            'hits': self.cache_hits,
+            'misses': self.cache_misses,
+            'size': len(self._cache),
+            'max_size': self.cache_size,
+            'ttl': self.cache_ttl,
+        }
+
+
+    def _clear_cache(self):
+        self._cache=OrderedDict()
+
+
+    def _cached(self, transaction_column, transaction_id):
+        """Cached score of the transaction, None on a miss (unknown, expired or cache disabled)."""
+
+        if self.cache_size is None:
+            return None
+
+        self._sync()
+        entry=self._cache.get((transaction_column, transaction_id))
+        if entry is not None and self.cache_ttl is not None and time.monotonic()-entry[1]>self.cache_ttl:
+            del self._cache[(transaction_column, transaction_id)]
+            entry=None
+
+        if entry is None:
+            self.cache_misses+=1
+            return None
+
+        self.cache_hits+=1
+        self._cache.move_to_end((transaction_column, transaction_id))
+        return entry[0]
+
+
+    def _store(self, transaction_column, transaction_ids, scores):
+        if self.cache_size is None:
+            return
+
+        now=time.monotonic()
+        for transaction_id, score in zip(transaction_ids, scores):
+            self._cache[(transaction_column, transaction_id)]=(float(score), now)
+            self._cache.move_to_end((transaction_column, transaction_id))
+        while len(self._cache)>self.cache_size:
+            self._cache.popitem(last=False)
+
 
     def check_transaction(self, transaction_column=None, transaction_id=None):
         """Calculating probability of fraud for given transaction in the given data and comparing it
         to the threshold for determining fraud. Returning a decision to LOCK or NO_LOCK the client 
         based on the value of the score and the value of the threshold."""
 
+        final_score=self._cached(transaction_column, transaction_id)
+        if final_score is not None:
+            return self._decide(final_score)
+
         try:
-            df_=self.data[self.data[transaction_column]==transaction_id]
-            if len(df_)<=0:
-                raise Exception('No transaction with given ID in the dataset!')
-            if len(df_)>1:
+            index, positions, duplicates=self._index(transaction_column)
+            if transaction_id in duplicates:
                 raise Exception('More transactions with given ID in the dataset!')
+            try:
+                position=positions[index.get_loc(transaction_id)]
+            except KeyError:
+                raise Exception('No transaction with given ID in the dataset!')
         except Exception as err:
             print(f'Could not find the given transaction in the dataset!')
             raise
 
         try:
-            df_['model_score']=self.model.predict_proba(df_[self.features])[:,1]
-            final_score=df_['model_score'].reset_index(drop=True)[0]
+            final_score=self.model.predict_proba(self._rows([position]))[:,1][0]
             if final_score>1:
                 raise Exception('Score is greater than 1!')      
             if final_score<0:
@@ -100,6 +270,11 @@ class Patrol():
             print(f'Could not calculate the final score!')
             raise
 
+        self._store(transaction_column, [transaction_id], [final_score])
+        return self._decide(final_score)
+
+
+    def _decide(self, final_score):
         if final_score>self.threshold:
             print(f'Final score {final_score} is greater than threshold {self.threshold}  ->LOCK')
             return 'LOCK'
@@ -108,4 +283,128 @@ class Patrol():
             return 'PASS'
 
 
- 
\ No newline at end of file
+    def score_frame(self, df=None):
+        """Scoring every row of the given dataframe with a single predict_proba call and comparing
+        the scores to the threshold. Returning two arrays aligned with the rows of the dataframe:
+        the decisions ('LOCK' or 'PASS') and the scores."""
+
+        if df is None or type(df) is not pd.DataFrame:
+            raise Exception('Dataframe provided is not a valid pandas.DataFrame!')
+
+        if pd.Series(self.features).isin(df.columns).all() == False:
+            raise Exception('The features provided are not all present in the data provided!')
+
+        if len(df)==0:
+            return np.empty(0, dtype='<U4'), np.empty(0, dtype=np.float64)
+
+        try:
+            scores=np.asarray(self.model.predict_proba(df[self.features])[:,1], dtype=np.float64)
+            if (scores>1).any():
+                raise Exception('Score is greater than 1!')
+            if (scores<0).any():
+                raise Exception('Score is smaller than 0!')
+        except Exception as err:
+            print(f'Could not calculate the final scores!')
+            raise
+
+        decisions=np.where(scores>self.threshold, 'LOCK', 'PASS')
+        return decisions, scores
+
+
+    def check_transactions(self, transaction_column=None, transaction_ids=None):
+        """Batch version of check_transaction: looking up all the given transactions in the data,
+        scoring them with one predict_proba call and returning the LOCK/PASS decisions and the
+        scores, in the order of the given ids."""
+
+        wanted=list(transaction_ids)
+        cached=np.array([self._cached(transaction_column, i) for i in wanted], dtype=np.float64) \
+            if self.cache_size is not None else np.full(len(wanted), np.nan)
+        missing=np.isnan(cached)
+        lookup=[i for i, m in zip(wanted, missing) if m] if not missing.all() else wanted
+
+        if lookup:
+            try:
+                index, positions, duplicates=self._index(transaction_column)
+                if duplicates and not duplicates.isdisjoint(lookup):
+                    raise Exception('More transactions with given ID in the dataset!')
+                found=index.get_indexer(pd.Index(lookup))
+                if (found<0).any():
+                    raise Exception(f'No transaction with given ID in the dataset! ({(found<0).sum()} not found)')
+            except Exception as err:
+                print(f'Could not find the given transactions in the dataset!')
+                raise
+
+            _, cached[missing]=self.score_frame(self._rows(positions[found]))
+            self._store(transaction_column, lookup, cached[missing])
+
+        return np.where(cached>self.threshold, 'LOCK', 'PASS'), cached
+
+
+    def threshold_sweep(self, target_column=None, df=None, amount_column=None, thresholds=None, by=None):
+        """Precision, recall, lock rate and GBP of fraud blocked for many candidate thresholds.
+
+        target_column: Column with the fraud label (1 for fraud) in the labelled data.
+        df: Labelled dataframe to score, the data of the instance by default.
+        amount_column: Optional column with the GBP amount of each transaction.
+        thresholds: Candidate thresholds, 1001 evenly spaced values between 0 and 1 by default.
+        by: Optional list of columns (e.g. ['country', 'transaction_type']) for one curve per group.
+
+        The data is scored once, sorted once (by group, then score) and the cumulative sums of the
+        labels and amounts give, for every threshold, the totals of the transactions that would be
+        locked (score > threshold) with a single binary search per group.
+        """
+
+        df=self.data if df is None else df
+        if target_column is None or target_column not in df.columns:
+            raise Exception('The target column provided is not present in the data provided!')
+
+        by=list(by or [])
+        for column in by+([amount_column] if amount_column else []):
+            if column not in df.columns:
+                raise Exception(f'Column {column} is not present in the data provided!')
+
+        thresholds=np.linspace(0, 1, 1001) if thresholds is None else np.sort(np.asarray(thresholds, dtype=np.float64))
+        _, scores=self.score_frame(df)
+        target=df[target_column].to_numpy(dtype=np.float64)
+        amounts=np.nan_to_num(df[amount_column].to_numpy(dtype=np.float64)) if amount_column else np.zeros(len(df))
+
+        if by:
+            codes=df.groupby(by, observed=True, sort=True, dropna=False).ngroup().to_numpy()
+            groups=df[by].iloc[np.unique(codes, return_index=True)[1]].reset_index(drop=True)
+        else:
+            codes=np.zeros(len(df), dtype=np.int64)
+            groups=pd.DataFrame(index=[0])
+
+        # Ascending scores within each group, suffix totals are whole-group totals minus prefix sums
+        order=np.lexsort((scores, codes))
+        scores, target, amounts, codes=scores[order], target[order], amounts[order], codes[order]
+        cum_fraud=np.concatenate([[0.0], np.cumsum(target)])
+        cum_fraud_gbp=np.concatenate([[0.0], np.cumsum(target*amounts)])
+        bounds=np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(groups)))])
+
+        results=[]
+        for g in range(len(groups)):
+            start, end=bounds[g], bounds[g+1]
+            first_locked=start+np.searchsorted(scores[start:end], thresholds, side='right')
+            locked=end-first_locked
+            frauds=cum_fraud[end]-cum_fraud[start]
+            frauds_locked=cum_fraud[end]-cum_fraud[first_locked]
+
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result=pd.DataFrame({
+                    'threshold': thresholds,
+                    'locked': locked,
+                    'frauds_locked': frauds_locked.round().astype(np.int64),
+                    'precision': np.where(locked>0, frauds_locked/locked, np.nan),
+                    'recall': frauds_locked/frauds if frauds>0 else np.nan,
+                    'lock_rate': locked/(end-start),
+                })
+            if amount_column:
+                result['fraud_gbp_blocked']=cum_fraud_gbp[end]-cum_fraud_gbp[first_locked]
+            for column in by:
+                result.insert(by.index(column), column, groups.loc[g, column])
+            results.append(result)
+
+        return pd.concat(results, ignore_index=True)
+
+
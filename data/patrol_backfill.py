@@ -0,0 +1,156 @@
+import argparse
+import io
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from Patrol import Patrol
+from patrol_service import model_features
+
+
+
+# State of a backfill worker process, set once by _init_worker
+_worker={}
+
+# Bytes of the CSV parsed by a worker at a time (the file is also split in at least one range per worker)
+PARTITION_BYTES=64*1024**2
+
+
+def byte_partitions(csv_path=None, n_partitions=1, partition_bytes=PARTITION_BYTES):
+    """Splitting the rows of a CSV into [start, end) byte ranges ending on line breaks, with at most
+    partition_bytes each and at least n_partitions when the file is large enough.
+    Returning the header line and the ranges. Quoted fields must not contain line breaks."""
+
+    size=os.path.getsize(csv_path)
+    with open(csv_path, 'rb') as fh:
+        header=fh.readline()
+        first=fh.tell()
+        step=max(1, min(partition_bytes, -(-(size-first)//max(n_partitions, 1))))
+
+        bounds=[first]
+        while bounds[-1]<size:
+            fh.seek(min(bounds[-1]+step, size))
+            if fh.tell()<size:
+                fh.readline()
+            bounds.append(fh.tell())
+    return header, list(zip(bounds[:-1], bounds[1:]))
+
+
+def _init_worker(model_path, features, threshold, csv_path, header, id_column, parts_dir):
+    """Loading the model once per worker and reading the column names of the CSV."""
+
+    with open(model_path, 'rb') as fh:
+        model=pickle.load(fh)
+    # One thread per process, the pool already uses every core
+    if hasattr(model, 'set_params') and 'n_jobs' in model.get_params():
+        model.set_params(n_jobs=1)
+
+    _worker['patrol']=Patrol(data=pd.DataFrame(columns=features), model=model, features=features, threshold=threshold)
+    _worker['csv_path']=csv_path
+    _worker['columns']=pd.read_csv(io.BytesIO(header)).columns.tolist()
+    _worker['id_column']=id_column
+    _worker['parts_dir']=parts_dir
+
+
+def score_partition(bounds):
+    """Parsing and scoring the rows in the byte range [start, end) of the CSV, the decisions being
+    written to their own part file. Only the bounds travel to the worker, never the rows."""
+
+    start, end=bounds
+    patrol=_worker['patrol']
+    id_column=_worker['id_column']
+    with open(_worker['csv_path'], 'rb') as fh:
+        fh.seek(start)
+        chunk=pd.read_csv(io.BytesIO(fh.read(end-start)), header=None, names=_worker['columns'],
+                          usecols=[id_column]+[f for f in patrol.features if f!=id_column], dtype={id_column: str})
+
+    decisions, scores=patrol.score_frame(chunk.astype({f: np.float64 for f in patrol.features}))
+    part_path=os.path.join(_worker['parts_dir'], f'{start}.csv')
+    pd.DataFrame({id_column: chunk[id_column].to_numpy(), 'score': scores,
+                  'decision': decisions}).to_csv(part_path, header=False, index=False)
+    return part_path, len(chunk), int((decisions=='LOCK').sum())
+
+
+def backfill(csv_path=None, model_path=None, output_path=None, features=None, id_column='ID',
+             threshold=None, workers=None, partition_bytes=PARTITION_BYTES, work_dir=None):
+    """Re-scoring a full transaction file with Patrol in a process pool.
+
+    The file is split into byte ranges on line breaks, and every worker parses, scores and writes
+    the decisions of its own ranges, so nothing runs serially but the split and the final copy,
+    and no rows are ever pickled. Every worker loads the model once. The part files are appended
+    to `output_path` (id, score, decision) in file order as soon as each one is done. Returning a
+    small report of the run.
+    """
+
+    with open(model_path, 'rb') as fh:
+        model=pickle.load(fh)
+    features=features or model_features(model)
+    threshold=threshold if type(threshold) is float else Patrol.threshold
+    workers=workers or os.cpu_count() or 1
+
+    start_time=time.perf_counter()
+    header, partitions=byte_partitions(csv_path, workers, partition_bytes)
+    with tempfile.TemporaryDirectory(dir=work_dir) as parts_dir:
+        init_args=(model_path, features, threshold, csv_path, header, id_column, parts_dir)
+        if workers==1 or len(partitions)<=1:
+            _init_worker(*init_args)
+            pool=None
+            done=map(score_partition, partitions)
+        else:
+            pool=ProcessPoolExecutor(max_workers=min(workers, len(partitions)),
+                                     initializer=_init_worker, initargs=init_args)
+            done=pool.map(score_partition, partitions)
+
+        n_rows, locked=0, 0
+        tmp_output=output_path+'.tmp'
+        try:
+            with open(tmp_output, 'wb') as out:
+                out.write(f'{id_column},score,decision\n'.encode())
+                for part_path, part_rows, part_locked in done:
+                    with open(part_path, 'rb') as part:
+                        shutil.copyfileobj(part, out)
+                    os.remove(part_path)
+                    n_rows+=part_rows
+                    locked+=part_locked
+            os.replace(tmp_output, output_path)
+        except BaseException:
+            if os.path.exists(tmp_output):
+                os.remove(tmp_output)
+            raise
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True, cancel_futures=True)
+
+    seconds=time.perf_counter()-start_time
+    return {
+        'rows': n_rows,
+        'partitions': len(partitions),
+        'workers': workers,
+        'locked': locked,
+        'seconds': round(seconds, 3),
+        'rows_per_s': round(n_rows/seconds, 1) if seconds else None,
+    }
+
+
+if __name__=='__main__':
+    parser=argparse.ArgumentParser(description='Re-score a full transaction history with Patrol in a process pool')
+    parser.add_argument('--data', required=True, help='CSV with the transaction ids and the model features')
+    parser.add_argument('--model', required=True, help='Pickled model with a predict_proba method (e.g. xgb_model.pkl)')
+    parser.add_argument('--output', required=True, help='Decisions CSV written (id, score, decision)')
+    parser.add_argument('--id-column', default='ID', help='Transaction id column')
+    parser.add_argument('--threshold', type=float, default=None, help=f'Lock threshold (default: {Patrol.threshold})')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: all cores)')
+    parser.add_argument('--partition-mb', type=int, default=PARTITION_BYTES//1024**2,
+                        help='Largest slice of the CSV parsed by a worker at a time, in MB')
+    args=parser.parse_args()
+
+    report=backfill(args.data, args.model, args.output, id_column=args.id_column, threshold=args.threshold,
+                    workers=args.workers, partition_bytes=args.partition_mb*1024**2)
+    for key, value in report.items():
+        print(f'{key:<12}{value}')
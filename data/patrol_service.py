@@ -0,0 +1,250 @@
+import argparse
+import asyncio
+import pickle
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from Patrol import Patrol
+
+
+
+def model_features(model):
+    """Feature names the model was fitted on (XGBoost booster or scikit-learn estimator)."""
+
+    if hasattr(model, 'get_booster'):
+        return list(model.get_booster().feature_names)
+    if hasattr(model, 'feature_names_in_'):
+        return list(model.feature_names_in_)
+    raise Exception('Could not read the feature names from the model provided!')
+
+
+
+class PatrolService():
+    """Asynchronous front end of a Patrol instance.
+
+    Callers await score() with the features of a single transaction. Requests are queued and
+    grouped into micro-batches of at most max_batch transactions, a batch being sent as soon as
+    it is full or max_delay seconds after its first request arrived. Each batch is scored with a
+    single Patrol.score_frame call in a worker thread, so the event loop keeps accepting requests
+    while the model runs, and every caller gets its own (decision, score) back.
+    """
+
+    def __init__(self, patrol=None, max_batch=256, max_delay=0.005):
+        """
+        patrol: A Patrol instance, its model, features and threshold are used for every batch.
+        max_batch: Maximum number of transactions scored by one model call.
+        max_delay: Maximum time (seconds) a request waits for its batch to fill up.
+        """
+
+        if patrol is None or isinstance(patrol, Patrol) is False:
+            raise Exception('The patrol provided is not a valid Patrol instance!')
+
+        if max_batch<1:
+            raise Exception('The maximum batch size should be at least 1!')
+
+        self.patrol=patrol
+        self.max_batch=max_batch
+        self.max_delay=max_delay
+
+        self.batches=0
+        self.scored=0
+
+        self._queue=None
+        self._worker=None
+        # One thread, so batches reach the model one at a time and in order
+        self._executor=ThreadPoolExecutor(max_workers=1)
+
+
+    async def start(self):
+        """Starting the batching loop on the running event loop."""
+
+        if self._worker is None:
+            self._queue=asyncio.Queue()
+            self._worker=asyncio.create_task(self._run())
+        return self
+
+
+    async def stop(self):
+        """Scoring the requests still queued and stopping the batching loop."""
+
+        if self._worker is not None:
+            await self._queue.put(None)
+            await self._worker
+            self._worker=None
+        self._executor.shutdown(wait=True)
+
+
+    async def __aenter__(self):
+        return await self.start()
+
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+
+    async def score(self, transaction=None):
+        """Scoring one transaction (a dict or a pandas.Series with all the features).
+        Returning a tuple (decision, score), the decision being 'LOCK' or 'PASS'."""
+
+        if self._worker is None:
+            raise Exception('The service is not started, call start() first!')
+
+        try:
+            row=[transaction[feature] for feature in self.patrol.features]
+        except (KeyError, TypeError):
+            raise Exception('The transaction provided does not contain all the features!')
+
+        future=asyncio.get_running_loop().create_future()
+        await self._queue.put((row, future))
+        return await future
+
+
+    async def _next_batch(self):
+        """Waiting for a first request, then filling the batch until it is full or its deadline passed.
+        Returning the batch and whether the service has been asked to stop."""
+
+        loop=asyncio.get_running_loop()
+        item=await self._queue.get()
+        if item is None:
+            return [], True
+
+        batch=[item]
+        deadline=loop.time()+self.max_delay
+        while len(batch)<self.max_batch:
+            # Taking whatever is already queued without going through a timer
+            try:
+                item=self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                timeout=deadline-loop.time()
+                if timeout<=0:
+                    break
+                try:
+                    item=await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+
+            if item is None:
+                return batch, True
+            batch.append(item)
+
+        return batch, False
+
+
+    async def _run(self):
+        loop=asyncio.get_running_loop()
+        stopping=False
+        while not stopping:
+            batch, stopping=await self._next_batch()
+            if not batch:
+                continue
+
+            frame=pd.DataFrame([row for row, _ in batch], columns=self.patrol.features)
+            try:
+                decisions, scores=await loop.run_in_executor(self._executor, self.patrol.score_frame, frame)
+            except Exception as err:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(err)
+                continue
+
+            for (_, future), decision, score in zip(batch, decisions, scores):
+                # A caller may have been cancelled while its batch was scored
+                if not future.done():
+                    future.set_result((str(decision), float(score)))
+
+            self.batches+=1
+            self.scored+=len(batch)
+
+
+
+def latency_report(latencies, seconds, service=None):
+    """p50/p99 latency (milliseconds) and throughput of a load test."""
+
+    latencies=np.asarray(latencies)*1000
+    report={
+        'requests': len(latencies),
+        'seconds': round(seconds, 3),
+        'throughput_per_s': round(len(latencies)/seconds, 1) if seconds else None,
+        'p50_ms': round(float(np.percentile(latencies, 50)), 3) if len(latencies) else None,
+        'p99_ms': round(float(np.percentile(latencies, 99)), 3) if len(latencies) else None,
+    }
+    if service is not None and service.batches:
+        report['batches']=service.batches
+        report['mean_batch_size']=round(service.scored/service.batches, 1)
+    return report
+
+
+async def load_test(service=None, transactions=None, requests=10000, rate=5000.0, seed=0):
+    """Local load generator: sending `requests` transactions sampled from the given dataframe
+    with Poisson arrivals at `rate` requests per second (all at once when rate is None),
+    and reporting the latency percentiles and the throughput."""
+
+    rng=np.random.default_rng(seed)
+    rows=transactions[service.patrol.features].iloc[rng.integers(0, len(transactions), requests)]
+    rows=rows.to_dict('records')
+
+    if rate:
+        arrivals=np.cumsum(rng.exponential(1/rate, requests))
+    else:
+        arrivals=np.zeros(requests)
+
+    latencies=np.empty(requests)
+
+    async def send(i, start):
+        delay=start+arrivals[i]-time.perf_counter()
+        if delay>0:
+            await asyncio.sleep(delay)
+        sent=time.perf_counter()
+        await service.score(rows[i])
+        latencies[i]=time.perf_counter()-sent
+
+    start=time.perf_counter()
+    await asyncio.gather(*(send(i, start) for i in range(requests)))
+    return latency_report(latencies, time.perf_counter()-start, service)
+
+
+def sequential_baseline(patrol=None, transactions=None, requests=1000, seed=0):
+    """Same kind of report with one model call per transaction, for comparison."""
+
+    rng=np.random.default_rng(seed)
+    rows=transactions[patrol.features].iloc[rng.integers(0, len(transactions), requests)]
+
+    latencies=np.empty(requests)
+    start=time.perf_counter()
+    for i in range(requests):
+        sent=time.perf_counter()
+        patrol.score_frame(rows.iloc[[i]])
+        latencies[i]=time.perf_counter()-sent
+    return latency_report(latencies, time.perf_counter()-start)
+
+
+async def _main(args):
+    with open(args.model, 'rb') as fh:
+        model=pickle.load(fh)
+    data=pd.read_csv(args.data)
+    patrol=Patrol(data=data, model=model, features=model_features(model))
+
+    async with PatrolService(patrol, args.max_batch, args.max_delay_ms/1000) as service:
+        report=await load_test(service, data, args.requests, args.rate or None)
+    for key, value in report.items():
+        print(f'{key:<20}{value}')
+
+    if args.baseline:
+        print('\nOne model call per transaction:')
+        for key, value in sequential_baseline(patrol, data, min(args.requests, 1000)).items():
+            print(f'{key:<20}{value}')
+
+
+if __name__=='__main__':
+    parser=argparse.ArgumentParser(description='Load test of the micro-batching Patrol scoring service')
+    parser.add_argument('--model', required=True, help='Pickled model with a predict_proba method (e.g. xgb_model.pkl)')
+    parser.add_argument('--data', required=True, help='CSV with the model features, transactions are sampled from it')
+    parser.add_argument('--requests', type=int, default=10000, help='Number of score requests sent')
+    parser.add_argument('--rate', type=float, default=5000.0, help='Requests per second (0 sends them all at once)')
+    parser.add_argument('--max-batch', type=int, default=256, help='Maximum micro-batch size')
+    parser.add_argument('--max-delay-ms', type=float, default=5.0, help='Maximum wait for a micro-batch to fill up')
+    parser.add_argument('--baseline', action='store_true', help='Also time one model call per transaction')
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,225 @@
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from data_cache import atomic_path
+from etl import connect
+
+
+ALERT_STATE_FILE_PATH = os.environ.get("ALERT_STATE_FILE_PATH", "data/alert_state.csv")
+ALERT_FILE_PATH = os.environ.get("ALERT_FILE_PATH", "data/alerts.jsonl")
+
+SEGMENT_KEYS = ["country", "transaction_type"]
+METRICS = ["fraud_rate", "fraud_amount"]
+# Per segment: last period folded in, then the periods seen, mean and deviation of each metric
+STATE_DTYPES = {"last_period": object, **{f"{m}_{field}": dtype for m in METRICS
+                                          for field, dtype in [("n", np.int64), ("mean", np.float64), ("dev", np.float64)]}}
+ALERT_COLUMNS = ["detected_at", "period", "country", "transaction_type", "metric", "value", "baseline", "z"]
+
+# Weight of the newest period in the moving mean (about the last 1 / ALPHA periods), and in the
+# deviation, slower so a few quiet periods do not shrink the scale and raise false alerts
+EWMA_ALPHA = 0.3
+DEVIATION_ALPHA = 0.1
+# A segment is only scored once its baseline has seen this many periods
+MIN_PERIODS = 4
+# Deviation from the baseline, in robust standard deviations, that raises an alert
+Z_THRESHOLD = 3.0
+# The fraud rate of a segment with fewer transactions in a period is too noisy to score
+MIN_TRANSACTIONS = 30
+# Smallest deviation scale, so a segment with a flat history does not alert on any change:
+# absolute (0.5 point of fraud rate, £50) and relative to the baseline
+MIN_SCALE = {"fraud_rate": 0.005, "fraud_amount": 50.0}
+MIN_RELATIVE_SCALE = 0.1
+# Mean absolute deviation to standard deviation, for normally distributed values
+MAD_TO_SIGMA = 1.2533
+
+
+def segment_metrics(values):
+    """Fraud rate and fraud amount of each segment of a period (rate NaN below MIN_TRANSACTIONS)."""
+    transactions = values["nb_transaction"].to_numpy(dtype=np.float64)
+    rate = np.divide(values["nb_transaction_fraud"].to_numpy(dtype=np.float64), transactions,
+                     out=np.full(len(values), np.nan), where=transactions >= MIN_TRANSACTIONS)
+    return {"fraud_rate": rate, "fraud_amount": values["total_amount_fraud"].to_numpy(dtype=np.float64)}
+
+
+def period_values(base2):
+    """Per period and segment sums of base_2 rows, one period per week (or per day for the daily
+    structure), ordered by period."""
+    period = "iso_week" if "iso_week" in base2.columns else "day_date"
+    values = base2.groupby([period] + SEGMENT_KEYS, observed=True)[
+        ["nb_transaction", "nb_transaction_fraud", "total_amount_fraud"]].sum().reset_index()
+    values = values.rename(columns={period: "period"})
+    values["period"] = values["period"].astype(str).str[:10]
+    return values.sort_values(["period"] + SEGMENT_KEYS, kind="stable").reset_index(drop=True)
+
+
+class AlertEngine():
+    """Streaming baseline of the fraud rate and fraud amount of every (country, type) segment.
+
+    Each segment keeps, per metric, an exponentially weighted mean and mean absolute deviation
+    of its past periods. A new period is scored against them (robust z-score) and folded in,
+    so a refresh only touches the periods it brings, never the history. Values beyond the
+    threshold are clipped before being folded in, so one spike neither drags the baseline nor
+    widens the deviation enough to hide the next one.
+    """
+
+    def __init__(self, state=None):
+        if state is None:
+            state = pd.DataFrame(columns=SEGMENT_KEYS + list(STATE_DTYPES))
+        self.state = state.set_index(SEGMENT_KEYS)[list(STATE_DTYPES)].astype(STATE_DTYPES)
+
+    @classmethod
+    def load(cls, path=ALERT_STATE_FILE_PATH):
+        if not os.path.exists(path):
+            return cls()
+        # keep_default_na: "NA" is Namibia, not a missing country
+        return cls(pd.read_csv(path, dtype={"country": str, "transaction_type": str, "last_period": str},
+                               keep_default_na=False))
+
+    def save(self, path=ALERT_STATE_FILE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with atomic_path(path) as tmp_path:
+            self.state.reset_index().to_csv(tmp_path, index=False)
+
+    @property
+    def watermark(self):
+        """Last period folded into the baseline, None before the first one."""
+        return self.state["last_period"].max() if len(self.state) else None
+
+    def update(self, period, values):
+        """Score one period of per-segment values and fold it into the baselines.
+
+        `values` has one row per segment active in the period (SEGMENT_KEYS plus the base_2
+        sums). Returns the alerts of the period.
+        """
+        segments = pd.MultiIndex.from_frame(values[SEGMENT_KEYS])
+        new = segments.difference(self.state.index)
+        if len(new):
+            empty = pd.DataFrame({column: pd.Series(0, index=new).astype(dtype) for column, dtype in STATE_DTYPES.items()})
+            self.state = pd.concat([self.state, empty]) if len(self.state) else empty
+        rows = self.state.index.get_indexer(segments)
+
+        alerts = []
+        for metric, x in segment_metrics(values).items():
+            n = self.state[f"{metric}_n"].to_numpy()[rows]
+            mean = self.state[f"{metric}_mean"].to_numpy()[rows]
+            dev = self.state[f"{metric}_dev"].to_numpy()[rows]
+
+            valid = ~np.isnan(x)
+            warm = valid & (n >= MIN_PERIODS)
+            scale = np.maximum.reduce([dev * MAD_TO_SIGMA, np.full(len(x), MIN_SCALE[metric]),
+                                       MIN_RELATIVE_SCALE * np.abs(mean)])
+            z = np.where(warm, (x - mean) / scale, np.nan)
+
+            flagged = np.flatnonzero(warm & (np.abs(z) >= Z_THRESHOLD))
+            alerts.append(pd.DataFrame({
+                "period": period,
+                "country": values["country"].to_numpy()[flagged],
+                "transaction_type": values["transaction_type"].to_numpy()[flagged],
+                "metric": metric,
+                "value": x[flagged],
+                "baseline": mean[flagged],
+                "z": z[flagged].round(2),
+            }))
+
+            # Plain running averages over the first periods, until the EWMA weights take over
+            step = np.where(warm, np.clip(x - mean, -Z_THRESHOLD * scale, Z_THRESHOLD * scale), x - mean)
+            weight = np.maximum(EWMA_ALPHA, 1.0 / (n + 1))
+            dev_weight = np.maximum(DEVIATION_ALPHA, 1.0 / np.maximum(n, 1))
+            self.state.iloc[rows, self.state.columns.get_loc(f"{metric}_mean")] = np.where(
+                valid, mean + weight * step, mean)
+            self.state.iloc[rows, self.state.columns.get_loc(f"{metric}_dev")] = np.where(
+                valid & (n > 0), (1 - dev_weight) * dev + dev_weight * np.abs(step), dev)
+            self.state.iloc[rows, self.state.columns.get_loc(f"{metric}_n")] = n + valid
+
+        self.state.iloc[rows, self.state.columns.get_loc("last_period")] = period
+        return pd.concat(alerts, ignore_index=True)
+
+    def ingest(self, values, include_last=False):
+        """Fold the periods of `period_values()` newer than the watermark, in order.
+
+        The latest period may still be filling up (the current week), it is only scored once a
+        later one arrives, unless `include_last`. Returns the alerts raised.
+        """
+        periods = sorted(values["period"].unique())
+        if periods and not include_last:
+            periods = periods[:-1]
+        watermark = self.watermark
+        periods = [p for p in periods if watermark is None or p > watermark]
+
+        alerts = [pd.DataFrame(columns=ALERT_COLUMNS)]
+        for period, group in values[values["period"].isin(periods)].groupby("period", sort=True):
+            alerts.append(self.update(period, group))
+        alerts = pd.concat(alerts, ignore_index=True)
+        alerts["detected_at"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        return alerts[ALERT_COLUMNS]
+
+
+def read_new_periods(conn, after=None):
+    """Per-segment sums of the base_2 table for the weeks after `after` (the primary key's
+    iso_week prefix serves the range), the only rows a refresh needs."""
+    query = ("SELECT iso_week AS period, country, transaction_type, SUM(nb_transaction) AS nb_transaction, "
+             "SUM(nb_transaction_fraud) AS nb_transaction_fraud, SUM(total_amount_fraud) AS total_amount_fraud "
+             "FROM base_2 WHERE iso_week > ? GROUP BY iso_week, country, transaction_type "
+             "ORDER BY iso_week, country, transaction_type")
+    return pd.read_sql_query(query, conn, params=(after or "",))
+
+
+def write_alerts(alerts, path=ALERT_FILE_PATH):
+    """Append the alerts to the JSON-lines sink."""
+    if alerts.empty:
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as fh:
+        for record in alerts.to_dict(orient="records"):
+            fh.write(json.dumps(record) + "\n")
+
+
+def read_alerts(path=ALERT_FILE_PATH):
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return pd.DataFrame(columns=ALERT_COLUMNS)
+    return pd.read_json(path, lines=True, dtype={"period": str, "country": str, "transaction_type": str})
+
+
+def refresh_alerts(conn, state_path=ALERT_STATE_FILE_PATH, alert_path=ALERT_FILE_PATH, include_last=False):
+    """Score the base_2 weeks newer than the saved state, write their alerts and the new state.
+    Returns the alerts raised."""
+    engine = AlertEngine.load(state_path)
+    alerts = engine.ingest(read_new_periods(conn, engine.watermark), include_last)
+    write_alerts(alerts, alert_path)
+    engine.save(state_path)
+    return alerts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score the new base_2 periods and append their fraud alerts")
+    parser.add_argument("--csv", help="Read base_2 from this CSV (weekly or daily) instead of fincrime.db")
+    parser.add_argument("--include-last", action="store_true", help="Also score the latest, maybe partial, period")
+    parser.add_argument("--state", default=ALERT_STATE_FILE_PATH, help="Baseline state file")
+    parser.add_argument("--output", default=ALERT_FILE_PATH, help="JSON-lines alert sink")
+    parser.add_argument("--reset", action="store_true", help="Forget the baselines and start over")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.reset and os.path.exists(args.state):
+        os.remove(args.state)
+    if args.csv:
+        engine = AlertEngine.load(args.state)
+        alerts = engine.ingest(period_values(pd.read_csv(args.csv)), args.include_last)
+        write_alerts(alerts, args.output)
+        engine.save(args.state)
+    else:
+        conn = connect()
+        try:
+            alerts = refresh_alerts(conn, args.state, args.output, args.include_last)
+        finally:
+            conn.close()
+
+    print(f"{len(alerts)} alerts written to {args.output} in {time.perf_counter() - start:.2f}s")
+    if not alerts.empty:
+        print(alerts.drop(columns="detected_at").to_string(index=False))
@@ -0,0 +1,277 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from build_base2 import build_base2, write_csv
+from cube import Cube
+from data_cache import read_prepared
+from db_setup import setup_database
+from filter_index import FilterIndex
+from synthetic import FRAUD_RATE, TRANSACTIONS_DAYS, generate
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"))
+from Patrol import Patrol  # noqa: E402
+
+
+BENCHMARK_FILE_PATH = os.environ.get("BENCHMARK_FILE_PATH", "data/benchmark_results.jsonl")
+
+STAGES = ["generate", "db_setup", "build_base2", "load_data_cold", "load_data", "filter_index", "sidebar_filters",
+          "cube", "charts", "groupby_charts", "patrol_index", "check_transaction", "check_transactions"]
+
+# Rows of transactions.csv Patrol is built on (its frame is held in memory)
+PATROL_ROWS = 5_000_000
+PATROL_FEATURES = ["log_amount", "is_topup", "is_transfer", "is_foreign", "hour"]
+
+
+class LinearScorer():
+    """Fixed logistic model, so the Patrol stages measure the lookups and not a model's own cost."""
+
+    coefficients = np.array([0.6, 1.5, 0.8, 0.7, -0.02])
+    intercept = -5.0
+
+    def predict_proba(self, X):
+        z = np.asarray(X, dtype=np.float64) @ self.coefficients + self.intercept
+        p = 1.0 / (1.0 + np.exp(-z))
+        return np.column_stack([1.0 - p, p])
+
+
+def patrol_features(transactions):
+    created = pd.to_datetime(transactions["CREATED_DATE"], format="ISO8601")
+    return pd.DataFrame({
+        "ID": transactions["ID"].to_numpy(),
+        "log_amount": np.log1p(transactions["AMOUNT_GBP"].fillna(0).to_numpy()),
+        "is_topup": (transactions["TYPE"] == "TOPUP").to_numpy(dtype=np.float64),
+        "is_transfer": (transactions["TYPE"] == "TRANSFER").to_numpy(dtype=np.float64),
+        "is_foreign": (~transactions["CURRENCY"].isin(["GBP", "EUR"])).to_numpy(dtype=np.float64),
+        "hour": created.dt.hour.to_numpy(dtype=np.float64),
+    })
+
+
+def random_selections(df, rng, n):
+    """Sidebar-like selections: a run of weeks, a few countries, most transaction types."""
+    weeks = np.sort(df["iso_week"].astype(str).unique())
+    countries = np.sort(df["country"].astype(str).unique())
+    types = np.sort(df["transaction_type"].astype(str).unique())
+    selections = []
+    for _ in range(n):
+        first = rng.integers(0, len(weeks))
+        selections.append({
+            "iso_week": list(weeks[first:first + rng.integers(1, len(weeks) + 1)]),
+            "country": list(rng.choice(countries, min(5, len(countries)), replace=False)),
+            "transaction_type": list(rng.choice(types, max(1, len(types) - 1), replace=False)),
+        })
+    return selections
+
+
+def timed(function, repeat=1):
+    """Seconds of each of `repeat` calls, and the result of the last one."""
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        seconds.append(time.perf_counter() - start)
+    return seconds, result
+
+
+def git_revision():
+    """Commit the benchmark runs on, with a `-dirty` suffix when the tree has local changes."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True,
+                               text=True, check=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_stages(work_dir, transactions, seed=0, days=TRANSACTIONS_DAYS, repeat=5, queries=50,
+               stages=None, patrol_rows=PATROL_ROWS):
+    """Generate a dataset of `transactions` rows in `work_dir` and time each stage on it.
+
+    Stages run in pipeline order since each one feeds the next (database, base_2 extract,
+    loaded frame, index, cube, Patrol frame). Query stages run `queries` random selections or
+    transaction ids, the others run `repeat` times except the ones writing data, which run once.
+    Returns one record per timed stage.
+    """
+    stages = set(stages or STAGES)
+    rng = np.random.default_rng(seed)
+    data_dir = os.path.join(work_dir, "data")
+    database_url = f"sqlite:///{os.path.join(work_dir, 'fincrime.db')}"
+    base2_path = os.path.join(work_dir, "base_2.csv")
+    cache_dir = os.path.join(work_dir, ".cache")
+    records = []
+
+    def record(stage, seconds, rows, per_query=False, **extra):
+        """Median and min of the runs. A query stage reads a few rows of a frame of `rows` rows,
+        it has no throughput."""
+        median = float(np.median(seconds))
+        records.append({
+            "stage": stage,
+            "seconds": round(median, 6),
+            "min_seconds": round(float(np.min(seconds)), 6),
+            "runs": len(seconds),
+            "rows": int(rows),
+            "rows_per_s": round(rows / median, 1) if median > 0 and not per_query else None,
+            **extra,
+        })
+
+    # The setup scripts and Patrol report on stdout, the results are the records
+    with contextlib.redirect_stdout(io.StringIO()):
+        seconds, counts = timed(lambda: generate(data_dir, transactions, seed, days=days))
+        if "generate" in stages:
+            record("generate", seconds, counts["transactions"])
+
+        seconds, _ = timed(lambda: setup_database(data_dir, database_url=database_url))
+        if "db_setup" in stages:
+            record("db_setup", seconds, counts["transactions"] + counts["users"] + counts["fraudsters"])
+
+        seconds, (base2, _) = timed(lambda: build_base2(database_url))
+        write_csv(base2, base2_path)
+        if "build_base2" in stages:
+            record("build_base2", seconds, counts["transactions"])
+
+        # load_data(): first load parses the CSV and writes the prepared file, the next ones map it
+        seconds, _ = timed(lambda: read_prepared(base2_path, cache_dir))
+        if "load_data_cold" in stages:
+            record("load_data_cold", seconds, len(base2))
+        seconds, df = timed(lambda: read_prepared(base2_path, cache_dir), repeat)
+        if "load_data" in stages:
+            record("load_data", seconds, len(df))
+
+        seconds, filter_index = timed(lambda: FilterIndex(df), repeat)
+        if "filter_index" in stages:
+            record("filter_index", seconds, len(df))
+
+        selections = random_selections(df, rng, queries)
+        seconds = [timed(lambda: df.iloc[filter_index.positions(**s)])[0][0] for s in selections]
+        if "sidebar_filters" in stages:
+            record("sidebar_filters", seconds, len(df), per_query=True)
+
+        seconds, cube = timed(lambda: Cube(df), repeat)
+        if "cube" in stages:
+            record("cube", seconds, len(df))
+
+        # KPI totals and the three charts of a rerun, from the cube and from a groupby of the slice
+        def cube_charts(s):
+            cube.totals(**s)
+            cube.query(["total_amount_fraud"], by="iso_week", **s)
+            cube.query(["nb_transaction", "nb_transaction_fraud"], by="transaction_type", **s)
+            cube.query(["total_amount_fraud", "nb_transaction_fraud"], by="country", **s)
+
+        def groupby_charts(s):
+            filtered = df.iloc[filter_index.positions(**s)]
+            filtered[["nb_transaction", "nb_transaction_fraud", "total_amount_transactions"]].sum()
+            filtered.groupby("iso_week", observed=True)["total_amount_fraud"].sum()
+            filtered.groupby("transaction_type", observed=True)[["nb_transaction", "nb_transaction_fraud"]].sum()
+            filtered.groupby("country", observed=True)[["total_amount_fraud", "nb_transaction_fraud"]].sum()
+
+        if "charts" in stages:
+            record("charts", [timed(lambda: cube_charts(s))[0][0] for s in selections], len(df), per_query=True)
+        if "groupby_charts" in stages:
+            record("groupby_charts", [timed(lambda: groupby_charts(s))[0][0] for s in selections], len(df),
+                   per_query=True)
+
+        if stages & {"patrol_index", "check_transaction", "check_transactions"}:
+            rows = min(transactions, patrol_rows)
+            frame = patrol_features(pd.read_csv(os.path.join(data_dir, "transactions.csv"), nrows=rows))
+            seconds, patrol = timed(lambda: Patrol(data=frame, model=LinearScorer(), features=PATROL_FEATURES,
+                                                   transaction_column="ID"), repeat)
+            if "patrol_index" in stages:
+                record("patrol_index", seconds, len(frame))
+
+            ids = frame["ID"].to_numpy()[rng.integers(0, len(frame), queries)]
+            if "check_transaction" in stages:
+                record("check_transaction", [timed(lambda: patrol.check_transaction("ID", i))[0][0] for i in ids],
+                       len(frame), per_query=True)
+            if "check_transactions" in stages:
+                batch = frame["ID"].to_numpy()[rng.integers(0, len(frame), 1000)]
+                seconds, _ = timed(lambda: patrol.check_transactions("ID", batch), repeat)
+                record("check_transactions", seconds, len(frame), per_query=True, batch=len(batch))
+
+    return records
+
+
+def run_benchmark(scales, seed=0, days=TRANSACTIONS_DAYS, repeat=5, queries=50, stages=None,
+                  patrol_rows=PATROL_ROWS, work_dir=None, label=None):
+    """Run the stages at every scale (number of transactions). Every record carries the run
+    metadata (commit, machine, seed...) so result files of different commits can be compared."""
+    run = {
+        "run_id": datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ"),
+        "label": label,
+        "commit": git_revision(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "seed": seed,
+        "days": days,
+        "fraud_rate": FRAUD_RATE,
+    }
+
+    records = []
+    for transactions in scales:
+        with tempfile.TemporaryDirectory(dir=work_dir) as tmp:
+            for result in run_stages(tmp, transactions, seed, days, repeat, queries, stages, patrol_rows):
+                records.append({**run, "transactions": transactions, **result})
+    return records
+
+
+def write_results(records, path=BENCHMARK_FILE_PATH):
+    """Append the records to a JSON-lines file, one record per line."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as fh:
+        for record in records:
+            fh.write(json.dumps(record) + "\n")
+
+
+def compare(records, baseline_path):
+    """Median seconds of each stage against the latest baseline run at the same scale."""
+    baseline = pd.read_json(baseline_path, lines=True)
+    baseline = baseline[baseline["run_id"] == baseline["run_id"].max()]
+    current = pd.DataFrame(records)
+    merged = current.merge(baseline[["transactions", "days", "stage", "seconds", "commit"]],
+                           on=["transactions", "days", "stage"], how="left", suffixes=("", "_baseline"))
+    merged["ratio"] = (merged["seconds"] / merged["seconds_baseline"]).round(3)
+    return merged[["transactions", "stage", "seconds_baseline", "seconds", "ratio", "commit_baseline"]]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the pipeline and dashboard stages on seeded synthetic data")
+    parser.add_argument("--transactions", type=int, nargs="+", default=[100_000, 1_000_000],
+                        help="Scales to run, in number of transactions")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the data and of the random selections")
+    parser.add_argument("--days", type=int, default=TRANSACTIONS_DAYS, help="Days the transactions are spread over")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs of the stages that do not write data")
+    parser.add_argument("--queries", type=int, default=50, help="Random selections / transaction ids per query stage")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=None, help="Stages to report (default: all)")
+    parser.add_argument("--patrol-rows", type=int, default=PATROL_ROWS, help="Transactions Patrol is built on")
+    parser.add_argument("--work-dir", default=None, help="Where the temporary datasets are generated")
+    parser.add_argument("--label", default=None, help="Free text stored with the results")
+    parser.add_argument("--output", default=BENCHMARK_FILE_PATH, help="JSON-lines file the results are appended to")
+    parser.add_argument("--compare", default=None, help="Results file of a previous run to compare against")
+    args = parser.parse_args()
+
+    records = run_benchmark(args.transactions, args.seed, args.days, args.repeat, args.queries, args.stages,
+                            args.patrol_rows, args.work_dir, args.label)
+    write_results(records, args.output)
+
+    if args.compare:
+        print(compare(records, args.compare).to_string(index=False))
+    else:
+        for record in records:
+            throughput = f"{record['rows_per_s']:>16,.0f} rows/s" if record["rows_per_s"] else ""
+            print(f"{record['transactions']:>14,} {record['stage']:<20}{record['seconds']:>12.6f}s{throughput}")
+    print(f"{len(records)} results appended to {args.output} (commit {records[0]['commit'] if records else None})")
@@ -0,0 +1,129 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from data_cache import atomic_path
+from etl import (BASE_COMPACT_QUERY, BASE_QUERY, DATABASE_URL, SKETCH_FILE_PATH, aggregate_base2,
+                 build_sketches, connect, read_base, sort_base2)
+from hll import SketchSet
+
+
+BASE2_FILE_PATH = os.environ.get("DATA_FILE_PATH", "data/base_2_202508041440.csv")
+QUERY_FILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "query_eda.sql")
+
+
+def week_partitions(conn):
+    """Monday-aligned [start, end) date ranges covering all transactions."""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_created_date ON transactions (CREATED_DATE)")
+    first, last = conn.execute("SELECT MIN(CREATED_DATE), MAX(CREATED_DATE) FROM transactions").fetchone()
+    if first is None:
+        return []
+
+    start = pd.Timestamp(first).normalize()
+    start -= pd.Timedelta(days=start.weekday())
+    mondays = pd.date_range(start, pd.Timestamp(last), freq="7D")
+    return [(m.strftime("%Y-%m-%d"), (m + pd.Timedelta(days=7)).strftime("%Y-%m-%d")) for m in mondays]
+
+
+def build_partition(partition, database_url=DATABASE_URL, with_sketches=False):
+    """Aggregate one week of transactions. base_2 groups never span two weeks."""
+    start, end = partition
+
+    # Sketches hash the real user ids, plain aggregates only need the compact integer keys
+    query = BASE_QUERY if with_sketches else BASE_COMPACT_QUERY
+    conn = connect(database_url)
+    try:
+        base = read_base(conn, where="t.CREATED_DATE >= ? AND t.CREATED_DATE < ?", params=(start, end), query=query)
+    finally:
+        conn.close()
+
+    sketches = build_sketches([base]) if with_sketches and not base.empty else None
+    return aggregate_base2(base), sketches
+
+
+def build_base2(database_url=DATABASE_URL, workers=None, with_sketches=False):
+    """Rebuild base_2 from fincrime.db, one week partition per task.
+
+    Returns the base_2 frame (ordered like query_eda.sql) and, when asked, the merged
+    distinct-count sketches.
+    """
+    conn = connect(database_url)
+    try:
+        partitions = week_partitions(conn)
+    finally:
+        conn.close()
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(partitions) <= 1:
+        results = [build_partition(p, database_url, with_sketches) for p in partitions]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(partitions))) as pool:
+            results = list(pool.map(build_partition, partitions,
+                                    [database_url] * len(partitions), [with_sketches] * len(partitions)))
+
+    base2 = sort_base2(pd.concat([r[0] for r in results], ignore_index=True)) if results else aggregate_base2(pd.DataFrame())
+
+    # Weeks never share a group, the partition sketches are put side by side in one pass
+    partition_sketches = [r[1] for r in results if r[1] is not None]
+    sketches = SketchSet.concat(partition_sketches) if partition_sketches else None
+    return base2, sketches
+
+
+def write_csv(base2, csv_path=BASE2_FILE_PATH):
+    """Atomic write, so a dashboard worker never parses a half-written file."""
+    with atomic_path(csv_path) as tmp_path:
+        base2.to_csv(tmp_path, index=False)
+
+
+def benchmark(database_url=DATABASE_URL, workers=None):
+    """Time query_eda.sql on SQLite against the partitioned pandas build and compare the output."""
+    with open(QUERY_FILE_PATH) as fh:
+        query = fh.read()
+
+    conn = connect(database_url)
+    try:
+        start = time.perf_counter()
+        reference = pd.read_sql_query(query, conn)
+        sql_time = time.perf_counter() - start
+    finally:
+        conn.close()
+
+    start = time.perf_counter()
+    base2, _ = build_base2(database_url, workers)
+    pandas_time = time.perf_counter() - start
+
+    # day_date is a bare column in the query (arbitrary day of the group), so it is not compared
+    columns = [c for c in reference.columns if c != "day_date"]
+    mismatches = (reference[columns].reset_index(drop=True) != base2[columns]).any(axis=1).sum() \
+        if len(reference) == len(base2) else None
+
+    return {
+        "rows": len(base2),
+        "sqlite_seconds": round(sql_time, 3),
+        "build_base2_seconds": round(pandas_time, 3),
+        "speedup": round(sql_time / pandas_time, 2) if pandas_time else None,
+        "mismatched_rows": None if mismatches is None else int(mismatches),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the base_2 aggregate from fincrime.db")
+    parser.add_argument("--output", default=BASE2_FILE_PATH, help="base_2 CSV read by the dashboard")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--sketches", action="store_true", help=f"Also rebuild {SKETCH_FILE_PATH}")
+    parser.add_argument("--benchmark", action="store_true", help="Compare against query_eda.sql on SQLite")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        for key, value in benchmark(workers=args.workers).items():
+            print(f"{key:<22}{value}")
+    else:
+        start = time.perf_counter()
+        base2, sketches = build_base2(workers=args.workers, with_sketches=args.sketches)
+        write_csv(base2, args.output)
+        if sketches is not None:
+            sketches.save(SKETCH_FILE_PATH)
+        print(f"{len(base2)} base_2 rows written to {args.output} in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+
+
+CUBE_DIMENSIONS = ["iso_week", "country", "transaction_type"]
+CUBE_MEASURES = ["nb_users", "nb_transaction", "nb_transaction_fraud", "total_amount_fraud", "total_amount_transactions"]
+
+
+class Cube():
+    """Pre-aggregated week x country x type cube of the additive base_2 measures.
+
+    Built once from the `load_data()` output. Every slice and roll-up the dashboard needs
+    is answered by indexing the dense arrays and summing over the rolled-up axes, so the
+    cost depends on the number of distinct weeks/countries/types, not on the row count.
+    """
+
+    def __init__(self, df, dimensions=None, measures=None):
+        self.dimensions = list(dimensions or CUBE_DIMENSIONS)
+        measures = [m for m in (measures or CUBE_MEASURES) if m in df.columns]
+
+        self.labels = {}
+        codes = []
+        for dim in self.dimensions:
+            dim_codes, uniques = pd.factorize(df[dim], sort=True)
+            self.labels[dim] = np.asarray(uniques)
+            codes.append(dim_codes)
+
+        # Rows with a missing label are dropped, as groupby does by default
+        valid = np.logical_and.reduce([c >= 0 for c in codes]) if codes else np.ones(len(df), dtype=bool)
+        self.shape = tuple(len(self.labels[dim]) for dim in self.dimensions)
+        cell = np.ravel_multi_index([c[valid] for c in codes], self.shape) if valid.any() else np.empty(0, dtype=np.intp)
+        n_cells = int(np.prod(self.shape))
+
+        # Number of source rows per cell, used to tell empty cells apart from cells summing to 0
+        self.rows = np.bincount(cell, minlength=n_cells).reshape(self.shape)
+
+        self.measures = {}
+        for measure in measures:
+            values = df[measure].to_numpy()[valid]
+            cube = np.bincount(cell, weights=values.astype(np.float64), minlength=n_cells)
+            if np.issubdtype(values.dtype, np.integer):
+                cube = np.rint(cube).astype(np.int64)
+            self.measures[measure] = cube.reshape(self.shape)
+
+        self._lookup = {dim: pd.Index(self.labels[dim]) for dim in self.dimensions}
+
+    @property
+    def nbytes(self):
+        return self.rows.nbytes + sum(cube.nbytes for cube in self.measures.values())
+
+    def _index(self, selections):
+        """Per-axis index arrays for the selections, unselected dimensions keep every label."""
+        index = []
+        for dim in self.dimensions:
+            if dim in selections:
+                positions = self._lookup[dim].get_indexer(pd.Index(list(selections[dim])))
+                index.append(np.unique(positions[positions >= 0]))
+            else:
+                index.append(np.arange(len(self.labels[dim])))
+        return index
+
+    def _slice(self, array, index):
+        return array[np.ix_(*index)]
+
+    def totals(self, measures=None, **selections):
+        """Grand totals of the measures over the selected slice, e.g. `totals(country=["GB"])`."""
+        unknown = set(selections) - set(self.dimensions)
+        if unknown:
+            raise KeyError(f"Unknown cube dimensions: {sorted(unknown)}")
+
+        index = self._index(selections)
+        measures = measures or list(self.measures)
+        return {m: self._slice(self.measures[m], index).sum() for m in measures}
+
+    def query(self, measures=None, by=None, **selections):
+        """Roll the selected slice up to the `by` dimensions.
+
+        Returns a dataframe shaped like `filtered_df.groupby(by)[measures].sum().reset_index()`:
+        one row per non-empty cell, sorted by the `by` labels.
+        """
+        by = [by] if isinstance(by, str) else list(by or [])
+        unknown = (set(selections) | set(by)) - set(self.dimensions)
+        if unknown:
+            raise KeyError(f"Unknown cube dimensions: {sorted(unknown)}")
+
+        index = self._index(selections)
+        measures = measures or list(self.measures)
+        rolled_up = tuple(i for i, dim in enumerate(self.dimensions) if dim not in by)
+        kept = [i for i, dim in enumerate(self.dimensions) if dim in by]
+
+        # Axes are reordered to follow `by`, then flattened to one row per cell
+        order = [self.dimensions.index(dim) for dim in by]
+        perm = [kept.index(axis) for axis in order]
+
+        rows = self._slice(self.rows, index).sum(axis=rolled_up).transpose(perm).ravel()
+        non_empty = rows > 0
+
+        result = {}
+        if by:
+            grid = np.meshgrid(*[index[axis] for axis in order], indexing="ij")
+            for dim, positions in zip(by, grid):
+                result[dim] = self.labels[dim][positions.ravel()[non_empty]]
+
+        for m in measures:
+            values = self._slice(self.measures[m], index).sum(axis=rolled_up).transpose(perm).ravel()
+            result[m] = values[non_empty]
+
+        return pd.DataFrame(result)
@@ -4,6 +4,31 @@ import plotly.graph_objects as go
 import plotly.express as px
 from datetime import datetime, timedelta
 import plotly.colors as pc
+import os
+from data_cache import read_prepared, data_version
+from schema import format_bytes
+from filter_index import FilterIndex
+from cube import Cube
+from hll import SketchSet
+from downsample import aggregate, bucket_end, choose_grain, lttb
+from functools import partial
+from export import EXPORT_MAX_ROWS, FORMATS, available_formats, export_file, frame_chunks, pdf_report, raw_export_available, raw_transaction_chunks
+from metrics import RunMetrics, cache_stats, counted_cache, span, timed_fragment
+from etl import DATABASE_URL
+from sql_backend import ConnectionPool, SqlCube, database_version
+from drilldown import DRILLDOWN_PAGE_SIZE, transaction_page
+from alerts import ALERT_FILE_PATH, read_alerts
+
+DATA_FILE_PATH = os.environ.get("DATA_FILE_PATH", "data/base_2_202508041440.csv")
+SKETCH_FILE_PATH = os.environ.get("SKETCH_FILE_PATH", "data/base_2_sketches.npz")
+USER_RISK_FILE_PATH = os.environ.get("USER_RISK_FILE_PATH", "data/user_risk.csv")
+# "memory": base_2 CSV loaded in the process, "sqlite": aggregate SQL on the base_2 table of
+# fincrime.db (weekly structure only, the table is kept up to date by incremental_etl.py)
+DATA_BACKEND = os.environ.get("DATA_BACKEND", "memory")
+# Maximum number of points sent for a time-series chart
+CHART_POINT_BUDGET = int(os.environ.get("CHART_POINT_BUDGET", "200"))
+# Performance panel in the sidebar, also shown with ?debug=1 in the URL
+DASHBOARD_DEBUG = os.environ.get("DASHBOARD_DEBUG", "") not in ("", "0")
 
 # Page configuration
 st.set_page_config(
@@ -13,6 +38,9 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+# Timing spans, cache hits/misses and memory of this run, written to the metrics sink at the end
+metrics = RunMetrics()
+
 # Custom CSS for modern design
 st.markdown("""
 <style>
@@ -471,41 +499,122 @@ COLORS = {
     'accent': '#698EB8'        # Soft Blue for accents
 }
 
-# Data loading function
-@st.cache_data
-def load_data():
+# Data loading function: one shared, read-only frame per process instead of a pickled copy per
+# session, memory-mapped from a file every worker process opens, reloaded when the CSV changes
+@counted_cache(st.cache_resource)
+def load_data(path, mtime_ns):
     """Load and prepare data"""
-    try:
-        # Try to load the new weekly data file first
-        df = pd.read_csv("data/base_2_202508041440.csv")
-        
-        # Check if the file has the new weekly structure
-        if 'iso_week' in df.columns:
-            # New weekly structure
-            df["day_date"] = pd.to_datetime(df["day_date"])
-            df["week_date"] = pd.to_datetime(df["week_date"])
-            return df
-        else:
-            # Fallback to old structure
-            df["day_date"] = pd.to_datetime(df["day_date"])
-            return df
-    except Exception as e:
-        st.error(f"Error loading data: {e}")
-        return None
+    # Typed dates (day_date, and week_date for the weekly structure) and compact schema
+    # (categorical dimensions, downcast counters/amounts), prepared once and memory-mapped.
+    # Errors are raised, not returned, so a failed load is never cached and the next run retries
+    return read_prepared(path)
+
+# Bitmap index over week/country/type, built once per data version and shared across sessions
+@counted_cache(st.cache_resource)
+def load_filter_index(_df, version):
+    """Build the sidebar filter index"""
+    return FilterIndex(_df)
+
+# Pre-aggregated cube answering the KPI and chart roll-ups, built once per data version
+@counted_cache(st.cache_resource)
+def load_cube(_df, version, dimensions):
+    """Build the week (or day) x country x type cube"""
+    return Cube(_df, dimensions=list(dimensions))
+
+# Read-only connections to fincrime.db shared by every session (SQL backend and drill-down),
+# reopened when the database file changes (e.g. rebuilt by db_setup.py), the old pool is closed
+@counted_cache(st.cache_resource(max_entries=1, on_release=ConnectionPool.close))
+def load_connection_pool(database_url, version):
+    """Open the read-only connection pool"""
+    return ConnectionPool(database_url)
+
+# SQL cube on base_2, its labels are re-read when the ETL writes to the database
+@counted_cache(st.cache_resource(max_entries=1))
+def load_sql_cube(database_url, version):
+    """Open the base_2 SQL cube"""
+    return SqlCube(load_connection_pool(database_url, version))
+
+# Distinct users/fraudsters sketches emitted by etl.py, reloaded when the file changes
+@counted_cache(st.cache_resource)
+def load_sketches(path, mtime_ns):
+    """Load the per-group HyperLogLog sketches"""
+    return SketchSet.load(path)
+
+# Per-user fraud-ring risk emitted by fraud_rings.py, reloaded when the file changes
+@counted_cache(st.cache_data)
+def load_user_risk(path, mtime_ns):
+    """Load the per-user ring risk"""
+    return pd.read_csv(path, dtype={"country": "category"})
+
+# Fraud alerts appended by alerts.py (run by incremental_etl.py), reloaded when the file changes
+@counted_cache(st.cache_data)
+def load_alerts(path, mtime_ns):
+    """Load the fraud alerts"""
+    return read_alerts(path)
 
 # Load data
-with st.spinner("Loading data..."):
-    df = load_data()
+if DATA_BACKEND == "sqlite":
+    # No frame in the process: the sidebar labels, KPIs and charts are aggregate queries
+    df = filter_index = None
+    time_dimension = "iso_week"
+    with st.spinner("Connecting to the database..."), metrics.span("data_load"):
+        try:
+            version = database_version(DATABASE_URL)
+            cube = load_sql_cube(DATABASE_URL, version)
+        except Exception as e:
+            st.error(f"Error opening {DATABASE_URL}: {e}")
+            st.stop()
+else:
+    with st.spinner("Loading data..."), metrics.span("data_load"):
+        try:
+            df = load_data(DATA_FILE_PATH, os.stat(DATA_FILE_PATH).st_mtime_ns if os.path.exists(DATA_FILE_PATH) else None)
+        except Exception as e:
+            st.error(f"Error loading data: {e}")
+            df = None
 
-if df is None:
-    st.error("Unable to load data. Please check if the data file exists and has the correct format.")
-    st.info("Expected columns: iso_week, day_date, week_date, country, transaction_type, state, nb_users, nb_fraudsters, nb_transaction, nb_transaction_fraud, total_amount_fraud, total_amount_transactions")
-    st.stop()
+    if df is None:
+        st.error("Unable to load data. Please check if the data file exists and has the correct format.")
+        st.info("Expected columns: iso_week, day_date, week_date, country, transaction_type, state, nb_users, nb_fraudsters, nb_transaction, nb_transaction_fraud, total_amount_fraud, total_amount_transactions")
+        st.stop()
+
+    with metrics.span("data_load"):
+        version = data_version(df)
+        filter_index = load_filter_index(df, version)
+        time_dimension = "iso_week" if 'iso_week' in df.columns else "day_date"
+        cube = load_cube(df, version, (time_dimension, "country", "transaction_type"))
+
+with metrics.span("data_load"):
+    # Sketches are keyed by week, so they only apply to the weekly structure
+    sketches = None
+    if time_dimension == "iso_week" and os.path.exists(SKETCH_FILE_PATH):
+        sketches = load_sketches(SKETCH_FILE_PATH, os.stat(SKETCH_FILE_PATH).st_mtime_ns)
+
+    user_risk = None
+    if os.path.exists(USER_RISK_FILE_PATH):
+        user_risk = load_user_risk(USER_RISK_FILE_PATH, os.stat(USER_RISK_FILE_PATH).st_mtime_ns)
+
+    alerts = None
+    if os.path.exists(ALERT_FILE_PATH):
+        alerts = load_alerts(ALERT_FILE_PATH, os.stat(ALERT_FILE_PATH).st_mtime_ns)
+
+metrics.gauge("cube_bytes", cube.nbytes)
+if df is not None:
+    metrics.gauge("frame_bytes", df.attrs.get("schema_report", {}).get("bytes_after"))
+    metrics.gauge("filter_index_bytes", filter_index.nbytes)
 
 # Display data info for debugging
 st.sidebar.markdown("### Data Info")
-st.sidebar.info(f"Rows: {len(df)} | Columns: {len(df.columns)}")
-if 'iso_week' in df.columns:
+if df is None:
+    st.sidebar.info(f"Rows: {cube.n_rows} | Source: {cube.pool.path} ({cube.table})")
+else:
+    st.sidebar.info(f"Rows: {len(df)} | Columns: {len(df.columns)}")
+if df is not None and "schema_report" in df.attrs:
+    schema_report = df.attrs["schema_report"]
+    st.sidebar.caption(
+        f"Memory: {format_bytes(schema_report['bytes_after'])} "
+        f"(saved {format_bytes(schema_report['bytes_saved'])})"
+    )
+if time_dimension == "iso_week":
     st.sidebar.success("✅ Weekly data structure detected")
 else:
     st.sidebar.warning("⚠️ Daily data structure detected")
@@ -515,11 +624,11 @@ with st.sidebar:
     st.markdown("### Filters")
     
     # Collapsible filter sections
-    if 'iso_week' in df.columns:
+    if time_dimension == "iso_week":
         # Weekly data structure
         with st.expander("Week Selection", expanded=True):
             # Get unique weeks sorted
-            unique_weeks = sorted(df["iso_week"].unique(), reverse=True)
+            unique_weeks = sorted(cube.labels["iso_week"].tolist(), reverse=True)
             
             # All/None buttons for weeks
             col1, col2 = st.columns(2)
@@ -568,7 +677,7 @@ with st.sidebar:
                 start_date = end_date = date_range
     
     with st.expander("Countries", expanded=True):
-        countries = sorted(df["country"].unique())
+        countries = sorted(cube.labels["country"].tolist())
         
         # All/None buttons for countries
         col1, col2 = st.columns(2)
@@ -597,7 +706,7 @@ with st.sidebar:
         st.session_state.selected_countries = selected_countries
     
     with st.expander("Transaction Types", expanded=True):
-        transaction_types = sorted(df["transaction_type"].unique())
+        transaction_types = sorted(cube.labels["transaction_type"].tolist())
         
         # All/None buttons for transaction types
         col1, col2 = st.columns(2)
@@ -626,33 +735,109 @@ with st.sidebar:
         st.session_state.selected_types = selected_types
     
     # Transaction States section removed as 'state' column is not available in the dataset
-    
-    # Export section
-    st.markdown("### Export")
-    col1, col2 = st.columns(2)
-    with col1:
-        if st.button("Export PDF", help="Export dashboard as PDF"):
-            st.info("PDF export feature coming soon!")
-    with col2:
-        if st.button("Export CSV", help="Export data as CSV"):
-            st.info("CSV export feature coming soon!")
 
 # Filter data based on selections
-if 'iso_week' in df.columns:
+metrics.begin("filters")
+if time_dimension == "iso_week":
     # Weekly data structure
-    filtered_df = df[
-        (df["iso_week"].isin(selected_weeks)) &
-        (df["country"].isin(selected_countries)) &
-        (df["transaction_type"].isin(selected_types))
-    ]
+    cube_selection = dict(iso_week=selected_weeks, country=selected_countries, transaction_type=selected_types)
+    # Without a frame (SQL backend) the rows are only read from base_2 when exported
+    filtered_df = df.iloc[filter_index.positions(**cube_selection)] if df is not None else None
 else:
     # Daily data structure - fallback
     filtered_df = df[
         (df["day_date"] >= pd.to_datetime(start_date)) &
         (df["day_date"] <= pd.to_datetime(end_date)) &
-        (df["country"].isin(selected_countries)) &
-        (df["transaction_type"].isin(selected_types))
+        filter_index.mask(country=selected_countries, transaction_type=selected_types)
     ]
+    cube_days = pd.to_datetime(cube.labels["day_date"])
+    cube_selection = dict(
+        day_date=cube_days[(cube_days >= pd.to_datetime(start_date)) & (cube_days <= pd.to_datetime(end_date))],
+        country=selected_countries,
+        transaction_type=selected_types
+    )
+metrics.end("filters")
+
+# Downloads are only built when clicked, on a separate thread, and spooled to a temporary
+# file chunk by chunk so a large export does not block the page. Streamlit then serves the
+# file from memory, so its size is capped (EXPORT_MAX_ROWS / EXPORT_MAX_BYTES)
+def export_data(selection, filtered, scope, fmt):
+    """Filtered base_2 rows, or the raw transactions behind them, as a CSV or Parquet file"""
+    if scope == "Raw transactions":
+        chunks = raw_transaction_chunks(selection)
+    else:
+        chunks = frame_chunks(filtered) if filtered is not None else cube.row_chunks(**selection)
+    return export_file(chunks, fmt)
+
+def export_pdf(selection, period):
+    """One-page report rendered from the cube aggregates, no query is re-run"""
+    totals = cube.totals(**selection)
+    transactions = totals["nb_transaction"]
+    evolution = cube.query(["total_amount_fraud"], by=time_dimension, **selection)
+    if len(evolution) > CHART_POINT_BUDGET:
+        evolution = evolution.iloc[lttb(evolution["total_amount_fraud"], CHART_POINT_BUDGET)]
+    by_country = cube.query(["total_amount_fraud"], by="country", **selection)
+
+    return pdf_report(
+        "Revolut Financial Crime Dashboard",
+        f"{period} | Generated {datetime.now().strftime('%Y-%m-%d %H:%M')}",
+        {
+            "Transactions": f"{transactions:,.0f}",
+            "Total Volume": f"£{totals['total_amount_transactions']:,.0f}",
+            "Fraud Amount": f"£{totals['total_amount_fraud']:,.0f}",
+            "Fraud Rate": f"{(totals['nb_transaction_fraud'] / transactions * 100) if transactions > 0 else 0:.2f}%",
+        },
+        {
+            "Fraud Amount Evolution (£)": (evolution, time_dimension, "total_amount_fraud", "line"),
+            "Transaction Types Overview": (cube.query(["nb_transaction"], by="transaction_type", **selection),
+                                           "transaction_type", "nb_transaction", "bar"),
+            "Fraudulent Transaction Types": (cube.query(["nb_transaction_fraud"], by="transaction_type", **selection),
+                                             "transaction_type", "nb_transaction_fraud", "bar"),
+            "Top 5 Fraud Amount by Country (£)": (by_country.sort_values("total_amount_fraud").tail(5),
+                                                   "country", "total_amount_fraud", "barh"),
+        }
+    )
+
+if time_dimension == "iso_week":
+    export_period = f"Weeks {min(selected_weeks)} to {max(selected_weeks)}" if selected_weeks else "No week selected"
+else:
+    export_period = f"{start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}"
+
+with st.sidebar:
+    # Export section
+    st.markdown("### Export")
+    export_scope = st.radio(
+        "Rows",
+        ["Filtered aggregates", "Raw transactions"] if raw_export_available() else ["Filtered aggregates"],
+        horizontal=True,
+        key="export_scope",
+        help="Raw transactions are read from fincrime.db"
+    )
+    export_format = st.radio("Format", available_formats(), horizontal=True, key="export_format")
+    export_rows = cube.totals(["nb_transaction"], **cube_selection)["nb_transaction"] if export_scope == "Raw transactions" else 0
+    export_too_large = export_rows > EXPORT_MAX_ROWS
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            "Export PDF",
+            data=partial(export_pdf, cube_selection, export_period),
+            file_name="fincrime_dashboard.pdf",
+            mime="application/pdf",
+            on_click="ignore",
+            help="Export dashboard as PDF"
+        )
+    with col2:
+        st.download_button(
+            f"Export {export_format}",
+            data=partial(export_data, cube_selection, filtered_df, export_scope, export_format),
+            file_name=f"fincrime_{'transactions' if export_scope == 'Raw transactions' else 'base_2'}.{FORMATS[export_format]['extension']}",
+            mime=FORMATS[export_format]["mime"],
+            on_click="ignore",
+            disabled=export_too_large,
+            help=(f"{export_rows:,.0f} transactions selected, exports are limited to {EXPORT_MAX_ROWS:,}: narrow the selection"
+                  if export_too_large else f"Export data as {export_format}")
+        )
 
 # Header
 st.markdown(f"""
@@ -666,7 +851,7 @@ st.markdown(f"""
 """, unsafe_allow_html=True)
 
 # Status banner
-if 'iso_week' in df.columns:
+if time_dimension == "iso_week":
     week_range = f"{min(selected_weeks)} to {max(selected_weeks)}" if len(selected_weeks) > 1 else selected_weeks[0]
     st.markdown(f"""
     <div class="status-banner">
@@ -685,49 +870,55 @@ else:
 # KPI Section
 st.markdown('<div class="section-title">Key Performance Indicators</div>', unsafe_allow_html=True)
 
-# Calculate KPIs
-total_users = filtered_df["nb_users"].sum()
-total_transactions = filtered_df["nb_transaction"].sum()
-total_amount_transaction = filtered_df["total_amount_transactions"].sum()
-fraud_rate = (filtered_df["nb_transaction_fraud"].sum() / total_transactions * 100) if total_transactions > 0 else 0
+# Calculate KPIs (additive measures come straight from the cube)
+metrics.begin("kpis")
+totals = cube.totals(**cube_selection)
+if sketches is not None:
+    # Distinct users over the whole slice, merged from the group sketches
+    total_users = sketches.distinct("users", **cube_selection)
+    total_fraudsters = sketches.distinct("fraudsters", **cube_selection)
+else:
+    # Without sketches, nb_users is summed and over-counts users active in several groups
+    total_users = totals["nb_users"]
+    total_fraudsters = None
+total_transactions = totals["nb_transaction"]
+total_amount_transaction = totals["total_amount_transactions"]
+fraud_rate = (totals["nb_transaction_fraud"] / total_transactions * 100) if total_transactions > 0 else 0
 
 # Previous period for trend calculation
-if 'iso_week' in df.columns:
+if time_dimension == "iso_week":
     # Weekly data structure
     sorted_weeks = sorted(selected_weeks)
     current_week = sorted_weeks[-1] if sorted_weeks else selected_weeks[0]
 
     # Find the previous week
-    all_weeks = sorted(df["iso_week"].unique())
+    all_weeks = sorted(cube.labels["iso_week"].tolist())
     current_week_index = all_weeks.index(current_week) if current_week in all_weeks else -1
     prev_week = all_weeks[current_week_index + 1] if current_week_index + 1 < len(all_weeks) else current_week
 
-    prev_df = df[
-        (df["iso_week"] == prev_week) &
-        (df["country"].isin(selected_countries)) &
-        (df["transaction_type"].isin(selected_types))
-    ]
+    prev_selection = dict(iso_week=[prev_week], country=selected_countries, transaction_type=selected_types)
 else:
     # Daily data structure - fallback
     prev_start = start_date - timedelta(days=(end_date - start_date).days)
     prev_end = start_date
-    prev_df = df[
-        (df["day_date"] >= pd.to_datetime(prev_start)) &
-        (df["day_date"] <= pd.to_datetime(prev_end)) &
-        (df["country"].isin(selected_countries)) &
-        (df["transaction_type"].isin(selected_types))
-    ]
+    prev_selection = dict(
+        day_date=cube_days[(cube_days >= pd.to_datetime(prev_start)) & (cube_days <= pd.to_datetime(prev_end))],
+        country=selected_countries,
+        transaction_type=selected_types
+    )
 
-prev_users = prev_df["nb_users"].sum()
-prev_transactions = prev_df["nb_transaction"].sum()
-prev_amount = prev_df["total_amount_transactions"].sum()
-prev_fraud_rate = (prev_df["nb_transaction_fraud"].sum() / prev_transactions * 100) if prev_transactions > 0 else 0
+prev_totals = cube.totals(**prev_selection)
+prev_users = sketches.distinct("users", **prev_selection) if sketches is not None else prev_totals["nb_users"]
+prev_transactions = prev_totals["nb_transaction"]
+prev_amount = prev_totals["total_amount_transactions"]
+prev_fraud_rate = (prev_totals["nb_transaction_fraud"] / prev_transactions * 100) if prev_transactions > 0 else 0
 
 # Calculate trends
 user_trend = ((total_users - prev_users) / prev_users * 100) if prev_users > 0 else 0
 transaction_trend = ((total_transactions - prev_transactions) / prev_transactions * 100) if prev_transactions > 0 else 0
 amount_trend = ((total_amount_transaction - prev_amount) / prev_amount * 100) if prev_amount > 0 else 0
 fraud_trend = fraud_rate - prev_fraud_rate
+metrics.end("kpis")
 
 # KPI Cards
 col1, col2, col3, col4 = st.columns(4)
@@ -737,6 +928,7 @@ with col1:
     <div class="kpi-card">
         <div class="kpi-title">Active Users</div>
         <div class="kpi-value">{total_users:,.0f}</div>
+        {f'<div class="kpi-trend">{total_fraudsters:,.0f} fraudsters (±{sketches.error:.1%})</div>' if total_fraudsters is not None else ''}
     </div>
     """, unsafe_allow_html=True)
 
@@ -769,25 +961,47 @@ with col4:
 # Charts Section
 st.markdown('<div class="section-title">Analytics Dashboard</div>', unsafe_allow_html=True)
 
-# First row - Weekly Fraud Amount Evolution (full width)
-st.markdown('<div class="chart-container">', unsafe_allow_html=True)
-st.markdown('<div class="chart-title">Weekly Fraud Amount Evolution</div>', unsafe_allow_html=True)
+# Chart figures are memoized on their own inputs (cube version and slice) and shared across
+# sessions, so a rerun only rebuilds the figures whose slice actually changed, and identical
+# figures are sent to the browser as a reference to the copy it already has
+def selection_key(selection):
+    """Hashable form of a cube selection (the daily structure selects a DatetimeIndex)"""
+    return tuple((dim, tuple(str(value) for value in values)) for dim, values in selection.items())
 
-# Fraud amount evolution
-if 'iso_week' in filtered_df.columns:
-    # Weekly data structure
-    fraud_evolution = filtered_df.groupby("iso_week")["total_amount_fraud"].sum().reset_index()
-    x_col = "iso_week"
-    x_title = "Week (ISO)"
-    hover_template = '<b>Week:</b> %{x}<br><b>Fraud Amount:</b> £%{y:,.2f}<extra></extra>'
-else:
-    # Daily data structure
-    fraud_evolution = filtered_df.groupby("day_date")["total_amount_fraud"].sum().reset_index()
-    x_col = "day_date"
-    x_title = "Date"
-    hover_template = '<b>Date:</b> %{x}<br><b>Fraud Amount:</b> £%{y:,.2f}<extra></extra>'
+@counted_cache(st.cache_data(max_entries=256, show_spinner=False))
+def fraud_evolution_figure(_cube, version, time_dimension, key, _selection, max_points):
+    """Fraud amount per week (or day) of the selected slice, with at most max_points points.
+    Returns the figure and the grain of the daily structure (None for the weekly one)"""
+    grain = None
+    if time_dimension == "iso_week":
+        # Weekly data structure
+        with span("fraud_evolution_figure.query"):
+            fraud_evolution = _cube.query(["total_amount_fraud"], by="iso_week", **_selection)
+        x_col = "iso_week"
+        x_title = "Week (ISO)"
+        hover_template = '<b>Week:</b> %{x}<br><b>Fraud Amount:</b> £%{y:,.2f}<extra></extra>'
+    else:
+        # Daily data structure
+        with span("fraud_evolution_figure.query"):
+            fraud_evolution = _cube.query(["total_amount_fraud"], by="day_date", **_selection)
+        x_col = "day_date"
+
+        # Long ranges are summed per week, month, ... so the totals stay exact within the budget
+        grain = "day"
+        if not fraud_evolution.empty:
+            days = pd.to_datetime(fraud_evolution["day_date"])
+            grain = choose_grain(days.min(), days.max(), max_points)
+            fraud_evolution = aggregate(fraud_evolution, "day_date", ["total_amount_fraud"], grain)
+        x_title = "Date" if grain == "day" else f"{grain.capitalize()} starting"
+        hover_template = f'<b>{x_title}:</b> %{{x}}<br><b>Fraud Amount:</b> £%{{y:,.2f}}<extra></extra>'
+
+    if fraud_evolution.empty or fraud_evolution["total_amount_fraud"].sum() <= 0:
+        return None, grain
+
+    # Any series still above the budget (e.g. many weeks) keeps its shape through LTTB
+    if len(fraud_evolution) > max_points:
+        fraud_evolution = fraud_evolution.iloc[lttb(fraud_evolution["total_amount_fraud"], max_points)]
 
-if not fraud_evolution.empty and fraud_evolution["total_amount_fraud"].sum() > 0:
     fig = go.Figure()
     fig.add_trace(go.Scatter(
         x=fraud_evolution[x_col],
@@ -810,157 +1024,321 @@ if not fraud_evolution.empty and fraud_evolution["total_amount_fraud"].sum() > 0
         margin=dict(l=50, r=50, t=50, b=50),
         font=dict(size=12)
     )
+    return fig, grain
+
+@counted_cache(st.cache_data(max_entries=256, show_spinner=False))
+def type_figure(_cube, version, measure, key, _selection, fraud_only):
+    """Transactions (or fraudulent transactions only) by type of the selected slice"""
+    with span("type_figure.query"):
+        by_type = _cube.query([measure], by="transaction_type", **_selection)
+    if fraud_only:
+        by_type = by_type[by_type[measure] > 0]
+
+    if by_type.empty:
+        return None
+
+    fig = go.Figure()
+    fig.add_trace(go.Bar(
+        x=by_type["transaction_type"],
+        y=by_type[measure],
+        marker_color=COLORS['danger'] if fraud_only else COLORS['secondary'],
+        hovertemplate=('<b>Type:</b> %{x}<br><b>Fraudulent Transactions:</b> %{y:,.0f}<extra></extra>' if fraud_only
+                       else '<b>Type:</b> %{x}<br><b>Transactions:</b> %{y:,.0f}<extra></extra>')
+    ))
     
-    st.plotly_chart(fig, use_container_width=True)
-else:
-    st.info("No fraud data available for the selected period")
+    fig.update_layout(
+        xaxis_title="Transaction Type",
+        yaxis_title="Number of Fraudulent Transactions" if fraud_only else "Number of Transactions",
+        template="plotly_white",
+        height=350,
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        margin=dict(l=50, r=50, t=50, b=50),
+        font=dict(size=12)
+    )
+    return fig
 
-st.markdown('</div>', unsafe_allow_html=True)
+@counted_cache(st.cache_data(max_entries=256, show_spinner=False))
+def country_figure(_cube, version, measure, key, _selection):
+    """Top 5 countries by fraud amount (or fraud volume) of the selected slice"""
+    with span("country_figure.query"):
+        by_country = _cube.query([measure], by="country", **_selection)
+    by_country = by_country[by_country[measure] > 0].sort_values(measure, ascending=True).head(5)
 
-# Second row - Transaction Types (2 columns)
-col1, col2 = st.columns(2)
+    if by_country.empty:
+        return None
 
-with col1:
-    st.markdown('<div class="chart-container">', unsafe_allow_html=True)
-    st.markdown('<div class="chart-title">Transaction Types Overview</div>', unsafe_allow_html=True)
-    
-    # All transaction types (fraudulent and non-fraudulent)
-    transaction_by_type = filtered_df.groupby("transaction_type")["nb_transaction"].sum().reset_index()
-    
-    if not transaction_by_type.empty:
-        fig = go.Figure()
-        fig.add_trace(go.Bar(
-            x=transaction_by_type["transaction_type"],
-            y=transaction_by_type["nb_transaction"],
-            marker_color=COLORS['secondary'],
-            hovertemplate='<b>Type:</b> %{x}<br><b>Transactions:</b> %{y:,.0f}<extra></extra>'
-        ))
-        
-        fig.update_layout(
-            xaxis_title="Transaction Type",
-            yaxis_title="Number of Transactions",
-            template="plotly_white",
-            height=350,
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            margin=dict(l=50, r=50, t=50, b=50),
-            font=dict(size=12)
-        )
-        
-        st.plotly_chart(fig, use_container_width=True)
-    else:
-        st.info("No transaction data available")
+    amount = measure == "total_amount_fraud"
+    fig = go.Figure()
+    fig.add_trace(go.Bar(
+        x=by_country[measure],
+        y=by_country["country"],
+        orientation='h',
+        marker_color=COLORS['danger'] if amount else COLORS['primary'],
+        hovertemplate=('<b>Country:</b> %{y}<br><b>Fraud Amount:</b> £%{x:,.2f}<extra></extra>' if amount
+                       else '<b>Country:</b> %{y}<br><b>Fraud Volume:</b> %{x:,.0f} transactions<extra></extra>')
+    ))
     
-    st.markdown('</div>', unsafe_allow_html=True)
+    fig.update_layout(
+        xaxis_title="Fraud Amount (£)" if amount else "Number of Fraudulent Transactions",
+        yaxis_title="Country",
+        template="plotly_white",
+        height=350,
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        margin=dict(l=50, r=50, t=50, b=50),
+        font=dict(size=12)
+    )
+    return fig
 
-with col2:
+def chart(title, fig, empty_message, **chart_args):
+    """Chart container with its title, or an info box when there is nothing to plot"""
+    event = None
     st.markdown('<div class="chart-container">', unsafe_allow_html=True)
-    st.markdown('<div class="chart-title">Fraudulent Transaction Types</div>', unsafe_allow_html=True)
-    
-    # Only fraudulent transactions by type
-    fraud_by_type = filtered_df.groupby("transaction_type")["nb_transaction_fraud"].sum().reset_index()
-    fraud_by_type = fraud_by_type[fraud_by_type["nb_transaction_fraud"] > 0]
-    
-    if not fraud_by_type.empty:
-        fig = go.Figure()
-        fig.add_trace(go.Bar(
-            x=fraud_by_type["transaction_type"],
-            y=fraud_by_type["nb_transaction_fraud"],
-            marker_color=COLORS['danger'],
-            hovertemplate='<b>Type:</b> %{x}<br><b>Fraudulent Transactions:</b> %{y:,.0f}<extra></extra>'
-        ))
-        
-        fig.update_layout(
-            xaxis_title="Transaction Type",
-            yaxis_title="Number of Fraudulent Transactions",
-            template="plotly_white",
-            height=350,
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            margin=dict(l=50, r=50, t=50, b=50),
-            font=dict(size=12)
-        )
-        
-        st.plotly_chart(fig, use_container_width=True)
+    st.markdown(f'<div class="chart-title">{title}</div>', unsafe_allow_html=True)
+    if fig is not None:
+        event = st.plotly_chart(fig, use_container_width=True, **chart_args)
     else:
-        st.info("No fraudulent transaction data available")
-    
+        st.info(empty_message)
     st.markdown('</div>', unsafe_allow_html=True)
+    return event
 
-# Second row of charts
-col1, col2 = st.columns(2)
+def clicked(event, axis):
+    """Label of the bar selected in a chart ("x" or "y" axis), None when nothing is selected"""
+    points = event.selection.points if event is not None else []
+    return points[0][axis] if points else None
+
+def drilldown(dimension, value, selection, fraud_only):
+    """Transactions behind a clicked bar, read from fincrime.db one keyset page at a time"""
+    title = f"{'Fraudulent transactions' if fraud_only else 'Transactions'}: {value}"
+    if not raw_export_available():
+        st.info("The transactions behind a bar are read from fincrime.db, run db_setup.py to create it")
+        return
+
+    # Key of the first row of each page seen so far, reset when another bar or slice is clicked
+    drill = dict(selection, **{dimension: [value]})
+    state_key = f"drilldown_{dimension}"
+    if st.session_state.get(state_key, {}).get("slice") != (selection_key(drill), fraud_only):
+        st.session_state[state_key] = {"slice": (selection_key(drill), fraud_only), "keys": [None]}
+    keys = st.session_state[state_key]["keys"]
+
+    with span("drilldown.query"):
+        pool = load_connection_pool(DATABASE_URL, database_version(DATABASE_URL))
+        page, next_key = transaction_page(pool, drill, keys[-1], DRILLDOWN_PAGE_SIZE, fraud_only)
+    total = cube.totals(["nb_transaction_fraud" if fraud_only else "nb_transaction"], **drill)
+    total = int(next(iter(total.values())))
 
-with col1:
     st.markdown('<div class="chart-container">', unsafe_allow_html=True)
-    st.markdown('<div class="chart-title">Top 5 Fraud Amount by Country</div>', unsafe_allow_html=True)
-    
-    # Top 5 fraud amount by country
-    fraud_by_country = filtered_df.groupby("country")["total_amount_fraud"].sum().reset_index()
-    fraud_by_country = fraud_by_country[fraud_by_country["total_amount_fraud"] > 0].sort_values("total_amount_fraud", ascending=True).head(5)
-    
-    if not fraud_by_country.empty:
-        fig = go.Figure()
-        fig.add_trace(go.Bar(
-            x=fraud_by_country["total_amount_fraud"],
-            y=fraud_by_country["country"],
-            orientation='h',
-            marker_color=COLORS['danger'],
-            hovertemplate='<b>Country:</b> %{y}<br><b>Fraud Amount:</b> £%{x:,.2f}<extra></extra>'
-        ))
-        
-        fig.update_layout(
-            xaxis_title="Fraud Amount (£)",
-            yaxis_title="Country",
-            template="plotly_white",
-            height=350,
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            margin=dict(l=50, r=50, t=50, b=50),
-            font=dict(size=12)
-        )
-        
-        st.plotly_chart(fig, use_container_width=True)
-    else:
-        st.info("No fraud data by country available")
-    
+    st.markdown(f'<div class="chart-title">{title}</div>', unsafe_allow_html=True)
+    st.dataframe(page, hide_index=True, use_container_width=True)
+    col1, col2, col3 = st.columns([1, 1, 4])
+    with col1:
+        st.button("Previous", key=f"{state_key}_previous", disabled=len(keys) == 1, on_click=keys.pop)
+    with col2:
+        st.button("Next", key=f"{state_key}_next", disabled=next_key is None, on_click=keys.append, args=(next_key,))
+    with col3:
+        st.caption(f"Page {len(keys):,} of {max(1, -(-total // DRILLDOWN_PAGE_SIZE)):,} | {total:,} transactions")
     st.markdown('</div>', unsafe_allow_html=True)
 
-with col2:
-    st.markdown('<div class="chart-container">', unsafe_allow_html=True)
-    st.markdown('<div class="chart-title">Top 5 Fraud by Country (Volume)</div>', unsafe_allow_html=True)
-    
-    # Top 5 fraud volume by country
-    fraud_volume_by_country = filtered_df.groupby("country")["nb_transaction_fraud"].sum().reset_index()
-    fraud_volume_by_country = fraud_volume_by_country[fraud_volume_by_country["nb_transaction_fraud"] > 0].sort_values("nb_transaction_fraud", ascending=True).head(5)
-    
-    if not fraud_volume_by_country.empty:
-        fig = go.Figure()
-        fig.add_trace(go.Bar(
-            x=fraud_volume_by_country["nb_transaction_fraud"],
-            y=fraud_volume_by_country["country"],
-            orientation='h',
-            marker_color=COLORS['primary'],
-            hovertemplate='<b>Country:</b> %{y}<br><b>Fraud Volume:</b> %{x:,.0f} transactions<extra></extra>'
-        ))
-        
-        fig.update_layout(
-            xaxis_title="Number of Fraudulent Transactions",
-            yaxis_title="Country",
-            template="plotly_white",
-            height=350,
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)',
-            margin=dict(l=50, r=50, t=50, b=50),
-            font=dict(size=12)
-        )
-        
-        st.plotly_chart(fig, use_container_width=True)
+# Each section is a fragment: a widget inside a section only reruns that section
+@st.fragment
+@timed_fragment
+def fraud_evolution_section(selection):
+    # First row - Weekly Fraud Amount Evolution (full width)
+    fig, grain = fraud_evolution_figure(cube, version, time_dimension, selection_key(selection), selection, CHART_POINT_BUDGET)
+    if grain in (None, "day") or fig is None:
+        chart("Weekly Fraud Amount Evolution", fig, "No fraud data available for the selected period")
+        return
+
+    # Downsampled daily data: clicking a point fetches the days of that bucket (only this section reruns)
+    event = chart("Weekly Fraud Amount Evolution", fig, "No fraud data available for the selected period",
+                  on_select="rerun", selection_mode="points", key="fraud_evolution_chart")
+    points = event.selection.points if event is not None else []
+    if not points:
+        st.caption(f"One point per {grain} - click a point to see its days")
+        return
+
+    start = pd.Timestamp(points[0]["x"]).normalize()
+    end = bucket_end(start, grain)
+    days = selection["day_date"]
+    detail = dict(selection, day_date=days[(days >= start) & (days <= end)])
+    detail_fig, _ = fraud_evolution_figure(cube, version, time_dimension, selection_key(detail), detail,
+                                           CHART_POINT_BUDGET)
+    chart(f"Fraud Amount from {start.strftime('%Y-%m-%d')} to {end.strftime('%Y-%m-%d')}", detail_fig,
+          "No fraud data available for this period")
+
+@st.fragment
+@timed_fragment
+def type_section(selection):
+    # Second row - Transaction Types (2 columns)
+    col1, col2 = st.columns(2)
+    with col1:
+        # All transaction types (fraudulent and non-fraudulent)
+        overview = chart("Transaction Types Overview",
+                         type_figure(cube, version, "nb_transaction", selection_key(selection), selection, False),
+                         "No transaction data available",
+                         on_select="rerun", selection_mode="points", key="type_overview_chart")
+    with col2:
+        # Only fraudulent transactions by type
+        fraud = chart("Fraudulent Transaction Types",
+                      type_figure(cube, version, "nb_transaction_fraud", selection_key(selection), selection, True),
+                      "No fraudulent transaction data available",
+                      on_select="rerun", selection_mode="points", key="type_fraud_chart")
+
+    # Clicking a bar lists its transactions under the charts (only this section reruns)
+    if clicked(fraud, "x") is not None:
+        drilldown("transaction_type", clicked(fraud, "x"), selection, True)
+    elif clicked(overview, "x") is not None:
+        drilldown("transaction_type", clicked(overview, "x"), selection, False)
     else:
-        st.info("No fraud volume data by country available")
-    
-    st.markdown('</div>', unsafe_allow_html=True)
+        st.caption("Click a bar to list its transactions")
+
+@st.fragment
+@timed_fragment
+def country_section(selection):
+    # Second row of charts
+    col1, col2 = st.columns(2)
+    with col1:
+        amount = chart("Top 5 Fraud Amount by Country",
+                       country_figure(cube, version, "total_amount_fraud", selection_key(selection), selection),
+                       "No fraud data by country available",
+                       on_select="rerun", selection_mode="points", key="country_amount_chart")
+    with col2:
+        volume = chart("Top 5 Fraud by Country (Volume)",
+                       country_figure(cube, version, "nb_transaction_fraud", selection_key(selection), selection),
+                       "No fraud volume data by country available",
+                       on_select="rerun", selection_mode="points", key="country_volume_chart")
 
+    # Both charts rank fraud, a clicked country lists its fraudulent transactions
+    country = clicked(amount, "y") if clicked(amount, "y") is not None else clicked(volume, "y")
+    if country is not None:
+        drilldown("country", country, selection, True)
+    else:
+        st.caption("Click a bar to list its fraudulent transactions")
+
+@st.fragment
+@timed_fragment
+def alert_section(selection):
+    # Segments whose weekly (or daily) fraud rate or amount broke away from their baseline
+    st.markdown('<div class="section-title">Fraud Alerts</div>', unsafe_allow_html=True)
+
+    increases_only = st.toggle("Increases only", value=True, key="alerts_increases_only",
+                               help="Hide the segments whose fraud fell below their baseline")
+
+    with span("alert_section.query"):
+        if time_dimension == "iso_week":
+            in_period = alerts["period"].isin(selection["iso_week"])
+        else:
+            in_period = pd.to_datetime(alerts["period"], errors="coerce").isin(selection["day_date"])
+        shown = alerts[
+            in_period &
+            alerts["country"].isin(selection["country"]) &
+            alerts["transaction_type"].isin(selection["transaction_type"])
+        ]
+        if increases_only:
+            shown = shown[shown["z"] > 0]
+        shown = shown.assign(abs_z=shown["z"].abs()).sort_values(["period", "abs_z"], ascending=False)
 
+    if shown.empty:
+        st.info("No alerts for the selected slice")
+        return
+
+    rate = (shown["metric"] == "fraud_rate").to_numpy()
+    def formatted(values):
+        return [f"{v:.2%}" if is_rate else f"£{v:,.0f}" for v, is_rate in zip(values, rate)]
+
+    st.dataframe(
+        pd.DataFrame({
+            "Period": shown["period"],
+            "Country": shown["country"],
+            "Type": shown["transaction_type"],
+            "Metric": shown["metric"].map({"fraud_rate": "Fraud rate", "fraud_amount": "Fraud amount"}),
+            "Value": formatted(shown["value"]),
+            "Baseline": formatted(shown["baseline"]),
+            "z-score": shown["z"],
+        }),
+        hide_index=True, use_container_width=True, height=min(350, 38 + 35 * len(shown))
+    )
+
+@st.fragment
+@timed_fragment
+def fraud_ring_section(countries):
+    # Fraud rings - users linked to known fraudsters, for the selected countries
+    st.markdown('<div class="section-title">Fraud Ring Exposure</div>', unsafe_allow_html=True)
+
+    # The slider lives in the fragment, moving it only reruns this section
+    min_risk = st.slider(
+        "Minimum ring risk",
+        min_value=0.05,
+        max_value=1.0,
+        value=0.25,
+        step=0.05,
+        key="min_risk_slider",
+        help="Users linked to a known fraudster (1 = fraudster, halved at each hop)"
+    )
+
+    with span("fraud_ring_section.query"):
+        at_risk = user_risk[
+            (user_risk["risk"] >= min_risk) &
+            (user_risk["is_fraudster"] == 0) &
+            user_risk["country"].isin(countries)
+        ]
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        risk_by_country = at_risk.groupby("country", observed=True).size().rename("users").reset_index()
+        risk_by_country = risk_by_country[risk_by_country["users"] > 0].sort_values("users", ascending=True)
+
+        fig = None
+        if not risk_by_country.empty:
+            fig = go.Figure()
+            fig.add_trace(go.Bar(
+                x=risk_by_country["users"],
+                y=risk_by_country["country"],
+                orientation='h',
+                marker_color=COLORS['warning'],
+                hovertemplate='<b>Country:</b> %{y}<br><b>At-risk Users:</b> %{x:,.0f}<extra></extra>'
+            ))
+
+            fig.update_layout(
+                xaxis_title="Users not flagged yet",
+                yaxis_title="Country",
+                template="plotly_white",
+                height=350,
+                plot_bgcolor='rgba(0,0,0,0)',
+                paper_bgcolor='rgba(0,0,0,0)',
+                margin=dict(l=50, r=50, t=50, b=50),
+                font=dict(size=12)
+            )
+        chart("At-risk Users by Country", fig, "No at-risk users for the selected countries")
+
+    with col2:
+        st.markdown('<div class="chart-container">', unsafe_allow_html=True)
+        st.markdown('<div class="chart-title">Largest Rings</div>', unsafe_allow_html=True)
+
+        rings = at_risk.groupby("ring_id").agg(
+            ring_size=("ring_size", "first"),
+            fraudsters=("ring_fraudsters", "first"),
+            at_risk_users=("user_id", "size"),
+            max_risk=("risk", "max")
+        ).sort_values(["at_risk_users", "ring_size"], ascending=False).head(10)
+
+        if not rings.empty:
+            st.dataframe(rings, use_container_width=True, height=350)
+        else:
+            st.info("No rings for the selected countries")
+
+        st.markdown('</div>', unsafe_allow_html=True)
+
+# Above-the-fold chart first, the breakdowns below it render once it has been sent
+fraud_evolution_section(cube_selection)
+type_section(cube_selection)
+country_section(cube_selection)
+if alerts is not None:
+    alert_section(cube_selection)
+if user_risk is not None:
+    fraud_ring_section(selected_countries)
 
 # Footer
 st.markdown("---")
@@ -971,4 +1349,28 @@ st.markdown(
     </div>
     """,
     unsafe_allow_html=True
-) 
\ No newline at end of file
+) 
+# Performance panel, for analysts reporting a slow dashboard (DASHBOARD_DEBUG=1 or ?debug=1)
+if DASHBOARD_DEBUG or st.query_params.get("debug") == "1":
+    run = metrics.snapshot()
+    with st.sidebar.expander("⏱️ Performance", expanded=True):
+        st.caption(f"This run: {run['seconds'] * 1000:,.0f} ms | RSS {format_bytes(run['rss_bytes'] or 0)} | "
+                   f"frame {format_bytes(run.get('frame_bytes') or 0)} | cube {format_bytes(run['cube_bytes'])}")
+        st.dataframe(
+            pd.DataFrame({"span": list(run["spans"]), "ms": [s * 1000 for s in run["spans"].values()]})
+            .sort_values("ms", ascending=False).round(2),
+            hide_index=True, use_container_width=True
+        )
+        st.dataframe(
+            pd.DataFrame([{"function": name, "hits (run)": run["cache"].get(name, {}).get("hits", 0),
+                           "misses (run)": run["cache"].get(name, {}).get("misses", 0),
+                           "hits": stats["hits"], "misses": stats["misses"]}
+                          for name, stats in cache_stats().items()]),
+            hide_index=True, use_container_width=True
+        )
+
+# End of the run: totals, cache counts and memory go to the metrics sink
+try:
+    metrics.close()
+except OSError as e:
+    st.sidebar.caption(f"Metrics not written: {e}")
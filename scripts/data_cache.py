@@ -0,0 +1,264 @@
+import hashlib
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+import pandas as pd
+
+from schema import BASE2_SCHEMA, apply_schema
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional, we fall back to plain CSV parsing
+    pa = None
+    pq = None
+
+
+# Cache files live next to the data, in a .cache folder beside each source CSV (one parquet +
+# one metadata file per CSV) unless a cache_dir is given, whatever the working directory
+CACHE_DIR = None
+
+# mkstemp creates private files, cache files get the usual permissions of the process instead
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+DATE_COLUMNS = ["day_date", "week_date"]
+DICTIONARY_COLUMNS = ["country", "transaction_type"]
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """SHA-256 of a file, read in chunks so large extracts never sit in memory."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def resolve_cache_dir(csv_path, cache_dir=CACHE_DIR):
+    """The cache folder of a CSV: `cache_dir` when given, else `.cache` beside the CSV."""
+    return cache_dir or os.path.join(os.path.dirname(os.path.abspath(csv_path)), ".cache")
+
+
+@contextmanager
+def atomic_path(path):
+    """Yield a unique temp file next to `path`, moved over it once written.
+
+    Every writer gets its own temp file, so concurrent cold starts never collide, and readers
+    only ever see the old file or the complete new one. The temp file is removed on failure.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".",
+                                    prefix=os.path.basename(path) + ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        os.chmod(tmp_path, 0o666 & ~_UMASK)
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def cache_paths(csv_path, cache_dir=CACHE_DIR):
+    """Return the (parquet, metadata) paths used to cache a given CSV."""
+    cache_dir = resolve_cache_dir(csv_path, cache_dir)
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    return (os.path.join(cache_dir, f"{stem}.parquet"),
+            os.path.join(cache_dir, f"{stem}.meta.json"))
+
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(meta_path, meta):
+    with atomic_path(meta_path) as tmp_path:
+        with open(tmp_path, "w") as fh:
+            json.dump(meta, fh)
+
+
+def parse_csv(csv_path):
+    """Parse the base_2 CSV the same way the dashboard always did."""
+    df = pd.read_csv(csv_path)
+    for col in DATE_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col])
+    return df
+
+
+def is_cache_fresh(csv_path, cache_dir=CACHE_DIR, paths=None, **expected):
+    """Check whether the cached parquet (or the given cache `paths`) still matches the source CSV.
+
+    The mtime/size pair is compared first since it is free. If it changed, the file is
+    hashed and, when the content is identical (e.g. a plain `touch`), the metadata is
+    refreshed so the next start takes the fast path again. Any `expected` metadata value
+    that differs (e.g. the schema) makes the cache stale.
+    """
+    cache_path, meta_path = paths or cache_paths(csv_path, cache_dir)
+    meta = _read_meta(meta_path)
+    if meta is None or not os.path.exists(cache_path):
+        return False
+    if any(meta.get(key) != value for key, value in expected.items()):
+        return False
+
+    stat = os.stat(csv_path)
+    if meta.get("mtime_ns") == stat.st_mtime_ns and meta.get("size") == stat.st_size:
+        return True
+
+    if meta.get("sha256") != file_hash(csv_path):
+        return False
+
+    meta.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+    _write_meta(meta_path, meta)
+    return True
+
+
+def build_cache(csv_path, cache_dir=CACHE_DIR):
+    """Parse the CSV once and write it as a typed, dictionary-encoded parquet file."""
+    parquet_path, meta_path = cache_paths(csv_path, cache_dir)
+    os.makedirs(os.path.dirname(parquet_path), exist_ok=True)
+
+    stat = os.stat(csv_path)
+    df = parse_csv(csv_path)
+    for col in DICTIONARY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+
+    # Write to a temp file first so a concurrent worker never reads a half-written cache
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    with atomic_path(parquet_path) as tmp_path:
+        pq.write_table(table, tmp_path, compression="zstd",
+                       use_dictionary=[c for c in DICTIONARY_COLUMNS if c in df.columns])
+
+    _write_meta(meta_path, {
+        "source": os.path.abspath(csv_path),
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "sha256": file_hash(csv_path),
+        "rows": len(df),
+    })
+    return df
+
+
+def read_base2(csv_path, cache_dir=CACHE_DIR):
+    """Load the base_2 extract, going through the parquet cache whenever possible.
+
+    The cache is rebuilt automatically when the source CSV changes. Without pyarrow
+    this is just the plain CSV parse.
+    """
+    stat = os.stat(csv_path)
+
+    if pq is None:
+        df = parse_csv(csv_path)
+    elif is_cache_fresh(csv_path, cache_dir):
+        parquet_path, _ = cache_paths(csv_path, cache_dir)
+        df = pd.read_parquet(parquet_path)
+    else:
+        df = build_cache(csv_path, cache_dir)
+
+    # Version of the data, used to key anything derived from the frame (indexes, cubes...)
+    df.attrs["source"] = {"path": os.path.abspath(csv_path), "mtime_ns": stat.st_mtime_ns,
+                          "size": stat.st_size, "rows": len(df)}
+    return df
+
+
+def prepared_paths(csv_path, cache_dir=CACHE_DIR):
+    """Return the (Arrow IPC, metadata) paths of the prepared frame of a given CSV."""
+    cache_dir = resolve_cache_dir(csv_path, cache_dir)
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    return (os.path.join(cache_dir, f"{stem}.arrow"),
+            os.path.join(cache_dir, f"{stem}.arrow.json"))
+
+
+def write_prepared(df, csv_path, cache_dir=CACHE_DIR, schema=BASE2_SCHEMA):
+    """Write the prepared frame as an uncompressed Arrow IPC file, mappable as is."""
+    arrow_path, meta_path = prepared_paths(csv_path, cache_dir)
+    os.makedirs(os.path.dirname(arrow_path), exist_ok=True)
+
+    stat = os.stat(csv_path)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # The schema report travels with the file, attrs are not part of the Arrow data
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                           b"attrs": json.dumps({"schema_report": df.attrs.get("schema_report")})})
+
+    # Replaced, never rewritten in place: workers that mapped the old file keep a valid mapping
+    with atomic_path(arrow_path) as tmp_path:
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+    _write_meta(meta_path, {
+        "source": os.path.abspath(csv_path),
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "sha256": file_hash(csv_path),
+        "rows": len(df),
+        "schema": schema,
+    })
+
+
+def open_prepared(arrow_path):
+    """Memory-map a prepared frame. The columns are read-only views of the mapped file, so every
+    process opening it shares the same pages of the OS page cache instead of its own copy."""
+    table = pa.ipc.open_file(pa.memory_map(arrow_path, "r")).read_all()
+    # One block per column, so numeric columns without nulls are not consolidated into a copy
+    df = table.to_pandas(split_blocks=True)
+    df.attrs.update(json.loads((table.schema.metadata or {}).get(b"attrs", b"{}")))
+    return df
+
+
+def read_prepared(csv_path, cache_dir=CACHE_DIR, schema=BASE2_SCHEMA):
+    """Load the base_2 extract with its compact schema applied, memory-mapped when possible.
+
+    The first worker to find the prepared file stale (or missing) builds it from
+    `read_base2`, every other open is a zero-copy mapping. Without pyarrow this is
+    `apply_schema(read_base2(...))`, a private copy.
+    """
+    if pa is None:
+        return apply_schema(read_base2(csv_path, cache_dir), schema)
+
+    stat = os.stat(csv_path)
+    arrow_path, meta_path = prepared_paths(csv_path, cache_dir)
+    if not is_cache_fresh(csv_path, cache_dir, paths=(arrow_path, meta_path), schema=schema):
+        write_prepared(apply_schema(read_base2(csv_path, cache_dir), schema), csv_path, cache_dir, schema)
+
+    df = open_prepared(arrow_path)
+    df.attrs["source"] = {"path": os.path.abspath(csv_path), "mtime_ns": stat.st_mtime_ns,
+                          "size": stat.st_size, "rows": len(df)}
+    return df
+
+
+def data_version(df):
+    """Hashable version of a frame loaded by `read_base2`."""
+    source = df.attrs.get("source", {})
+    return (source.get("path"), source.get("mtime_ns"), source.get("size"), len(df))
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    path = sys.argv[1] if len(sys.argv) > 1 else "data/base_2_202508041440.csv"
+
+    start = time.perf_counter()
+    parse_csv(path)
+    csv_time = time.perf_counter() - start
+
+    build_cache(path)
+    start = time.perf_counter()
+    read_base2(path)
+    parquet_time = time.perf_counter() - start
+
+    read_prepared(path)
+    start = time.perf_counter()
+    read_prepared(path)
+    mapped_time = time.perf_counter() - start
+
+    print(f"CSV parse: {csv_time:.3f}s | Parquet cache load: {parquet_time:.3f}s | Memory-mapped open: {mapped_time:.3f}s")
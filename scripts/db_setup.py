@@ -1,19 +1,132 @@
+import argparse
+import os
+import time
+
 import pandas as pd
-from sqlalchemy import create_engine 
 
-#Connexion SQLite (Création du fichier de la basse de données inexistante)
-engine = create_engine('sqlite:///fincrime.db')
+from drilldown import DRILLDOWN_INDEXES
+from etl import DATABASE_URL, connect
+
+# Dossier des CSV Kaggle (voir dl_data_script.py)
+DATA_DIR = os.environ.get("DATA_DIR", "data")
+
+# Types explicites par table (schéma Kaggle complet, les colonnes absentes du CSV sont ignorées) :
+# entiers et booléens en INTEGER, montants en REAL, pour que les comparaisons SQL soient
+# numériques et non lexicographiques. Les colonnes non listées sont lues comme du texte,
+# ce qui évite l'inférence de type par chunk (et les colonnes object coûteuses)
+TABLES = {
+    "users": {"file": "users.csv", "dtypes": {
+        "HAS_EMAIL": "Int64",
+        "IS_FRAUDSTER": "boolean",
+        "BIRTH_YEAR": "Int64",
+        "FAILED_SIGN_IN_ATTEMPTS": "Int64",
+    }},
+    "transactions": {"file": "transactions.csv", "dtypes": {
+        "AMOUNT": "Int64",  # unités mineures de CURRENCY
+        "AMOUNT_GBP": "float64",
+    }},
+    "fraudsters": {"file": "fraudsters.csv", "dtypes": {}},
+}
+
+# Index de jointure de query_eda.sql, et index composites des pages du drill-down,
+# créés une fois les données chargées
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_transactions_user_id ON transactions (USER_ID)",
+    "CREATE INDEX IF NOT EXISTS idx_users_id ON users (ID)",
+    "CREATE INDEX IF NOT EXISTS idx_fraudsters_user_id ON fraudsters (USER_ID)",
+] + DRILLDOWN_INDEXES
+
+# Pragmas de chargement en masse : le journal reste en mémoire, donc un échec du chargement
+# est annulé par le ROLLBACK (la base précédente est conservée) ; seul un arrêt brutal du
+# processus en cours de chargement impose de reconstruire la base
+BULK_PRAGMAS = {
+    "journal_mode": "MEMORY",
+    "synchronous": "OFF",
+    "cache_size": "-65536",  # 64 Mo
+    "temp_store": "MEMORY",
+}
+DEFAULT_PRAGMAS = {
+    "journal_mode": "DELETE",
+    "synchronous": "FULL",
+}
+
+
+def sql_type(dtype):
+    if pd.api.types.is_integer_dtype(dtype) or pd.api.types.is_bool_dtype(dtype):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(dtype):
+        return "REAL"
+    return "TEXT"
+
+
+def read_chunks(path, dtypes, chunksize):
+    """Lecture du CSV par chunks, avec des types explicites pour chaque colonne."""
+    columns = pd.read_csv(path, nrows=0).columns
+    dtype = {col: dtypes.get(col, "str") for col in columns}
+    return pd.read_csv(path, dtype=dtype, chunksize=chunksize)
+
+
+def load_table(conn, table, path, dtypes, chunksize):
+    """Charge un CSV dans une table SQLite, chunk par chunk, avec executemany."""
+    conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+
+    rows = 0
+    insert = None
+    for chunk in read_chunks(path, dtypes, chunksize):
+        if insert is None:
+            columns = ", ".join(f'"{col}" {sql_type(chunk[col].dtype)}' for col in chunk.columns)
+            conn.execute(f'CREATE TABLE "{table}" ({columns})')
+            placeholders = ", ".join("?" * len(chunk.columns))
+            insert = f'INSERT INTO "{table}" VALUES ({placeholders})'
+
+        # Les valeurs manquantes deviennent NULL
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        conn.executemany(insert, chunk.itertuples(index=False, name=None))
+        rows += len(chunk)
+
+    return rows
+
+
+def setup_database(data_dir=DATA_DIR, chunksize=100_000, database_url=DATABASE_URL):
+    """Charge les trois CSV dans fincrime.db en une seule transaction, puis crée les index."""
+    #Connexion SQLite (Création du fichier de la basse de données inexistante)
+    conn = connect(database_url)
+    conn.isolation_level = None  # transactions gérées explicitement
+
+    try:
+        for pragma, value in BULK_PRAGMAS.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+
+        conn.execute("BEGIN")
+        for table, spec in TABLES.items():
+            start = time.perf_counter()
+            rows = load_table(conn, table, os.path.join(data_dir, spec["file"]), spec["dtypes"], chunksize)
+            elapsed = time.perf_counter() - start
+            print(f"{table}: {rows:,} lignes en {elapsed:.1f}s ({rows / max(elapsed, 1e-9):,.0f} lignes/s)")
+
+        print("Création des index ...")
+        start = time.perf_counter()
+        for sql in INDEXES:
+            conn.execute(sql)
+        conn.execute("COMMIT")
+        print(f"Index créés en {time.perf_counter() - start:.1f}s")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        for pragma, value in DEFAULT_PRAGMAS.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        conn.close()
+
 
-#Chargement des dataframes Kaggles
-print("Chargement des fichiers CSV ...") 
-users = pd.read_csv('/Users/charles-francoisfouti-loemba/Documents/Documents/Projets/FInCrime/data/users.csv')
-transactions = pd.read_csv('/Users/charles-francoisfouti-loemba/Documents/Documents/Projets/FInCrime/data/transactions.csv')
-fraudsters = pd.read_csv('/Users/charles-francoisfouti-loemba/Documents/Documents/Projets/FInCrime/data/fraudsters.csv')
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chargement des CSV Kaggle dans SQLite")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="Dossier contenant users.csv, transactions.csv et fraudsters.csv")
+    parser.add_argument("--chunksize", type=int, default=100_000, help="Nombre de lignes lues et insérées par batch")
+    args = parser.parse_args()
 
-#Création des tables dans la base de données
-print("Insertion dans SQLite ...")
-users.to_sql('users', engine, if_exists="replace", index=False)
-transactions.to_sql('transactions', engine, if_exists="replace", index=False)
-fraudsters.to_sql('fraudsters', engine, if_exists="replace", index=False)
+    print("Chargement des fichiers CSV et insertion dans SQLite ...")
+    setup_database(args.data_dir, args.chunksize)
 
-print('Success !')
\ No newline at end of file
+    print('Success !')
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+
+# Coarsest grain last. Periods are labelled by their first day, weeks start on Monday like week_date
+GRAINS = {
+    "day": "D",
+    "week": "W-SUN",
+    "month": "M",
+    "quarter": "Q",
+    "year": "Y",
+}
+
+
+def choose_grain(start, end, max_points):
+    """Finest grain giving at most `max_points` buckets between start and end."""
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    for grain, freq in GRAINS.items():
+        buckets = len(pd.period_range(start.to_period(freq), end.to_period(freq), freq=freq))
+        if buckets <= max_points:
+            return grain
+    return grain
+
+
+def bucket_start(dates, grain):
+    """First day of the `grain` bucket of each date."""
+    return pd.to_datetime(pd.Series(dates)).dt.to_period(GRAINS[grain]).dt.start_time
+
+
+def bucket_end(start, grain):
+    """Last day of the `grain` bucket starting on `start`."""
+    return pd.Timestamp(start).to_period(GRAINS[grain]).end_time.normalize()
+
+
+def aggregate(frame, date_column, value_columns, grain):
+    """Sum of the value columns per `grain` bucket, labelled by the bucket's first day."""
+    if grain == "day":
+        return frame
+    buckets = bucket_start(frame[date_column], grain).to_numpy()
+    return frame.groupby(buckets)[value_columns].sum().rename_axis(date_column).reset_index()
+
+
+def lttb(y, max_points, x=None):
+    """Largest-Triangle-Three-Buckets: positions of the points keeping the shape of (x, y).
+
+    The first and last points are always kept and one point is picked per bucket in between,
+    the one making the largest triangle with the previously kept point and the next bucket's
+    average. Returns sorted positions, all of them when there are few enough points and only
+    the first and last ones for a budget below 3.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if max_points >= n:
+        return np.arange(n)
+    if max_points < 3:
+        return np.unique([0, n - 1])
+
+    x = np.arange(n, dtype=np.float64) if x is None else np.asarray(x, dtype=np.float64)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+
+    kept = np.empty(max_points, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    previous = 0
+    for b in range(max_points - 2):
+        start, end = edges[b], edges[b + 1]
+        following = slice(end, edges[b + 2]) if b + 2 < len(edges) else slice(n - 1, n)
+        avg_x, avg_y = x[following].mean(), y[following].mean()
+
+        area = np.abs((x[previous] - avg_x) * (y[start:end] - y[previous])
+                      - (x[previous] - x[start:end]) * (avg_y - y[previous]))
+        previous = start + int(np.argmax(area))
+        kept[b + 1] = previous
+    return kept
+
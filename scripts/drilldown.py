@@ -0,0 +1,136 @@
+import argparse
+import json
+import os
+import time
+
+import pandas as pd
+
+from etl import BASE_QUERY, DATABASE_URL, connect
+from export import selection_date_range
+from sql_backend import ConnectionPool
+
+
+# Transactions shown per drill-down page
+DRILLDOWN_PAGE_SIZE = int(os.environ.get("DRILLDOWN_PAGE_SIZE", "50"))
+
+# Composite indexes of the keyset pages: pages are read in (CREATED_DATE, ID) order, from the
+# type index when a type is clicked, and users are looked up with their country in the index
+DRILLDOWN_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_transactions_created_date_id ON transactions (CREATED_DATE, ID)",
+    "CREATE INDEX IF NOT EXISTS idx_transactions_type_created_date_id ON transactions (TYPE, CREATED_DATE, ID)",
+    "CREATE INDEX IF NOT EXISTS idx_users_id_country ON users (ID, COUNTRY)",
+]
+
+# Columns of the `base` rows shown in the drill-down, in display order
+DRILLDOWN_COLUMNS = ["created_date", "transaction_id", "user_id", "country", "transaction_type", "state",
+                     "amnt_gbp", "is_fraudster"]
+
+
+def _in(column, values, params):
+    """Equality for a single value (seeks the composite index), a JSON list parameter otherwise."""
+    values = [str(value) for value in values]
+    if len(values) == 1:
+        params.append(values[0])
+        return f"{column} = ?"
+    params.append(json.dumps(values))
+    return f"{column} IN (SELECT value FROM json_each(?))"
+
+
+def page_query(selection, after=None, page_size=DRILLDOWN_PAGE_SIZE, fraud_only=False):
+    """SQL and parameters of one keyset page of the transactions of a cube selection.
+
+    The selection's weeks (or days) become a CREATED_DATE range plus the exact week/day check,
+    and the page starts strictly after the (created_date, id) key of the previous page's last
+    row, so every page is an index seek followed by `page_size` rows whatever its number.
+    One extra row is read to tell whether there is a next page.
+    """
+    start, end = selection_date_range(selection)
+    if start is None:
+        return None, None
+
+    # The page key also moves the lower bound, SQLite does not seek the index on a row value
+    # after an equality on TYPE
+    lower = start.strftime("%Y-%m-%d") if after is None else max(start.strftime("%Y-%m-%d"), after[0])
+    params = [lower, end.strftime("%Y-%m-%d")]
+    where = ["t.CREATED_DATE >= ?", "t.CREATED_DATE < ?"]
+    if "iso_week" in selection:
+        where.append(_in("strftime('%Y-W%W', t.CREATED_DATE)", selection["iso_week"], params))
+    else:
+        where.append(_in("substr(t.CREATED_DATE, 1, 10)",
+                         pd.to_datetime(pd.Index(selection["day_date"])).strftime("%Y-%m-%d"), params))
+    # A type list is filtered row by row, only a single clicked type seeks its own index
+    type_filter = _in("t.TYPE", selection["transaction_type"], params)
+    where.append(type_filter if len(selection["transaction_type"]) == 1 else "+" + type_filter)
+    where.append(_in("u.COUNTRY", selection["country"], params))
+    if fraud_only:
+        where.append("f.USER_ID IS NOT NULL")
+    if after is not None:
+        where.append("(t.CREATED_DATE, t.ID) > (?, ?)")
+        params.extend(after)
+
+    sql = f"{BASE_QUERY}WHERE {' AND '.join(where)}\nORDER BY t.CREATED_DATE, t.ID\nLIMIT ?"
+    params.append(page_size + 1)
+    return sql, params
+
+
+def transaction_page(pool, selection, after=None, page_size=DRILLDOWN_PAGE_SIZE, fraud_only=False):
+    """One page of the transactions (joined with their user and fraudster flag) of a selection.
+
+    Returns the page and the (created_date, id) key to pass as `after` for the next page,
+    None on the last page.
+    """
+    sql, params = page_query(selection, after, page_size, fraud_only)
+    if sql is None:
+        return pd.DataFrame(columns=DRILLDOWN_COLUMNS), None
+
+    with pool.connection() as conn:
+        cursor = conn.execute(sql, params)
+        columns = [column[0] for column in cursor.description]
+        rows = cursor.fetchall()
+
+    page = pd.DataFrame(rows[:page_size], columns=columns)[DRILLDOWN_COLUMNS]
+    if len(rows) <= page_size:
+        return page, None
+    last = page.iloc[-1]
+    return page, (last["created_date"], last["transaction_id"])
+
+
+def setup_indexes(conn):
+    for sql in DRILLDOWN_INDEXES:
+        conn.execute(sql)
+    conn.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the keyset pages of a drill-down slice on fincrime.db")
+    parser.add_argument("--week", nargs="+", required=True, help="ISO weeks of the slice (YYYY-WNN)")
+    parser.add_argument("--country", nargs="+", required=True, help="Countries of the slice")
+    parser.add_argument("--type", nargs="+", required=True, help="Transaction types of the slice")
+    parser.add_argument("--fraud-only", action="store_true", help="Only the transactions of fraudsters")
+    parser.add_argument("--pages", type=int, default=1000, help="Pages to walk through")
+    parser.add_argument("--page-size", type=int, default=DRILLDOWN_PAGE_SIZE, help="Rows per page")
+    parser.add_argument("--create-indexes", action="store_true", help="Create the drill-down indexes first")
+    args = parser.parse_args()
+
+    if args.create_indexes:
+        conn = connect(DATABASE_URL)
+        try:
+            setup_indexes(conn)
+        finally:
+            conn.close()
+
+    pool = ConnectionPool(DATABASE_URL, size=1)
+    selection = dict(iso_week=args.week, country=args.country, transaction_type=args.type)
+    after, timings = None, []
+    for _ in range(args.pages):
+        start = time.perf_counter()
+        page, after = transaction_page(pool, selection, after, args.page_size, args.fraud_only)
+        timings.append(time.perf_counter() - start)
+        if after is None:
+            break
+
+    print(f"{'pages':<14}{len(timings):,}")
+    print(f"{'rows':<14}{(len(timings) - 1) * args.page_size + len(page):,}")
+    print(f"{'first page':<14}{timings[0] * 1000:.2f} ms")
+    print(f"{'last page':<14}{timings[-1] * 1000:.2f} ms")
+    print(f"{'median page':<14}{pd.Series(timings).median() * 1000:.2f} ms")
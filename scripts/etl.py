@@ -0,0 +1,185 @@
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from hll import DEFAULT_PRECISION, SketchSet, build_registers, hash_values
+
+
+# Same connection string as db_setup.py, can be overridden through the README's DATABASE_URL
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///fincrime.db")
+SKETCH_FILE_PATH = os.environ.get("SKETCH_FILE_PATH", "data/base_2_sketches.npz")
+
+# Group keys and output columns of the base_2 CTE in query_eda.sql
+GROUP_KEYS = ["iso_week", "week_date", "country", "transaction_type"]
+BASE2_COLUMNS = [
+    "iso_week", "week_date", "day_date", "country", "transaction_type",
+    "nb_users", "nb_fraudsters", "nb_transaction", "nb_transaction_fraud",
+    "total_amount_fraud", "total_amount_transactions",
+    "pct_completed", "pct_failed", "pct_cancelled", "pct_refunded",
+]
+STATE_COLUMNS = {"pct_completed": "completed", "pct_failed": "failed",
+                 "pct_cancelled": "cancelled", "pct_refunded": "refunded"}
+
+# `base` CTE of query_eda.sql, without the per-row DATE/STRFTIME calls (done in pandas on distinct days)
+BASE_QUERY = """
+SELECT
+    t.ID AS transaction_id,
+    t.USER_ID AS user_id,
+    t.CREATED_DATE AS created_date,
+    t.TYPE AS transaction_type,
+    t.STATE AS state,
+    t.AMOUNT_GBP AS amnt_gbp,
+    u.COUNTRY AS country,
+    CASE WHEN f.USER_ID IS NOT NULL THEN 1 ELSE 0 END AS is_fraudster
+FROM transactions t
+JOIN users u ON t.USER_ID = u.ID
+LEFT JOIN fraudsters f ON t.USER_ID = f.USER_ID
+"""
+
+# Same rows with integer rowids instead of the UUID strings and the day instead of the full
+# timestamp. The base_2 aggregates are identical (users.ID is unique), but far less data has
+# to be converted to Python objects, which dominates the cost of reading the base rows.
+BASE_COMPACT_QUERY = """
+SELECT
+    CASE WHEN t.ID IS NOT NULL THEN t.rowid END AS transaction_id,
+    u.rowid AS user_id,
+    substr(t.CREATED_DATE, 1, 10) AS created_date,
+    t.TYPE AS transaction_type,
+    t.STATE AS state,
+    t.AMOUNT_GBP AS amnt_gbp,
+    u.COUNTRY AS country,
+    CASE WHEN f.USER_ID IS NOT NULL THEN 1 ELSE 0 END AS is_fraudster
+FROM transactions t
+JOIN users u ON t.USER_ID = u.ID
+LEFT JOIN fraudsters f ON t.USER_ID = f.USER_ID
+"""
+
+
+def sqlite_path(database_url=DATABASE_URL):
+    """File path of a `sqlite:///...` URL."""
+    prefix = "sqlite:///"
+    if not database_url.startswith(prefix):
+        raise Exception(f'Only SQLite databases are supported, got {database_url}!')
+    return database_url[len(prefix):]
+
+
+def connect(database_url=DATABASE_URL):
+    return sqlite3.connect(sqlite_path(database_url))
+
+
+def add_week_keys(base):
+    """Add day_date, week_date and iso_week exactly as query_eda.sql computes them.
+
+    week_date is the Monday of the week and iso_week is STRFTIME('%Y-W%W'). The string
+    formatting only runs once per distinct day rather than once per transaction.
+    """
+    day = pd.to_datetime(base["created_date"], format="ISO8601").dt.normalize()
+    days = pd.Series(day.unique())
+    lookup = pd.DataFrame({
+        "day_date": days.dt.strftime("%Y-%m-%d").to_numpy(),
+        "week_date": (days - pd.to_timedelta(days.dt.weekday, unit="D")).dt.strftime("%Y-%m-%d").to_numpy(),
+        "iso_week": days.dt.strftime("%Y-W%W").to_numpy(),
+    }, index=pd.DatetimeIndex(days))
+
+    codes = lookup.index.get_indexer(day)
+    for col in ["day_date", "week_date", "iso_week"]:
+        base[col] = lookup[col].to_numpy()[codes]
+    return base
+
+
+def read_base(conn, chunksize=None, where=None, params=None, query=BASE_QUERY):
+    """Rows of the `base` CTE, optionally filtered and/or as an iterator of chunks."""
+    query = query + (f"WHERE {where}" if where else "")
+    if chunksize is None:
+        return add_week_keys(pd.read_sql_query(query, conn, params=params))
+    return (add_week_keys(chunk) for chunk in pd.read_sql_query(query, conn, params=params, chunksize=chunksize))
+
+
+def aggregate_base2(base):
+    """Aggregate `base` rows into base_2 rows, the same columns as query_eda.sql.
+
+    day_date is not a group key in the query, SQLite returns an arbitrary day of the
+    group for it, here it is the first day of the group. States are compared with the
+    same (case-sensitive) values as the query.
+    """
+    if base.empty:
+        return pd.DataFrame(columns=BASE2_COLUMNS)
+
+    is_fraud = base["is_fraudster"].to_numpy() == 1
+    amount = base["amnt_gbp"].to_numpy(dtype=np.float64)
+    frame = base[GROUP_KEYS + ["day_date", "user_id", "transaction_id"]].assign(
+        fraud_user=base["user_id"].where(is_fraud),
+        fraud_transaction=base["transaction_id"].where(is_fraud),
+        fraud_amount=np.where(is_fraud, amount, 0.0),
+        amount=amount,
+        **{col: (base["state"] == state).to_numpy() for col, state in STATE_COLUMNS.items()},
+    )
+
+    grouped = frame.groupby(GROUP_KEYS, sort=False, dropna=False)
+    out = grouped.agg(
+        day_date=("day_date", "min"),
+        nb_users=("user_id", "nunique"),
+        nb_fraudsters=("fraud_user", "nunique"),
+        nb_transaction=("transaction_id", "count"),
+        nb_transaction_fraud=("fraud_transaction", "count"),
+        total_amount_fraud=("fraud_amount", "sum"),
+        total_amount_transactions=("amount", "sum"),
+        **{col: (col, "sum") for col in STATE_COLUMNS},
+    ).reset_index()
+
+    out["total_amount_fraud"] = out["total_amount_fraud"].round(2)
+    out["total_amount_transactions"] = out["total_amount_transactions"].round(2)
+    for col in STATE_COLUMNS:
+        out[col] = (100.0 * out[col] / out["nb_transaction"]).round(2)
+
+    return sort_base2(out[BASE2_COLUMNS])
+
+
+def sort_base2(base2):
+    """ORDER BY iso_week DESC, country, transaction_type"""
+    base2 = base2.sort_values(["country", "transaction_type"], kind="stable")
+    return base2.sort_values("iso_week", ascending=False, kind="stable").reset_index(drop=True)
+
+
+def build_sketches(chunks, precision=DEFAULT_PRECISION):
+    """Users and fraudsters HyperLogLog sketches per base_2 group.
+
+    Sketches of the same group are merged with a register-wise max, so the chunks can be
+    any partition of the transactions and never need to fit in memory together.
+    """
+    keys = {}
+    users = build_registers([], 0, [], precision)
+    fraudsters = build_registers([], 0, [], precision)
+
+    for base in chunks:
+        # Groups are numbered in order of first appearance, so first rows line up with group ids
+        groups = base.groupby(GROUP_KEYS, sort=False, dropna=False).ngroup().to_numpy()
+        first = ~pd.Series(groups).duplicated().to_numpy()
+        rows = np.array([keys.setdefault(key, len(keys)) for key in
+                         base.loc[first, GROUP_KEYS].itertuples(index=False, name=None)], dtype=np.int64)
+        hashes = hash_values(base["user_id"])
+
+        is_fraudster = base["is_fraudster"].to_numpy() == 1
+        users = users.merge(build_registers(groups, len(rows), hashes, precision), rows, len(keys))
+        fraudsters = fraudsters.merge(build_registers(groups[is_fraudster], len(rows), hashes[is_fraudster], precision),
+                                      rows, len(keys))
+
+    return SketchSet(pd.DataFrame(list(keys), columns=GROUP_KEYS),
+                     {"users": users, "fraudsters": fraudsters}, precision)
+
+
+if __name__ == "__main__":
+    import time
+
+    start = time.perf_counter()
+    conn = connect()
+    try:
+        sketches = build_sketches(read_base(conn, chunksize=500_000))
+    finally:
+        conn.close()
+    sketches.save(SKETCH_FILE_PATH)
+
+    print(f"{len(sketches.keys)} group sketches written to {SKETCH_FILE_PATH} "
+          f"({sketches.nbytes / 1e6:.1f} MB, ±{sketches.error:.1%}) in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,197 @@
+import io
+import os
+import tempfile
+from datetime import datetime
+
+import pandas as pd
+
+from etl import DATABASE_URL, connect, read_base, sqlite_path
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional, only the CSV export is offered without it
+    pa = None
+    pq = None
+
+
+EXPORT_CHUNKSIZE = 100_000
+# Streamlit serves a download from memory (the whole file is read into its media storage), so
+# exports are capped: raw selections above EXPORT_MAX_ROWS transactions are not offered, and a
+# file growing past EXPORT_MAX_BYTES is abandoned while it is being written
+EXPORT_MAX_ROWS = int(os.environ.get("EXPORT_MAX_ROWS", "2000000"))
+EXPORT_MAX_BYTES = int(os.environ.get("EXPORT_MAX_BYTES", str(200 * 1024 * 1024)))
+
+# Columns of the raw rows behind the base_2 aggregates
+RAW_COLUMNS = ["transaction_id", "user_id", "created_date", "transaction_type", "state",
+               "amnt_gbp", "country", "is_fraudster", "iso_week", "day_date"]
+
+FORMATS = {
+    "CSV": {"extension": "csv", "mime": "text/csv"},
+    "Parquet": {"extension": "parquet", "mime": "application/vnd.apache.parquet"},
+}
+
+
+def available_formats():
+    return [name for name in FORMATS if name != "Parquet" or pq is not None]
+
+
+def frame_chunks(frame, chunksize=EXPORT_CHUNKSIZE):
+    """Slices of an in-memory frame, so it is never serialized in one piece."""
+    for start in range(0, len(frame), chunksize):
+        yield frame.iloc[start:start + chunksize]
+
+
+def selection_date_range(selection):
+    """[start, end) CREATED_DATE range covering the weeks (or days) of a cube selection,
+    (None, None) when nothing is selected."""
+    if "iso_week" in selection:
+        # %Y-W%W weeks start on Monday, week 00 holds the days before the first Monday
+        mondays = [pd.Timestamp(datetime.strptime(f"{week}-1", "%Y-W%W-%w")) for week in selection["iso_week"]]
+        if not mondays:
+            return None, None
+        return min(mondays), max(mondays) + pd.Timedelta(days=7)
+
+    days = pd.to_datetime(pd.Index(selection["day_date"]))
+    if days.empty:
+        return None, None
+    return days.min(), days.max() + pd.Timedelta(days=1)
+
+
+def raw_transaction_chunks(selection, database_url=DATABASE_URL, chunksize=EXPORT_CHUNKSIZE):
+    """Transactions behind a dashboard slice, read from fincrime.db chunk by chunk.
+
+    `selection` is the cube selection of the dashboard: iso_week (or day_date), country and
+    transaction_type. The date range is pushed down to the CREATED_DATE index, the remaining
+    filters are applied per chunk.
+    """
+    start, end = selection_date_range(selection)
+    if start is None:
+        return
+    if "iso_week" in selection:
+        weeks = pd.Index(selection["iso_week"])
+    else:
+        days = pd.to_datetime(pd.Index(selection["day_date"]))
+
+    conn = connect(database_url)
+    try:
+        for chunk in read_base(conn, chunksize=chunksize, where="t.CREATED_DATE >= ? AND t.CREATED_DATE < ?",
+                               params=(start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"))):
+            mask = chunk["country"].isin(selection["country"]) & chunk["transaction_type"].isin(selection["transaction_type"])
+            if "iso_week" in selection:
+                mask &= chunk["iso_week"].isin(weeks)
+            else:
+                mask &= pd.to_datetime(chunk["day_date"]).isin(days)
+            if mask.any():
+                yield chunk.loc[mask, RAW_COLUMNS]
+    finally:
+        conn.close()
+
+
+def write_csv(chunks, fh):
+    """Write the chunks as one CSV, the header only once."""
+    header = True
+    for chunk in chunks:
+        fh.write(chunk.to_csv(index=False, header=header).encode("utf-8"))
+        header = False
+
+
+def write_parquet(chunks, fh):
+    """Write the chunks as one Parquet file, one row group per chunk."""
+    writer = None
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(fh, table.schema, compression="zstd")
+            writer.write_table(table.cast(writer.schema))
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def check_size(fh, max_bytes):
+    if fh.tell() > max_bytes:
+        raise Exception(f'Export larger than {max_bytes / 2**20:,.0f} MB, narrow the selection!')
+
+
+def capped_chunks(chunks, fh, max_bytes):
+    """Pass the chunks through while the file written so far stays under `max_bytes`."""
+    for chunk in chunks:
+        check_size(fh, max_bytes)
+        yield chunk
+
+
+def export_file(chunks, fmt="CSV", max_bytes=EXPORT_MAX_BYTES):
+    """Spool the chunks to a temporary file and return it, rewound, for a download.
+
+    Only one chunk is serialized in memory at a time while the file is written, and the export
+    stops once the file passes `max_bytes`. Streamlit still reads the finished file into memory
+    to serve it, the cap bounds that copy. The file is deleted once closed.
+    """
+    if fmt not in available_formats():
+        raise Exception(f'Export format {fmt} is not available!')
+
+    fh = tempfile.TemporaryFile()
+    try:
+        chunks = capped_chunks(chunks, fh, max_bytes)
+        if fmt == "Parquet":
+            write_parquet(chunks, fh)
+        else:
+            write_csv(chunks, fh)
+        check_size(fh, max_bytes)
+    except Exception:
+        fh.close()
+        raise
+    fh.seek(0)
+    return fh
+
+
+def raw_export_available(database_url=DATABASE_URL):
+    try:
+        return os.path.exists(sqlite_path(database_url))
+    except Exception:
+        return False
+
+
+def pdf_report(title, subtitle, kpis, charts):
+    """One-page PDF of the KPIs and chart aggregates.
+
+    `kpis` maps a label to its formatted value and `charts` maps a chart title to a
+    (frame, x column, y column, kind) tuple, kind being "line", "bar" or "barh".
+    """
+    # Imported here, matplotlib is only needed when a report is actually requested. A bare Figure,
+    # not pyplot: reports are built on concurrent script threads and pyplot's global state is not
+    # thread-safe, and the process-wide backend is left alone
+    from matplotlib.figure import Figure
+
+    rows = (len(charts) + 1) // 2
+    fig = Figure(figsize=(8.27, 11.69))  # A4 portrait
+    fig.suptitle(title, fontsize=14, fontweight="bold")
+    fig.text(0.5, 0.94, subtitle, ha="center", fontsize=9, color="#64748b")
+    for i, (label, value) in enumerate(kpis.items()):
+        fig.text(0.1 + i * 0.22, 0.9, f"{label}\n{value}", ha="left", va="top", fontsize=10)
+
+    axes = fig.subplots(max(rows, 1), 2, squeeze=False).ravel()
+    fig.subplots_adjust(top=0.8, bottom=0.1, hspace=0.6, wspace=0.35)
+    for ax in axes[len(charts):]:
+        ax.axis("off")
+
+    for ax, (chart_title, (frame, x, y, kind)) in zip(axes, charts.items()):
+        ax.set_title(chart_title, fontsize=9)
+        ax.tick_params(labelsize=7)
+        if frame.empty:
+            ax.axis("off")
+            ax.text(0.5, 0.5, "No data", ha="center", va="center", transform=ax.transAxes)
+        elif kind == "line":
+            ax.plot(frame[x].astype(str), frame[y], marker="o", color="#EF4444")
+            ax.tick_params(axis="x", rotation=45)
+        elif kind == "barh":
+            ax.barh(frame[x].astype(str), frame[y], color="#698EB8")
+        else:
+            ax.bar(frame[x].astype(str), frame[y], color="#3B82F6")
+            ax.tick_params(axis="x", rotation=45)
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="pdf")
+    return buffer.getvalue()
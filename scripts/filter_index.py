@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+
+# Dimensions the sidebar filters on
+INDEX_DIMENSIONS = ["iso_week", "country", "transaction_type"]
+
+# Bitmaps are stored as little-endian 64-bit words so row positions can be read back byte-wise
+WORD_DTYPE = np.dtype("<u8")
+
+
+def _pack(mask, n_words):
+    """Pack a boolean row mask into little-endian 64-bit words."""
+    packed = np.packbits(mask, bitorder="little")
+    words = np.zeros(n_words * 8, dtype=np.uint8)
+    words[:len(packed)] = packed
+    return words.view(WORD_DTYPE)
+
+
+class FilterIndex():
+    """Bitmap index over the filter dimensions of the base_2 frame.
+
+    One bitmap is built per distinct value of each dimension when the data is loaded.
+    A filter is then a bitwise OR of the selected values within each dimension and an
+    AND across dimensions, so each sidebar click touches n/64 words instead of running
+    `isin` string comparisons over every row.
+    """
+
+    def __init__(self, df, dimensions=None):
+        self.n_rows = len(df)
+        self.n_words = (self.n_rows + 63) // 64
+        self.dimensions = [d for d in (dimensions or INDEX_DIMENSIONS) if d in df.columns]
+
+        self.values = {}
+        self.bitmaps = {}
+        for dim in self.dimensions:
+            codes, uniques = pd.factorize(df[dim], sort=True)
+            self.values[dim] = {value: i for i, value in enumerate(uniques)}
+            self.bitmaps[dim] = np.stack(
+                [_pack(codes == i, self.n_words) for i in range(len(uniques))]
+            ) if len(uniques) else np.zeros((0, self.n_words), dtype=WORD_DTYPE)
+
+    @property
+    def nbytes(self):
+        return sum(bitmap.nbytes for bitmap in self.bitmaps.values())
+
+    def bitmap(self, **selections):
+        """Combined bitmap for the given selections, e.g. `country=["GB", "IE"]`.
+
+        Dimensions that are not passed are left unfiltered. An empty selection
+        matches no rows, the same as `isin([])`.
+        """
+        result = np.full(self.n_words, np.iinfo(np.uint64).max, dtype=WORD_DTYPE)
+
+        for dim, selected in selections.items():
+            if dim not in self.bitmaps:
+                raise KeyError(f"'{dim}' is not an indexed dimension!")
+
+            lookup = self.values[dim]
+            rows = [lookup[value] for value in selected if value in lookup]
+            if not rows:
+                return np.zeros(self.n_words, dtype=WORD_DTYPE)
+
+            result &= np.bitwise_or.reduce(self.bitmaps[dim][rows], axis=0)
+
+        # Clear the padding bits past the last row
+        if self.n_rows % 64:
+            result[-1] &= np.uint64((1 << (self.n_rows % 64)) - 1)
+        return result
+
+    def positions(self, **selections):
+        """Sorted row positions matching the selections, ready for `df.iloc`."""
+        words = self.bitmap(**selections)
+
+        # Only unpack the words that have at least one bit set
+        nonzero = np.flatnonzero(words)
+        if len(nonzero) == 0:
+            return np.empty(0, dtype=np.int64)
+
+        bits = np.unpackbits(words[nonzero].view(np.uint8), bitorder="little").reshape(-1, 64)
+        word_idx, bit_idx = np.nonzero(bits)
+        return nonzero[word_idx].astype(np.int64) * 64 + bit_idx
+
+    def mask(self, **selections):
+        """Boolean row mask matching the selections."""
+        mask = np.unpackbits(self.bitmap(**selections).view(np.uint8), bitorder="little")
+        return mask[:self.n_rows].astype(bool)
@@ -0,0 +1,225 @@
+import numpy as np
+import pandas as pd
+
+
+# 2**12 registers per sketch, i.e. a standard error of 1.04 / sqrt(4096) ~ 1.6%
+DEFAULT_PRECISION = 12
+
+
+def hash_values(values):
+    """Deterministic 64-bit hashes of the given ids (strings or numbers)."""
+    return pd.util.hash_array(np.asarray(values, dtype=object))
+
+
+def relative_error(precision=DEFAULT_PRECISION):
+    """Standard error of a HyperLogLog estimate at the given precision."""
+    return 1.04 / np.sqrt(2 ** precision)
+
+
+def _register_updates(hashes, precision):
+    """Register index and rank (position of the first set bit) for each hash."""
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    tail_bits = 64 - precision
+    index = (hashes >> np.uint64(tail_bits)).astype(np.int64)
+    tail = hashes & np.uint64((1 << tail_bits) - 1)
+
+    # bit_length through log2, corrected where the float conversion rounded up to the next power of 2
+    bit_length = np.zeros(len(tail), dtype=np.int64)
+    nonzero = tail > 0
+    bit_length[nonzero] = np.floor(np.log2(tail[nonzero].astype(np.float64))).astype(np.int64) + 1
+    too_long = nonzero & ((tail >> np.maximum(bit_length - 1, 0).astype(np.uint64)) == 0)
+    bit_length[too_long] -= 1
+
+    rank = (tail_bits - bit_length + 1).astype(np.uint8)
+    return index, rank
+
+
+class Registers():
+    """HyperLogLog registers of many groups, only the non-zero ones.
+
+    Group `g` owns the (register index, value) pairs `offsets[g]:offsets[g + 1]`, ordered by
+    register index. A group of n distinct ids sets at most min(n, 2**precision) registers, so
+    small groups cost 3 bytes per id instead of a full 2**precision array, and the sketches
+    always stay smaller than the rows they summarize.
+    """
+
+    def __init__(self, offsets, index, value, precision=DEFAULT_PRECISION):
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.index = np.asarray(index, dtype=np.uint16)
+        self.value = np.asarray(value, dtype=np.uint8)
+        self.precision = precision
+
+    @classmethod
+    def from_updates(cls, group_codes, n_groups, index, rank, precision=DEFAULT_PRECISION):
+        """Registers from (group, register index, rank) updates, the max rank of each register kept."""
+        if precision > 16:
+            raise Exception(f'HyperLogLog precision {precision} above 16 is not supported!')
+        key = (np.asarray(group_codes, dtype=np.int64) << 16) | np.asarray(index, dtype=np.int64)
+        rank = np.asarray(rank, dtype=np.uint8)
+        order = np.lexsort((rank, key))
+        key, rank = key[order], rank[order]
+        # Sorted by key then rank, the last update of each register holds its max
+        last = np.r_[key[1:] != key[:-1], True] if len(key) else np.zeros(0, dtype=bool)
+        key, rank = key[last], rank[last]
+        offsets = np.searchsorted(key >> 16, np.arange(n_groups + 1))
+        return cls(offsets, key & 0xFFFF, rank, precision)
+
+    @classmethod
+    def from_dense(cls, registers, precision=DEFAULT_PRECISION):
+        registers = np.asarray(registers)
+        groups, index = np.nonzero(registers)
+        return cls.from_updates(groups, len(registers), index, registers[groups, index], precision)
+
+    @property
+    def n_groups(self):
+        return len(self.offsets) - 1
+
+    @property
+    def nbytes(self):
+        return self.offsets.nbytes + self.index.nbytes + self.value.nbytes
+
+    def index_deltas(self):
+        """Register indexes as gaps from the previous register of the group, they compress better."""
+        deltas = np.diff(self.index.astype(np.int64), prepend=0)
+        starts = self.offsets[:-1][np.diff(self.offsets) > 0]
+        deltas[starts] = self.index[starts]
+        return deltas.astype(np.uint16)
+
+    @classmethod
+    def from_index_deltas(cls, offsets, deltas, value, precision=DEFAULT_PRECISION):
+        offsets = np.asarray(offsets, dtype=np.int64)
+        running = np.cumsum(deltas, dtype=np.int64)
+        before = np.r_[0, running][offsets[:-1]]
+        return cls(offsets, running - np.repeat(before, np.diff(offsets)), value, precision)
+
+    def groups(self):
+        """Group of each stored register."""
+        return np.repeat(np.arange(self.n_groups), np.diff(self.offsets))
+
+    def merge(self, other, rows, n_groups):
+        """Fold `other`'s groups into rows `rows` (register-wise max), over `n_groups` groups."""
+        return Registers.from_updates(np.concatenate([self.groups(), np.asarray(rows, dtype=np.int64)[other.groups()]]),
+                                      n_groups, np.concatenate([self.index, other.index]),
+                                      np.concatenate([self.value, other.value]), self.precision)
+
+    def replace(self, other, rows, n_groups):
+        """Replace rows `rows` with `other`'s groups, over `n_groups` groups."""
+        kept = ~np.isin(self.groups(), rows)
+        return Registers.from_updates(np.concatenate([self.groups()[kept], np.asarray(rows, dtype=np.int64)[other.groups()]]),
+                                      n_groups, np.concatenate([self.index[kept], other.index]),
+                                      np.concatenate([self.value[kept], other.value]), self.precision)
+
+    def merged(self, mask):
+        """Register-wise max of the groups in a boolean `mask`, as one dense register array."""
+        selected = np.repeat(np.asarray(mask, dtype=bool), np.diff(self.offsets))
+        registers = np.zeros(2 ** self.precision, dtype=np.uint8)
+        np.maximum.at(registers, self.index[selected].astype(np.int64), self.value[selected])
+        return registers
+
+
+def build_registers(group_codes, n_groups, hashes, precision=DEFAULT_PRECISION):
+    """HyperLogLog registers of `n_groups` groups from the hashes of their ids."""
+    index, rank = _register_updates(hashes, precision)
+    return Registers.from_updates(group_codes, n_groups, index, rank, precision)
+
+
+def estimate(registers):
+    """Distinct count estimate of a single (possibly merged) register array."""
+    registers = np.asarray(registers)
+    m = registers.shape[-1]
+    zeros = int((registers == 0).sum())
+    if zeros == m:
+        return 0.0
+
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.sum(np.exp2(-registers.astype(np.float64)))
+
+    # Small range correction (linear counting), which is close to exact for small groups
+    if raw <= 2.5 * m and zeros > 0:
+        return m * np.log(m / zeros)
+    return float(raw)
+
+
+class SketchSet():
+    """Mergeable distinct-count sketches for the base_2 groups.
+
+    `keys` holds one row per group (iso_week, week_date, country, transaction_type) and
+    each named sketch (users, fraudsters) holds the matching `Registers`. Any slice is
+    answered by taking the register-wise max of the selected groups and estimating the
+    merged array, so the distinct count never double counts users across groups.
+    """
+
+    def __init__(self, keys, sketches, precision=DEFAULT_PRECISION):
+        self.keys = keys.reset_index(drop=True)
+        self.sketches = sketches
+        self.precision = precision
+
+    @property
+    def nbytes(self):
+        return sum(registers.nbytes for registers in self.sketches.values())
+
+    @property
+    def error(self):
+        return relative_error(self.precision)
+
+    def save(self, path):
+        """Write the keys and the sparse registers to a single .npz file."""
+        arrays = {f"key_{col}": np.asarray(self.keys[col].astype(str), dtype=str) for col in self.keys.columns}
+        for name, registers in self.sketches.items():
+            arrays.update({f"offsets_{name}": registers.offsets, f"index_{name}": registers.index_deltas(),
+                           f"value_{name}": registers.value})
+        np.savez_compressed(path, precision=self.precision, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as npz:
+            keys = pd.DataFrame({name[4:]: npz[name] for name in npz.files if name.startswith("key_")})
+            precision = int(npz["precision"])
+            sketches = {name[8:]: Registers.from_index_deltas(npz[name], npz[f"index_{name[8:]}"],
+                                                              npz[f"value_{name[8:]}"], precision)
+                        for name in npz.files if name.startswith("offsets_")}
+            # Files written before the sparse layout hold one dense array per sketch
+            sketches.update({name[7:]: Registers.from_dense(npz[name], precision)
+                             for name in npz.files if name.startswith("sketch_")})
+        return cls(keys, sketches, precision)
+
+    @classmethod
+    def concat(cls, sets):
+        """One sketch set from sets over disjoint groups (e.g. one per week partition), the
+        registers of every set sorted into place at once rather than one upsert per set."""
+        sets = list(sets)
+        precision = sets[0].precision
+        starts = np.cumsum([0] + [len(s.keys) for s in sets])
+        sketches = {}
+        for name in sets[0].sketches:
+            parts = [s.sketches[name] for s in sets]
+            sketches[name] = Registers.from_updates(
+                np.concatenate([part.groups() + start for part, start in zip(parts, starts)]), int(starts[-1]),
+                np.concatenate([part.index for part in parts]), np.concatenate([part.value for part in parts]),
+                precision)
+        return cls(pd.concat([s.keys for s in sets], ignore_index=True), sketches, precision)
+
+    def upsert(self, other):
+        """Replace the groups present in `other` and append the new ones."""
+        cols = list(self.keys.columns)
+        lookup = pd.MultiIndex.from_frame(self.keys[cols].astype(str))
+        positions = lookup.get_indexer(pd.MultiIndex.from_frame(other.keys[cols].astype(str)))
+        existing = positions >= 0
+        positions[~existing] = len(self.keys) + np.arange((~existing).sum())
+
+        n_groups = len(self.keys) + int((~existing).sum())
+        for name, registers in self.sketches.items():
+            self.sketches[name] = registers.replace(other.sketches[name], positions, n_groups)
+        self.keys = pd.concat([self.keys, other.keys[~existing]], ignore_index=True)
+        return self
+
+    def merged(self, name, **selections):
+        """Register-wise max of the groups matching the selections (`country=["GB"]`, ...)."""
+        mask = np.ones(len(self.keys), dtype=bool)
+        for dim, selected in selections.items():
+            mask &= self.keys[dim].isin([str(v) for v in selected]).to_numpy()
+        return self.sketches[name].merged(mask)
+
+    def distinct(self, name, **selections):
+        """Estimated number of distinct ids in the selected slice."""
+        return estimate(self.merged(name, **selections))
@@ -0,0 +1,273 @@
+import argparse
+import os
+import time
+
+import pandas as pd
+
+from etl import (BASE2_COLUMNS, GROUP_KEYS, SKETCH_FILE_PATH, add_week_keys, aggregate_base2,
+                 build_sketches, connect, read_base, sort_base2)
+from alerts import refresh_alerts
+from build_base2 import build_base2
+from data_cache import atomic_path
+from db_setup import TABLES, read_chunks
+from drilldown import DRILLDOWN_INDEXES
+from hll import SketchSet
+
+
+BASE2_FILE_PATH = os.environ.get("DATA_FILE_PATH", "data/base_2_202508041440.csv")
+
+SETUP_SQL = [
+    "CREATE TABLE IF NOT EXISTS etl_state (name TEXT PRIMARY KEY, value TEXT)",
+    """CREATE TABLE IF NOT EXISTS base_2 (
+        iso_week TEXT, week_date TEXT, day_date TEXT, country TEXT, transaction_type TEXT,
+        nb_users INTEGER, nb_fraudsters INTEGER, nb_transaction INTEGER, nb_transaction_fraud INTEGER,
+        total_amount_fraud REAL, total_amount_transactions REAL,
+        pct_completed REAL, pct_failed REAL, pct_cancelled REAL, pct_refunded REAL,
+        PRIMARY KEY (iso_week, week_date, country, transaction_type)
+    )""",
+    # Watermark range scans and the per-user lookups of late fraudsters
+    "CREATE INDEX IF NOT EXISTS idx_transactions_created_date ON transactions (CREATED_DATE)",
+    "CREATE INDEX IF NOT EXISTS idx_transactions_user_id ON transactions (USER_ID)",
+    "CREATE INDEX IF NOT EXISTS idx_users_created_date ON users (CREATED_DATE)",
+    "CREATE INDEX IF NOT EXISTS idx_users_id ON users (ID)",
+    "CREATE INDEX IF NOT EXISTS idx_fraudsters_user_id ON fraudsters (USER_ID)",
+    # Covering indexes of the dashboard's aggregate SQL (sql_backend.py): week-first for the week
+    # filters, (country, type)-first when every week is selected
+    """CREATE INDEX IF NOT EXISTS idx_base_2_week_country_type ON base_2 (iso_week, country, transaction_type,
+        nb_users, nb_transaction, nb_transaction_fraud, total_amount_fraud, total_amount_transactions)""",
+    """CREATE INDEX IF NOT EXISTS idx_base_2_country_type_week ON base_2 (country, transaction_type, iso_week,
+        nb_users, nb_transaction, nb_transaction_fraud, total_amount_fraud, total_amount_transactions)""",
+    # Keyset pages of the dashboard's drill-down (drilldown.py), added to databases loaded before them
+    *DRILLDOWN_INDEXES,
+]
+
+
+def setup(conn):
+    for sql in SETUP_SQL:
+        conn.execute(sql)
+    conn.commit()
+
+
+def get_watermark(conn, table):
+    """Highest CREATED_DATE already ingested for a table."""
+    row = conn.execute("SELECT value FROM etl_state WHERE name = ?", (f"{table}_watermark",)).fetchone()
+    if row is not None:
+        return row[0]
+    return conn.execute(f"SELECT MAX(CREATED_DATE) FROM {table}").fetchone()[0]
+
+
+def set_watermark(conn, table, value):
+    conn.execute("INSERT INTO etl_state (name, value) VALUES (?, ?) "
+                 "ON CONFLICT(name) DO UPDATE SET value = excluded.value", (f"{table}_watermark", value))
+
+
+def ingest_new_rows(conn, table, csv_path, chunksize=500_000):
+    """Append the rows of `csv_path` newer than the table's high-watermark.
+
+    Rows sharing the watermark timestamp are kept only if their ID is not loaded yet.
+    Returns the ingested rows.
+    """
+    watermark = get_watermark(conn, table)
+    at_watermark = set()
+    if watermark is not None:
+        at_watermark = {r[0] for r in conn.execute(f"SELECT ID FROM {table} WHERE CREATED_DATE = ?", (watermark,))}
+
+    new_rows = []
+    # Same column types as db_setup.py, so appended rows compare like the initial load
+    for chunk in read_chunks(csv_path, TABLES[table]["dtypes"], chunksize):
+        if watermark is not None:
+            chunk = chunk[(chunk["CREATED_DATE"] > watermark) |
+                          ((chunk["CREATED_DATE"] == watermark) & ~chunk["ID"].isin(at_watermark))]
+        if not chunk.empty:
+            chunk.to_sql(table, conn, if_exists="append", index=False)
+            new_rows.append(chunk)
+
+    if not new_rows:
+        return pd.DataFrame()
+    new_rows = pd.concat(new_rows, ignore_index=True)
+    set_watermark(conn, table, new_rows["CREATED_DATE"].max())
+    return new_rows
+
+
+def ingest_fraudsters(conn, csv_path):
+    """Insert the fraudsters not flagged yet and return their user ids."""
+    flagged = {r[0] for r in conn.execute("SELECT USER_ID FROM fraudsters")}
+    fraudsters = pd.read_csv(csv_path, dtype=str)
+    new = fraudsters[~fraudsters["USER_ID"].isin(flagged)].drop_duplicates("USER_ID")
+    if not new.empty:
+        new.to_sql("fraudsters", conn, if_exists="append", index=False)
+    return new["USER_ID"].tolist()
+
+
+def _in_clause(values):
+    return ", ".join("?" * len(values))
+
+
+def affected_keys_for_transactions(conn, transactions, batch_size=900):
+    """Group keys of the new transactions, with the country looked up on the users index."""
+    user_ids = transactions["USER_ID"].unique().tolist()
+    countries = []
+    for i in range(0, len(user_ids), batch_size):
+        batch = user_ids[i:i + batch_size]
+        countries.append(pd.read_sql_query(
+            f"SELECT ID AS user_id, COUNTRY AS country FROM users WHERE ID IN ({_in_clause(batch)})",
+            conn, params=batch))
+
+    # Inner merge, transactions of unknown users are dropped by the JOIN in query_eda.sql too
+    base = transactions.rename(columns={"USER_ID": "user_id", "CREATED_DATE": "created_date",
+                                        "TYPE": "transaction_type"})
+    base = base.merge(pd.concat(countries), on="user_id")
+    if base.empty:
+        return pd.DataFrame(columns=GROUP_KEYS)
+    return add_week_keys(base)[GROUP_KEYS].drop_duplicates()
+
+
+def affected_keys_for_users(conn, user_ids, batch_size=900):
+    """Group keys of every transaction made by the given users."""
+    keys = []
+    for i in range(0, len(user_ids), batch_size):
+        batch = list(user_ids[i:i + batch_size])
+        base = read_base(conn, where=f"t.USER_ID IN ({_in_clause(batch)})", params=batch)
+        keys.append(base[GROUP_KEYS])
+    return pd.concat(keys).drop_duplicates() if keys else pd.DataFrame(columns=GROUP_KEYS)
+
+
+def recompute_groups(conn, keys):
+    """Recompute the base_2 rows (and base rows) of the given groups only.
+
+    Groups never span more than one week, so each (week, transaction type) of the keys is one
+    range seek on the (TYPE, CREATED_DATE, ID) index, joined with the users of the affected
+    countries only: a late fraudster re-reads their own groups, not every transaction of
+    their weeks.
+    """
+    parts = []
+    for (week_date, transaction_type), group_keys in keys.groupby(["week_date", "transaction_type"], sort=True):
+        start = pd.Timestamp(week_date)
+        end = start + pd.Timedelta(days=7)
+        countries = group_keys["country"].unique().tolist()
+        base = read_base(conn, where=f"t.TYPE = ? AND t.CREATED_DATE >= ? AND t.CREATED_DATE < ? "
+                                     f"AND u.COUNTRY IN ({_in_clause(countries)})",
+                         params=[transaction_type, start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"), *countries])
+        # A Monday-based week can hold two %W weeks around the new year, keys are matched exactly
+        in_keys = pd.MultiIndex.from_frame(base[GROUP_KEYS]).isin(pd.MultiIndex.from_frame(group_keys[GROUP_KEYS]))
+        parts.append(base[in_keys])
+
+    return pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+
+
+def upsert_base2(conn, base2):
+    placeholders = ", ".join("?" * len(BASE2_COLUMNS))
+    updates = ", ".join(f"{c} = excluded.{c}" for c in BASE2_COLUMNS if c not in GROUP_KEYS)
+    conn.executemany(
+        f"INSERT INTO base_2 ({', '.join(BASE2_COLUMNS)}) VALUES ({placeholders}) "
+        f"ON CONFLICT({', '.join(GROUP_KEYS)}) DO UPDATE SET {updates}",
+        base2[BASE2_COLUMNS].astype(object).itertuples(index=False, name=None)
+    )
+
+
+def export_base2(conn, csv_path=BASE2_FILE_PATH):
+    """Write the base_2 table to the CSV the dashboard reads (ordered like query_eda.sql)."""
+    base2 = pd.read_sql_query(f"SELECT {', '.join(BASE2_COLUMNS)} FROM base_2", conn)
+    with atomic_path(csv_path) as tmp_path:
+        sort_base2(base2).to_csv(tmp_path, index=False)
+    return len(base2)
+
+
+def update_sketches(base, sketch_path=SKETCH_FILE_PATH):
+    """Replace the sketches of the recomputed groups in the sketch file."""
+    if not os.path.exists(sketch_path):
+        return
+    sketches = SketchSet.load(sketch_path)
+    sketches.upsert(build_sketches([base], sketches.precision))
+    sketches.save(sketch_path)
+
+
+def full_refresh(conn):
+    """Rebuild the whole base_2 table, used when it does not exist yet."""
+    conn.execute("DELETE FROM base_2")
+    base2, sketches = build_base2(with_sketches=True)
+    upsert_base2(conn, base2)
+    if sketches is not None:
+        sketches.save(SKETCH_FILE_PATH)
+    for table in ["transactions", "users"]:
+        watermark = conn.execute(f"SELECT MAX(CREATED_DATE) FROM {table}").fetchone()[0]
+        if watermark is not None:
+            set_watermark(conn, table, watermark)
+    return len(base2)
+
+
+def incremental_refresh(conn, transactions_csv=None, users_csv=None, fraudsters_csv=None):
+    """Ingest the day's delta and upsert the affected base_2 groups.
+
+    Returns a small report of what was ingested and recomputed.
+    """
+    report = {"new_users": 0, "new_transactions": 0, "new_fraudsters": 0, "groups": 0}
+
+    # Users first, so the new transactions find their country in the join
+    if users_csv:
+        report["new_users"] = len(ingest_new_rows(conn, "users", users_csv))
+
+    keys = [pd.DataFrame(columns=GROUP_KEYS)]
+    if transactions_csv:
+        new_transactions = ingest_new_rows(conn, "transactions", transactions_csv)
+        report["new_transactions"] = len(new_transactions)
+        if not new_transactions.empty:
+            keys.append(affected_keys_for_transactions(conn, new_transactions))
+
+    # A late fraudster only re-flags the groups that user transacted in
+    if fraudsters_csv:
+        new_fraudsters = ingest_fraudsters(conn, fraudsters_csv)
+        report["new_fraudsters"] = len(new_fraudsters)
+        if new_fraudsters:
+            keys.append(affected_keys_for_users(conn, new_fraudsters))
+
+    keys = pd.concat(keys).drop_duplicates()
+    if not keys.empty:
+        base = recompute_groups(conn, keys)
+        base2 = aggregate_base2(base)
+        upsert_base2(conn, base2)
+        update_sketches(base)
+        report["groups"] = len(base2)
+
+    conn.commit()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incremental refresh of base_2 from the day's new rows.")
+    parser.add_argument("--transactions", help="CSV with new transactions (same columns as transactions.csv)")
+    parser.add_argument("--users", help="CSV with new users (same columns as users.csv)")
+    parser.add_argument("--fraudsters", help="CSV with the fraudsters list, only unseen USER_IDs are added")
+    parser.add_argument("--full", action="store_true", help="Rebuild base_2 from scratch")
+    parser.add_argument("--output", default=BASE2_FILE_PATH, help="base_2 CSV read by the dashboard")
+    args = parser.parse_args()
+    deltas = [name for name in ["transactions", "users", "fraudsters"] if getattr(args, name)]
+    if args.full and deltas:
+        parser.error("--full rebuilds base_2 from fincrime.db and ingests no delta, "
+                     "run it without --transactions/--users/--fraudsters")
+
+    start = time.perf_counter()
+    conn = connect()
+    try:
+        setup(conn)
+        full = args.full or conn.execute("SELECT COUNT(*) FROM base_2").fetchone()[0] == 0
+        if full and deltas:
+            # The first run sets the watermarks from the loaded tables, ingesting the deltas
+            # before that could append rows db_setup.py already loaded
+            raise Exception(f'base_2 is empty, the --{"/--".join(deltas)} rows were not ingested: run '
+                            'incremental_etl.py once without them to build base_2, then ingest the deltas!')
+        if full:
+            print(f"Full refresh: {full_refresh(conn)} groups")
+            conn.commit()
+        else:
+            report = incremental_refresh(conn, args.transactions, args.users, args.fraudsters)
+            print(f"Ingested {report['new_transactions']} transactions, {report['new_users']} users, "
+                  f"{report['new_fraudsters']} fraudsters -> {report['groups']} groups upserted")
+        rows = export_base2(conn, args.output)
+        # Only the weeks the state has not seen yet are scored
+        alerts = refresh_alerts(conn)
+    finally:
+        conn.close()
+
+    print(f"{rows} base_2 rows exported to {args.output} in {time.perf_counter() - start:.1f}s")
+    print(f"{len(alerts)} fraud alerts raised")
@@ -0,0 +1,292 @@
+import atexit
+import functools
+import json
+import os
+import socket
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from data_cache import atomic_path
+
+try:
+    import resource
+except ImportError:  # not available on Windows, the RSS then comes from /proc only
+    resource = None
+
+
+# Sink of the per-rerun metrics: a Prometheus text file per process (overwritten, for a
+# textfile collector) or a JSON-lines log shared by the processes (one line per rerun).
+# An empty path disables the sink.
+METRICS_FILE_PATH = os.environ.get("METRICS_FILE_PATH", "data/dashboard_metrics.prom")
+METRICS_FORMAT = os.environ.get("METRICS_FORMAT", "prometheus")
+# Name of this dashboard process, labels its metrics and names its Prometheus file, so
+# replicas on one host never overwrite each other's counters
+METRICS_PROCESS = os.environ.get("METRICS_PROCESS", f"{socket.gethostname()}-{os.getpid()}")
+
+# Process-wide counters, shared by every session of this Streamlit process. The sink is written
+# under a lock of its own, so the cached functions never wait on the disk
+_lock = threading.Lock()
+_write_lock = threading.Lock()
+_metrics_files = set()
+_cache_calls = Counter()
+_cache_misses = Counter()
+_span_seconds = Counter()
+_span_count = Counter()
+_runs = Counter()
+
+# Run the spans of the current thread are recorded to (one script run per thread)
+_local = threading.local()
+
+
+def process_rss():
+    """Resident set size of the process in bytes (peak RSS where /proc is not available)."""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def cache_stats():
+    """Cumulative calls, hits and misses of every counted cached function."""
+    with _lock:
+        return {name: {"calls": calls, "hits": calls - _cache_misses[name], "misses": _cache_misses[name]}
+                for name, calls in _cache_calls.items()}
+
+
+def counted_cache(cache_decorator, name=None):
+    """Apply a Streamlit cache decorator (e.g. `st.cache_data(max_entries=256)`) and count the
+    calls and misses of the function.
+
+    The function body only runs on a miss, so misses are counted inside the cached function and
+    calls around it, the rest are hits. The body runs as a span of the current run.
+    """
+    def decorate(function):
+        label = name or function.__name__
+
+        @functools.wraps(function)
+        def body(*args, **kwargs):
+            with _lock:
+                _cache_misses[label] += 1
+            with span(label):
+                return function(*args, **kwargs)
+
+        cached = cache_decorator(body)
+
+        @functools.wraps(function)
+        def call(*args, **kwargs):
+            with _lock:
+                _cache_calls[label] += 1
+            return cached(*args, **kwargs)
+
+        call.clear = cached.clear
+        return call
+    return decorate
+
+
+@contextmanager
+def span(name):
+    """Time a block as a span of the run of the current thread (no-op outside a run)."""
+    run = getattr(_local, "run", None)
+    if run is None or run.closed:
+        yield
+        return
+    with run.span(name):
+        yield
+
+
+def timed_fragment(function):
+    """Run a fragment function as a span of the current run. When Streamlit reruns the fragment
+    on its own, the script run is already closed and the fragment gets a run of its own."""
+    @functools.wraps(function)
+    def run(*args, **kwargs):
+        current = getattr(_local, "run", None)
+        if current is not None and not current.closed:
+            with current.span(function.__name__):
+                return function(*args, **kwargs)
+
+        fragment_run = RunMetrics(f"fragment:{function.__name__}")
+        try:
+            with fragment_run.span(function.__name__):
+                return function(*args, **kwargs)
+        finally:
+            fragment_run.close()
+    return run
+
+
+class RunMetrics():
+    """Timing spans and gauges of one script run (a full rerun or a fragment rerun).
+
+    Spans are recorded flat by name, a span's time includes the spans run inside it (e.g.
+    "type_section" includes "type_figure" when the figure was not cached).
+    """
+
+    def __init__(self, kind="rerun"):
+        self.kind = kind
+        self.started = time.perf_counter()
+        self.timestamp = datetime.now(timezone.utc).isoformat(timespec="milliseconds")
+        self.spans = {}
+        self.gauges = {}
+        self.closed = False
+        self._open = {}
+        self._cache_start = cache_stats()
+        _local.run = self
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans[name] = self.spans.get(name, 0.0) + time.perf_counter() - start
+
+    def begin(self, name):
+        """Start a span around top-level script code, closed by `end(name)`."""
+        self._open[name] = time.perf_counter()
+
+    def end(self, name):
+        start = self._open.pop(name, None)
+        if start is not None:
+            self.spans[name] = self.spans.get(name, 0.0) + time.perf_counter() - start
+
+    def gauge(self, name, value):
+        self.gauges[name] = value
+
+    def cache_deltas(self):
+        """Hits and misses of the counted cached functions during this run."""
+        deltas = {}
+        for label, stats in cache_stats().items():
+            before = self._cache_start.get(label, {"hits": 0, "misses": 0})
+            hits, misses = stats["hits"] - before["hits"], stats["misses"] - before["misses"]
+            if hits or misses:
+                deltas[label] = {"hits": hits, "misses": misses}
+        return deltas
+
+    def snapshot(self):
+        return {
+            "timestamp": self.timestamp,
+            "process": METRICS_PROCESS,
+            "kind": self.kind,
+            "seconds": round(time.perf_counter() - self.started, 6),
+            "spans": {name: round(seconds, 6) for name, seconds in self.spans.items()},
+            "cache": self.cache_deltas(),
+            "rss_bytes": process_rss(),
+            **self.gauges,
+        }
+
+    def close(self, path=METRICS_FILE_PATH, fmt=METRICS_FORMAT):
+        """End the run, add it to the process totals and write it to the sink."""
+        if self.closed:
+            return None
+        self.closed = True
+        snapshot = self.snapshot()
+        with _lock:
+            _runs[self.kind] += 1
+            for name, seconds in self.spans.items():
+                _span_seconds[name] += seconds
+                _span_count[name] += 1
+        if path:
+            write_metrics(snapshot, path, fmt)
+        if getattr(_local, "run", None) is self:
+            _local.run = None
+        return snapshot
+
+
+def prometheus_text(snapshot):
+    """Process totals and the gauges of the last run in the Prometheus text exposition format,
+    every series labelled with the process. The caller holds `_lock`."""
+    process = f'process="{snapshot.get("process", METRICS_PROCESS)}"'
+    lines = [
+        "# HELP dashboard_runs_total Script runs by kind (full rerun or fragment).",
+        "# TYPE dashboard_runs_total counter",
+        *[f'dashboard_runs_total{{{process},kind="{kind}"}} {count}' for kind, count in sorted(_runs.items())],
+        "# HELP dashboard_span_seconds Time spent in each span of the runs.",
+        "# TYPE dashboard_span_seconds summary",
+    ]
+    for name in sorted(_span_seconds):
+        lines.append(f'dashboard_span_seconds_sum{{{process},span="{name}"}} {_span_seconds[name]:.6f}')
+        lines.append(f'dashboard_span_seconds_count{{{process},span="{name}"}} {_span_count[name]}')
+
+    lines += ["# HELP dashboard_cache_calls_total Calls of the cached functions by result.",
+              "# TYPE dashboard_cache_calls_total counter"]
+    for name in sorted(_cache_calls):
+        misses = _cache_misses[name]
+        lines.append(f'dashboard_cache_calls_total{{{process},function="{name}",result="hit"}} {_cache_calls[name] - misses}')
+        lines.append(f'dashboard_cache_calls_total{{{process},function="{name}",result="miss"}} {misses}')
+
+    for name, value in snapshot.items():
+        if name.endswith("_bytes") and value is not None:
+            lines += [f"# TYPE dashboard_{name} gauge", f"dashboard_{name}{{{process}}} {value}"]
+    return "\n".join(lines) + "\n"
+
+
+def process_metrics_path(path, process=METRICS_PROCESS):
+    """Prometheus file of one process, e.g. data/dashboard_metrics.<host>-<pid>.prom."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{process}{ext}"
+
+
+def remove_stale_metrics(path=METRICS_FILE_PATH):
+    """Remove the Prometheus files of the dead processes of this host (named `<host>-<pid>`), so
+    the textfile collector does not keep exporting their series next to the live ones. Files
+    named through METRICS_PROCESS are left alone."""
+    # os.kill(pid, 0) terminates the process on Windows instead of probing it
+    if os.name == "nt":
+        return
+    folder = os.path.dirname(path) or "."
+    root, ext = os.path.splitext(os.path.basename(path))
+    prefix = f"{root}.{socket.gethostname()}-"
+    for name in os.listdir(folder):
+        pid = name[len(prefix):len(name) - len(ext)] if name.startswith(prefix) and name.endswith(ext) else ""
+        if not pid.isdigit() or int(pid) == os.getpid():
+            continue
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            _remove(os.path.join(folder, name))
+        except PermissionError:  # alive, run by another user
+            pass
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def write_metrics(snapshot, path=METRICS_FILE_PATH, fmt=METRICS_FORMAT):
+    """Append the run to a JSON-lines file, or rewrite the Prometheus text file of this process
+    atomically (through a temp file of its own).
+
+    The first time a process writes its Prometheus file, the files of dead processes are removed
+    and its own is set to be removed when it exits.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if fmt not in ("prometheus", "jsonl"):
+        raise Exception(f'Unknown metrics format {fmt}, expected "prometheus" or "jsonl"!')
+
+    with _write_lock:
+        if fmt == "jsonl":
+            with open(path, "a") as fh:
+                fh.write(json.dumps(snapshot) + "\n")
+            return
+
+        process_path = process_metrics_path(path, snapshot.get("process", METRICS_PROCESS))
+        if process_path not in _metrics_files:
+            remove_stale_metrics(path)
+            atexit.register(_remove, process_path)
+            _metrics_files.add(process_path)
+        # Latest totals, rendered under the counters' lock but written outside of it
+        with _lock:
+            text = prometheus_text(snapshot)
+        with atomic_path(process_path) as tmp_path:
+            with open(tmp_path, "w") as fh:
+                fh.write(text)
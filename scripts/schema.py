@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+
+
+# Explicit schema for the aggregated base_2 frame
+# - dimensions are low-cardinality labels, stored as pandas Categoricals
+# - counts are additive integers, downcast to the smallest integer type that holds them
+# - amounts are additive money columns, kept float64: they are decimal amounts (12.34), not whole
+#   pence, so float32 cannot hold them exactly and its sums drift on slices of any size
+# - ratios are non-additive percentages, downcast whenever the values round-trip
+# The version is bumped whenever a cast changes, prepared files written with the old one are rebuilt
+BASE2_SCHEMA = {
+    "version": 2,
+    "dimensions": ["iso_week", "country", "transaction_type"],
+    "counts": ["nb_users", "nb_fraudsters", "nb_transaction", "nb_transaction_fraud"],
+    "amounts": ["total_amount_fraud", "total_amount_transactions"],
+    "ratios": ["pct_completed", "pct_failed", "pct_cancelled", "pct_refunded"],
+}
+
+# Percentages are rounded to 2 decimals by the SQL query, so half a hundredth is the precision we must keep
+FLOAT_TOLERANCE = 0.005
+
+
+def frame_bytes(df):
+    """Deep memory footprint of a dataframe in bytes."""
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+
+def _downcast_integer(series):
+    if series.isna().any():
+        return series
+    kind = "unsigned" if (series >= 0).all() else "integer"
+    return pd.to_numeric(series, downcast=kind)
+
+
+def _float32_roundtrips(series):
+    values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+    as_float32 = values.astype(np.float32).astype(np.float64)
+    return bool(np.nanmax(np.abs(values - as_float32), initial=0.0) <= FLOAT_TOLERANCE)
+
+
+def _downcast_ratio(series):
+    return series.astype(np.float32) if _float32_roundtrips(series) else series
+
+
+def apply_schema(df, schema=BASE2_SCHEMA):
+    """Cast the base_2 frame to its compact schema and record the bytes saved.
+
+    Columns missing from the frame are skipped, so the daily fallback structure works too.
+    The report is stored in `df.attrs["schema_report"]` and survives `st.cache_data`.
+    """
+    bytes_before = frame_bytes(df)
+    df = df.copy()
+
+    for col in schema["dimensions"]:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+
+    for col in schema["counts"]:
+        if col in df.columns:
+            df[col] = _downcast_integer(df[col])
+
+    # Dashboard KPIs sum these columns, and pandas sums float32 in float32
+    for col in schema["amounts"]:
+        if col in df.columns:
+            df[col] = df[col].astype(np.float64)
+
+    for col in schema["ratios"]:
+        if col in df.columns:
+            df[col] = _downcast_ratio(df[col])
+
+    bytes_after = frame_bytes(df)
+    df.attrs["schema_report"] = {
+        "bytes_before": bytes_before,
+        "bytes_after": bytes_after,
+        "bytes_saved": bytes_before - bytes_after,
+        "dtypes": {col: str(dtype) for col, dtype in df.dtypes.items()},
+    }
+    return df
+
+
+def format_bytes(n):
+    """Human readable byte count (e.g. 12.3 MB)."""
+    for unit in ["B", "KB", "MB", "GB"]:
+        if abs(n) < 1024 or unit == "GB":
+            return f"{n:,.1f} {unit}" if unit != "B" else f"{n:,.0f} {unit}"
+        n /= 1024
+
+
+if __name__ == "__main__":
+    import sys
+
+    from data_cache import read_base2
+
+    path = sys.argv[1] if len(sys.argv) > 1 else "data/base_2_202508041440.csv"
+    report = apply_schema(read_base2(path)).attrs["schema_report"]
+
+    print(f"Before: {format_bytes(report['bytes_before'])}")
+    print(f"After:  {format_bytes(report['bytes_after'])}")
+    print(f"Saved:  {format_bytes(report['bytes_saved'])}")
+    for col, dtype in report["dtypes"].items():
+        print(f"  {col:<28}{dtype}")
@@ -0,0 +1,178 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from urllib.request import pathname2url
+
+import numpy as np
+import pandas as pd
+
+from cube import CUBE_DIMENSIONS, CUBE_MEASURES
+from etl import BASE2_COLUMNS, DATABASE_URL, sqlite_path
+
+
+# Read-only connections kept open per process, and SQL statements each one keeps compiled
+SQL_POOL_SIZE = int(os.environ.get("SQL_POOL_SIZE", "4"))
+STATEMENT_CACHE_SIZE = 256
+ROW_CHUNKSIZE = 100_000
+
+
+class ConnectionPool():
+    """Pool of read-only SQLite connections shared by every session of the process.
+
+    Connections are opened with `mode=ro` and `query_only`, so the dashboard can never write
+    to fincrime.db, and each one keeps its compiled statements (sqlite3's statement cache).
+    The most recently returned connection is handed out first, its statements are the warmest.
+    """
+
+    def __init__(self, database_url=DATABASE_URL, size=SQL_POOL_SIZE, cached_statements=STATEMENT_CACHE_SIZE):
+        path = sqlite_path(database_url)
+        if not os.path.exists(path):
+            raise Exception(f'Database {path} does not exist, run db_setup.py and incremental_etl.py first!')
+
+        self.path = path
+        self.size = size
+        self.cached_statements = cached_statements
+        self._uri = f"file:{pathname2url(os.path.abspath(path))}?mode=ro"
+        self._idle = []
+        self._opened = 0
+        self._closed = False
+        self._available = threading.Condition()
+
+    def _connect(self):
+        conn = sqlite3.connect(self._uri, uri=True, check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection, waiting for one to be returned when all of them are in use.
+        Raises once the pool is closed, waiters included."""
+        with self._available:
+            while True:
+                if self._closed:
+                    raise Exception(f'The connection pool of {self.path} is closed!')
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._opened < self.size:
+                    self._opened += 1
+                    conn = None
+                    break
+                self._available.wait()
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except BaseException:
+                with self._available:
+                    self._opened -= 1
+                    self._available.notify()
+                raise
+        try:
+            yield conn
+        finally:
+            with self._available:
+                if self._closed:
+                    conn.close()
+                else:
+                    self._idle.append(conn)
+                    self._available.notify()
+
+    def close(self):
+        """Close the idle connections and wake the waiting threads, the borrowed connections are
+        closed when they are returned."""
+        with self._available:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._available.notify_all()
+        for conn in idle:
+            conn.close()
+
+
+class SqlCube():
+    """Same interface as `Cube`, answered by aggregate SQL on the base_2 table of fincrime.db.
+
+    Selections become `IN (SELECT value FROM json_each(?))` filters with the selected values
+    as one JSON parameter, so a statement's text only depends on the measures, the `by`
+    dimensions and which dimensions are filtered, and stays in the statement cache whatever
+    values are picked. Only the rolled-up rows are fetched, the base_2 rows stay in SQLite.
+    """
+
+    def __init__(self, pool, dimensions=None, measures=None, table="base_2"):
+        self.pool = pool
+        self.table = table
+        self.dimensions = list(dimensions or CUBE_DIMENSIONS)
+
+        with pool.connection() as conn:
+            columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if not columns:
+                raise Exception(f'No {table} table in {pool.path}, run incremental_etl.py first!')
+            self.n_rows = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            self.labels = {dim: np.asarray([row[0] for row in conn.execute(
+                f"SELECT DISTINCT {dim} FROM {table} WHERE {dim} IS NOT NULL ORDER BY {dim}")], dtype=object)
+                for dim in self.dimensions}
+
+        self.measures = [m for m in (measures or CUBE_MEASURES) if m in columns]
+
+    @property
+    def nbytes(self):
+        return sum(len(labels) * 8 for labels in self.labels.values())
+
+    def _where(self, selections):
+        unknown = set(selections) - set(self.dimensions)
+        if unknown:
+            raise KeyError(f"Unknown cube dimensions: {sorted(unknown)}")
+
+        clauses, params = [], []
+        for dim in self.dimensions:
+            if dim in selections:
+                clauses.append(f"{dim} IN (SELECT value FROM json_each(?))")
+                params.append(json.dumps([str(value) for value in selections[dim]]))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def totals(self, measures=None, **selections):
+        """Grand totals of the measures over the selected slice, e.g. `totals(country=["GB"])`."""
+        measures = measures or list(self.measures)
+        where, params = self._where(selections)
+        sql = f"SELECT {', '.join(f'COALESCE(SUM({m}), 0)' for m in measures)} FROM {self.table}{where}"
+        with self.pool.connection() as conn:
+            row = conn.execute(sql, params).fetchone()
+        return dict(zip(measures, row))
+
+    def query(self, measures=None, by=None, **selections):
+        """Roll the selected slice up to the `by` dimensions, one row per non-empty group sorted by
+        the `by` labels, like `Cube.query`."""
+        by = [by] if isinstance(by, str) else list(by or [])
+        unknown = set(by) - set(self.dimensions)
+        if unknown:
+            raise KeyError(f"Unknown cube dimensions: {sorted(unknown)}")
+
+        measures = measures or list(self.measures)
+        where, params = self._where(selections)
+        group = f" GROUP BY {', '.join(by)} ORDER BY {', '.join(by)}" if by else " HAVING COUNT(*) > 0"
+        sql = f"SELECT {', '.join(by + [f'SUM({m})' for m in measures])} FROM {self.table}{where}{group}"
+        with self.pool.connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return pd.DataFrame(rows, columns=by + measures)
+
+    def row_chunks(self, chunksize=ROW_CHUNKSIZE, **selections):
+        """base_2 rows of the selected slice (ordered like query_eda.sql), `chunksize` at a time."""
+        where, params = self._where(selections)
+        sql = (f"SELECT {', '.join(BASE2_COLUMNS)} FROM {self.table}{where} "
+               "ORDER BY iso_week DESC, country, transaction_type")
+        with self.pool.connection() as conn:
+            cursor = conn.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(chunksize)
+                if not rows:
+                    return
+                yield pd.DataFrame(rows, columns=BASE2_COLUMNS)
+
+
+def database_version(database_url=DATABASE_URL):
+    """Hashable version of fincrime.db, changes whenever the ETL writes to it."""
+    stat = os.stat(sqlite_path(database_url))
+    return (os.path.abspath(sqlite_path(database_url)), stat.st_mtime_ns, stat.st_size)
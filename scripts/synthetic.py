@@ -0,0 +1,291 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+
+# Share of the users per signup country, and how much likelier a user of that country is to be
+# a fraudster (IE and CY lead the fraud rankings of the Kaggle sample)
+COUNTRY_MIX = {
+    "GB": 0.34, "FR": 0.09, "PL": 0.08, "LT": 0.06, "IE": 0.06, "ES": 0.05, "RO": 0.05,
+    "CZ": 0.04, "DE": 0.04, "CH": 0.03, "IT": 0.03, "PT": 0.03, "CY": 0.02, "BG": 0.02,
+    "HU": 0.02, "NL": 0.02, "BE": 0.02,
+}
+COUNTRY_FRAUD_WEIGHT = {"IE": 4.0, "CY": 6.0}
+
+# Transaction types of legitimate users and of fraudsters (who mostly top up)
+TYPE_MIX = {"CARD_PAYMENT": 0.58, "TOPUP": 0.21, "TRANSFER": 0.10, "EXCHANGE": 0.05, "ATM": 0.04, "FEE": 0.02}
+FRAUD_TYPE_MIX = {"CARD_PAYMENT": 0.20, "TOPUP": 0.55, "TRANSFER": 0.15, "EXCHANGE": 0.02, "ATM": 0.08, "FEE": 0.00}
+STATE_MIX = {"COMPLETED": 0.88, "DECLINED": 0.06, "FAILED": 0.03, "REVERTED": 0.03}
+
+# Log-normal GBP amounts per type (mean and sigma of the log)
+AMOUNT_PARAMS = {
+    "CARD_PAYMENT": (2.6, 1.1), "TOPUP": (3.9, 1.0), "TRANSFER": (3.8, 1.3),
+    "EXCHANGE": (3.5, 1.2), "ATM": (3.7, 0.6), "FEE": (1.0, 0.8),
+}
+
+# Currency of the signup country, other transactions are in one of the travel currencies
+HOME_CURRENCY = {"GB": "GBP", "PL": "PLN", "RO": "RON", "CZ": "CZK", "CH": "CHF", "BG": "BGN", "HU": "HUF"}
+TRAVEL_CURRENCIES = ["EUR", "GBP", "USD"]
+HOME_CURRENCY_SHARE = 0.85
+
+# Rough 2019 exchange rates, AMOUNT is AMOUNT_GBP in the minor units (1/100) of CURRENCY
+GBP_RATES = {"GBP": 1.0, "EUR": 1.16, "USD": 1.30, "PLN": 4.98, "RON": 5.52, "CZK": 29.8, "CHF": 1.31,
+             "BGN": 2.27, "HUF": 372.0}
+
+# Card payments and ATM withdrawals have a merchant, in the user's country most of the time
+# (ISO alpha-3 codes, like the Kaggle sample); other types have no merchant fields
+MERCHANT_TYPES = ["CARD_PAYMENT", "ATM"]
+COUNTRY_ISO3 = {
+    "GB": "GBR", "FR": "FRA", "PL": "POL", "LT": "LTU", "IE": "IRL", "ES": "ESP", "RO": "ROU",
+    "CZ": "CZE", "DE": "DEU", "CH": "CHE", "IT": "ITA", "PT": "PRT", "CY": "CYP", "BG": "BGR",
+    "HU": "HUN", "NL": "NLD", "BE": "BEL",
+}
+HOME_MERCHANT_SHARE = 0.8
+MERCHANT_CATEGORY_MIX = {
+    "restaurant": 0.16, "supermarket": 0.15, "cafe": 0.10, "bar": 0.08, "store": 0.10,
+    "point_of_interest": 0.12, "grocery_or_supermarket": 0.08, "lodging": 0.05, "transit_station": 0.06,
+    "gas_station": 0.05, "food": 0.05,
+}
+# Card entry methods (chip, contactless, manual/online, mobile contactless, magnetic stripe),
+# fraudsters key card numbers in more often; non-card transactions are "misc"
+ENTRY_METHOD_MIX = {"chip": 0.38, "cont": 0.30, "manu": 0.18, "mcon": 0.08, "mags": 0.04, "misc": 0.02}
+FRAUD_ENTRY_METHOD_MIX = {"chip": 0.15, "cont": 0.10, "manu": 0.60, "mcon": 0.05, "mags": 0.08, "misc": 0.02}
+# Processing system of each transaction type
+SOURCE_MIX = {
+    "CARD_PAYMENT": {"GAIA": 0.85, "HERA": 0.15}, "ATM": {"GAIA": 1.0},
+    "TOPUP": {"MINOS": 0.45, "APOLLO": 0.35, "HERA": 0.20}, "TRANSFER": {"CRONUS": 0.6, "INTERNAL": 0.4},
+    "EXCHANGE": {"INTERNAL": 1.0}, "FEE": {"INTERNAL": 0.7, "LIMOS": 0.3},
+}
+
+# User profile fields of the Kaggle sample, fraudsters (legitimate, fraudster) differ on most
+HAS_EMAIL_SHARE = (0.92, 0.80)
+LOCKED_SHARE = (0.01, 0.90)
+KYC_MIX = {"PASSED": 0.72, "NONE": 0.18, "PENDING": 0.05, "FAILED": 0.05}
+FRAUD_KYC_MIX = {"PASSED": 0.45, "NONE": 0.25, "PENDING": 0.10, "FAILED": 0.20}
+# Terms accepted, "" for users who never accepted a versioned one
+TERMS_VERSION_MIX = {"2018-09-20": 0.30, "2018-05-25": 0.45, "2018-03-20": 0.10, "2017-02-02": 0.05, "": 0.10}
+# Age at 2019 (normal, mean and sigma) and mean failed sign-in attempts (Poisson)
+AGE_PARAMS = ((34, 11), (29, 8))
+FAILED_SIGN_IN_MEAN = (0.05, 0.4)
+# Share of users whose phone number is from another country than their signup country
+FOREIGN_PHONE_SHARE = 0.05
+# Numbers of the +44 calling code can be from any of these, the Kaggle sample lists them all
+PHONE_COUNTRY = {"GB": "GB||JE||IM||GG"}
+
+# Share of the transactions made by fraudsters, the fraud rate of the Kaggle sample
+FRAUD_RATE = 0.0077
+TRANSACTIONS_PER_USER = 70
+# Transactions of the last 7 weeks (2019-W13 to 2019-W19), users signed up in the 3 years before
+TRANSACTIONS_START = pd.Timestamp("2019-04-01")
+TRANSACTIONS_DAYS = 49
+SIGNUP_DAYS = 3 * 365
+
+# Salts of the id hashes, so users and transactions never share an id
+USER_SALT = 0x5553455253
+TRANSACTION_SALT = 0x5458
+
+
+def _splitmix64(x):
+    """SplitMix64 finalizer, a cheap bijective hash of uint64 arrays."""
+    with np.errstate(over="ignore"):
+        x = (x + np.uint64(0x9E3779B97F4A7C15)).astype(np.uint64)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return x ^ (x >> np.uint64(31))
+
+
+def _hashes(positions, seed, salt):
+    with np.errstate(over="ignore"):
+        key = np.asarray(positions, dtype=np.uint64) * np.uint64(2) + np.uint64((seed * 0x1000193 + salt) % 2 ** 63)
+        return _splitmix64(key), _splitmix64(key + np.uint64(1))
+
+
+_HEX = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+
+
+def uuids(positions, seed, salt):
+    """UUID4-looking ids of the given positions, the same for the same (seed, salt, position).
+
+    The hex digits are assembled as a byte matrix, so no Python string is formatted per row.
+    """
+    high, low = _hashes(positions, seed, salt)
+    raw = np.column_stack([high.astype(">u8"), low.astype(">u8")]).view(np.uint8).reshape(-1, 16)
+    digits = np.empty((len(raw), 32), dtype=np.uint8)
+    digits[:, 0::2] = _HEX[raw >> 4]
+    digits[:, 1::2] = _HEX[raw & 15]
+    digits[:, 12] = ord("4")
+
+    out = np.full((len(raw), 36), ord("-"), dtype=np.uint8)
+    for start, end, offset in [(0, 8, 0), (8, 12, 1), (12, 16, 2), (16, 20, 3), (20, 32, 4)]:
+        out[:, start + offset:end + offset] = digits[:, start:end]
+    return out.view("S36").ravel().astype(str)
+
+
+def _uniform(hashes):
+    """Uniform floats in [0, 1) from the top 53 bits of the hashes."""
+    return (hashes >> np.uint64(11)).astype(np.float64) / 2.0 ** 53
+
+
+def _pick(u, mix):
+    """Label of the mix each uniform draw falls in."""
+    labels = np.asarray(list(mix))
+    cumulative = np.cumsum(list(mix.values()))
+    return labels[np.minimum(np.searchsorted(cumulative / cumulative[-1], u, side="right"), len(labels) - 1)]
+
+
+def fraudster_probability(fraud_rate=FRAUD_RATE):
+    """Probability of a user of each country being a fraudster, every user being equally active."""
+    weights = np.array([COUNTRY_FRAUD_WEIGHT.get(c, 1.0) for c in COUNTRY_MIX])
+    shares = np.array(list(COUNTRY_MIX.values()))
+    return dict(zip(COUNTRY_MIX, weights * fraud_rate / (shares * weights).sum() * shares.sum()))
+
+
+def user_profiles(positions, seed, fraud_rate=FRAUD_RATE):
+    """Country and fraudster flag of users, a pure function of their position.
+
+    Transactions are generated chunk by chunk for any user, so the user table never has to be
+    held in memory.
+    """
+    country_hash, fraud_hash = _hashes(positions, seed, USER_SALT + 1)
+    country = _pick(_uniform(country_hash), COUNTRY_MIX)
+    probability = pd.Series(fraudster_probability(fraud_rate)).reindex(country).to_numpy()
+    return country, _uniform(fraud_hash) < probability
+
+
+def _by_fraud(is_fraudster, legitimate, fraudster):
+    return np.where(is_fraudster, fraudster, legitimate)
+
+
+def users_chunk(start, end, seed, fraud_rate=FRAUD_RATE):
+    """Users [start, end) in the schema of users.csv, and the ids of the fraudsters among them."""
+    positions = np.arange(start, end, dtype=np.uint64)
+    country, is_fraudster = user_profiles(positions, seed, fraud_rate)
+    created_hash, _ = _hashes(positions, seed, USER_SALT + 2)
+    signup = (TRANSACTIONS_START - pd.Timedelta(days=SIGNUP_DAYS)).value // 10 ** 6
+    millis = signup + (_uniform(created_hash) * SIGNUP_DAYS * 86_400_000).astype(np.int64)
+
+    # Profile fields no transaction depends on, drawn per chunk
+    rng = np.random.default_rng([seed, USER_SALT, start])
+    n = end - start
+    phone = np.where(rng.random(n) < FOREIGN_PHONE_SHARE, _pick(rng.random(n), COUNTRY_MIX), country)
+    age = rng.normal(_by_fraud(is_fraudster, AGE_PARAMS[0][0], AGE_PARAMS[1][0]),
+                     _by_fraud(is_fraudster, AGE_PARAMS[0][1], AGE_PARAMS[1][1]))
+
+    users = pd.DataFrame({
+        "ID": uuids(positions, seed, USER_SALT),
+        "CREATED_DATE": pd.to_datetime(millis, unit="ms").strftime("%Y-%m-%d %H:%M:%S.%f").str[:-3],
+        "COUNTRY": country,
+        "HAS_EMAIL": (rng.random(n) < _by_fraud(is_fraudster, *HAS_EMAIL_SHARE)).astype(np.int8),
+        "PHONE_COUNTRY": pd.Series(phone).replace(PHONE_COUNTRY).to_numpy(),
+        "IS_FRAUDSTER": is_fraudster,
+        "TERMS_VERSION": _pick(rng.random(n), TERMS_VERSION_MIX),
+        "STATE": np.where(rng.random(n) < _by_fraud(is_fraudster, *LOCKED_SHARE), "LOCKED", "ACTIVE"),
+        "BIRTH_YEAR": TRANSACTIONS_START.year - np.clip(age, 18, 85).astype(np.int64),
+        "KYC": _by_fraud(is_fraudster, _pick(rng.random(n), KYC_MIX), _pick(rng.random(n), FRAUD_KYC_MIX)),
+        "FAILED_SIGN_IN_ATTEMPTS": rng.poisson(_by_fraud(is_fraudster, *FAILED_SIGN_IN_MEAN)),
+    })
+    return users, users["ID"][is_fraudster]
+
+
+def transactions_chunk(start, end, n_users, seed, fraud_rate=FRAUD_RATE, days=TRANSACTIONS_DAYS):
+    """Transactions [start, end) in the schema of transactions.csv."""
+    rng = np.random.default_rng([seed, start])
+    n = end - start
+    user = rng.integers(0, n_users, n).astype(np.uint64)
+    country, is_fraudster = user_profiles(user, seed, fraud_rate)
+
+    types = np.where(is_fraudster, _pick(rng.random(n), FRAUD_TYPE_MIX), _pick(rng.random(n), TYPE_MIX))
+    params = pd.DataFrame(AMOUNT_PARAMS, index=["mu", "sigma"]).T.reindex(types)
+    home = pd.Series(HOME_CURRENCY).reindex(country).fillna("EUR").to_numpy()
+    travel = np.asarray(TRAVEL_CURRENCIES)[rng.integers(0, len(TRAVEL_CURRENCIES), n)]
+
+    begin = TRANSACTIONS_START.value // 10 ** 6
+    millis = begin + rng.integers(0, days * 86_400_000, n)
+    transactions = pd.DataFrame({
+        "ID": uuids(np.arange(start, end, dtype=np.uint64), seed, TRANSACTION_SALT),
+        "USER_ID": uuids(user, seed, USER_SALT),
+        "CREATED_DATE": pd.to_datetime(millis, unit="ms").strftime("%Y-%m-%d %H:%M:%S.%f").str[:-3],
+        "TYPE": types,
+        "STATE": _pick(rng.random(n), STATE_MIX),
+        "AMOUNT_GBP": rng.lognormal(params["mu"].to_numpy(), params["sigma"].to_numpy()).round(2),
+        "CURRENCY": np.where(rng.random(n) < HOME_CURRENCY_SHARE, home, travel),
+    })
+
+    # Remaining Kaggle columns, drawn after the ones above so those stay the same for a seed
+    has_merchant = np.isin(types, MERCHANT_TYPES)
+    merchant_country = np.where(rng.random(n) < HOME_MERCHANT_SHARE, country, _pick(rng.random(n), COUNTRY_MIX))
+    category = np.where(types == "ATM", "atm", _pick(rng.random(n), MERCHANT_CATEGORY_MIX))
+    entry_method = _by_fraud(is_fraudster, _pick(rng.random(n), ENTRY_METHOD_MIX), _pick(rng.random(n), FRAUD_ENTRY_METHOD_MIX))
+    source_draw = rng.random(n)
+    source = np.empty(n, dtype=object)
+    for transaction_type, mix in SOURCE_MIX.items():
+        of_type = types == transaction_type
+        source[of_type] = _pick(source_draw[of_type], mix)
+
+    rate = pd.Series(GBP_RATES).reindex(transactions["CURRENCY"]).to_numpy()
+    transactions["AMOUNT"] = np.round(transactions["AMOUNT_GBP"].to_numpy() * rate * 100).astype(np.int64)
+    transactions["MERCHANT_CATEGORY"] = pd.Series(category).where(has_merchant)
+    transactions["MERCHANT_COUNTRY"] = pd.Series(pd.Series(COUNTRY_ISO3).reindex(merchant_country).to_numpy()).where(has_merchant)
+    transactions["ENTRY_METHOD"] = np.where(has_merchant, entry_method, "misc")
+    transactions["SOURCE"] = source
+    return transactions
+
+
+def _ranges(total, chunksize):
+    return [(start, min(start + chunksize, total)) for start in range(0, total, chunksize)]
+
+
+def generate(output_dir, transactions=1_000_000, seed=0, fraud_rate=FRAUD_RATE,
+             transactions_per_user=TRANSACTIONS_PER_USER, days=TRANSACTIONS_DAYS, chunksize=1_000_000):
+    """Write users.csv, transactions.csv and fraudsters.csv with `transactions` rows over `days`
+    days from 2019-04-01, seeded.
+
+    Every chunk is generated independently from (seed, position) and appended to the files,
+    so memory stays flat whatever the size, and the same seed and chunksize always give the
+    same files.
+    Returns the number of rows of each table.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    n_users = max(1, -(-transactions // transactions_per_user))
+    rows = {"users": 0, "transactions": 0, "fraudsters": 0}
+
+    paths = {table: os.path.join(output_dir, f"{table}.csv") for table in rows}
+    with open(paths["users"] + ".tmp", "w", newline="") as users_fh, \
+            open(paths["fraudsters"] + ".tmp", "w", newline="") as fraudsters_fh:
+        fraudsters_fh.write("USER_ID\n")
+        for start, end in _ranges(n_users, chunksize):
+            users, fraudsters = users_chunk(start, end, seed, fraud_rate)
+            users.to_csv(users_fh, header=start == 0, index=False)
+            fraudsters.to_csv(fraudsters_fh, header=False, index=False)
+            rows["users"] += len(users)
+            rows["fraudsters"] += len(fraudsters)
+
+    with open(paths["transactions"] + ".tmp", "w", newline="") as fh:
+        for start, end in _ranges(transactions, chunksize):
+            chunk = transactions_chunk(start, end, n_users, seed, fraud_rate, days)
+            chunk.to_csv(fh, header=start == 0, index=False)
+            rows["transactions"] += len(chunk)
+
+    for path in paths.values():
+        os.replace(path + ".tmp", path)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seeded synthetic users/transactions/fraudsters CSVs")
+    parser.add_argument("--output-dir", default="data/synthetic", help="Folder the three CSVs are written to")
+    parser.add_argument("--transactions", type=int, default=1_000_000, help="Number of transactions")
+    parser.add_argument("--seed", type=int, default=0, help="Same seed, same files")
+    parser.add_argument("--days", type=int, default=TRANSACTIONS_DAYS, help="Days the transactions are spread over")
+    parser.add_argument("--fraud-rate", type=float, default=FRAUD_RATE, help="Share of fraudster transactions")
+    parser.add_argument("--chunksize", type=int, default=1_000_000, help="Rows generated and written per chunk")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    rows = generate(args.output_dir, args.transactions, args.seed, args.fraud_rate, days=args.days,
+                    chunksize=args.chunksize)
+    print(f"{rows['users']:,} users, {rows['transactions']:,} transactions, {rows['fraudsters']:,} fraudsters "
+          f"written to {args.output_dir} in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,166 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from etl import connect
+
+
+VELOCITY_FILE_PATH = os.environ.get("VELOCITY_FILE_PATH", "data/velocity_features.csv")
+
+# Look-back windows, each one includes the current transaction
+WINDOWS = {
+    "1h": pd.Timedelta(hours=1),
+    "24h": pd.Timedelta(hours=24),
+    "7d": pd.Timedelta(days=7),
+}
+
+TRANSACTION_COLUMNS = ["ID", "USER_ID", "CREATED_DATE", "TYPE", "AMOUNT_GBP", "CURRENCY"]
+
+
+def feature_columns(windows=WINDOWS):
+    return [f"{feature}_{name}" for name in windows
+            for feature in ["tx_count", "gbp_sum", "topup_count", "topup_gbp_sum", "currencies"]]
+
+
+def read_transactions(conn, since=None):
+    """Transactions needed for the velocity features, optionally only from `since` on."""
+    query = f"SELECT {', '.join(TRANSACTION_COLUMNS)} FROM transactions"
+    params = None
+    if since is not None:
+        query += " WHERE CREATED_DATE >= ?"
+        params = (str(since),)
+    return pd.read_sql_query(query, conn, params=params)
+
+
+def _window_starts(users, millis, windows):
+    """First row of each row's window, for rows sorted by (user, time).
+
+    Users and times are packed in one int64 key (user * span + milliseconds), with a span large
+    enough that a look-back never reaches the previous user, so a single searchsorted over the
+    whole frame finds every window start.
+    """
+    millis = millis - millis.min(initial=0)
+    longest = max(int(w / pd.Timedelta(milliseconds=1)) for w in windows.values())
+    span = int(millis.max(initial=0)) + longest + 1
+    if (int(users.max(initial=0)) + 1) * span >= 2 ** 62:
+        raise Exception('Too many users and too long a time range to pack the velocity keys!')
+
+    keys = users.astype(np.int64) * span + millis
+    return {name: np.searchsorted(keys, keys - int(w / pd.Timedelta(milliseconds=1)) + 1, side="left")
+            for name, w in windows.items()}
+
+
+def compute_velocity(transactions, windows=WINDOWS):
+    """Rolling per-user features of every transaction over each look-back window.
+
+    For each window: number of transactions, GBP sum, TOPUP count and GBP sum, and distinct
+    currencies, over the user's transactions created in (created_date - window, created_date].
+    Transactions with the same timestamp count in the order of their ID.
+
+    The frame is sorted once by (USER_ID, CREATED_DATE), and once by (USER_ID, CURRENCY) to link
+    each transaction to the user's previous one in the same currency. Counts and sums are
+    differences of prefix sums at the window bounds, distinct currencies a prefix sum of the
+    window intervals each transaction counts in, so the cost after the sorts is linear in the
+    number of transactions whatever the number of currencies.
+    """
+    df = transactions[TRANSACTION_COLUMNS].copy()
+    df["CREATED_DATE"] = pd.to_datetime(df["CREATED_DATE"], format="ISO8601")
+    df = df.sort_values(["USER_ID", "CREATED_DATE", "ID"], kind="stable").reset_index(drop=True)
+
+    users = pd.factorize(df["USER_ID"], sort=True)[0]
+    millis = df["CREATED_DATE"].to_numpy().astype("datetime64[ms]").astype(np.int64)
+    starts = _window_starts(users, millis, windows)
+    ends = np.arange(1, len(df) + 1)
+
+    amounts = df["AMOUNT_GBP"].fillna(0).to_numpy(dtype=np.float64)
+    is_topup = (df["TYPE"] == "TOPUP").to_numpy()
+    prefix = {
+        "tx_count": np.arange(len(df) + 1, dtype=np.float64),
+        "gbp_sum": np.concatenate([[0.0], np.cumsum(amounts)]),
+        "topup_count": np.concatenate([[0.0], np.cumsum(is_topup)]),
+        "topup_gbp_sum": np.concatenate([[0.0], np.cumsum(np.where(is_topup, amounts, 0.0))]),
+    }
+
+    features = {}
+    for name, start in starts.items():
+        for feature, cum in prefix.items():
+            values = cum[ends] - cum[start]
+            features[f"{feature}_{name}"] = values.astype(np.int32) if "count" in feature else values.round(2)
+
+    # A row counts as a distinct currency of row i's window when it is in the window and the
+    # previous row of the same user and currency is not. Window starts never decrease, so the rows
+    # i a given row counts for are one interval, added with a difference array
+    currencies = pd.factorize(df["CURRENCY"])[0]
+    by_currency = np.argsort(users.astype(np.int64) * (currencies.max(initial=0) + 2) + currencies, kind="stable")
+    previous = np.full(len(df), -1, dtype=np.int64)
+    same = np.flatnonzero((users[by_currency[1:]] == users[by_currency[:-1]])
+                          & (currencies[by_currency[1:]] == currencies[by_currency[:-1]]))
+    previous[by_currency[same + 1]] = by_currency[same]
+    known = np.flatnonzero(currencies >= 0)
+
+    for name, start in starts.items():
+        first = np.maximum(known, np.searchsorted(start, previous[known], side="right"))
+        last = np.searchsorted(start, known, side="right")
+        counted = first < last
+        delta = (np.bincount(first[counted], minlength=len(df) + 1)
+                 - np.bincount(last[counted], minlength=len(df) + 1))
+        features[f"currencies_{name}"] = np.cumsum(delta[:len(df)]).astype(np.int32)
+
+    features = pd.DataFrame(features)[feature_columns(windows)]
+    return pd.concat([df[["ID", "USER_ID", "CREATED_DATE"]], features], axis=1)
+
+
+class VelocityEngine():
+    """Incremental velocity features for transactions arriving in batches.
+
+    Only the transactions of the last (longest window) are kept between updates, which is all
+    the look-back any new transaction needs. Transactions older than that tail when they arrive
+    are scored against the tail only.
+    """
+
+    def __init__(self, history=None, windows=WINDOWS):
+        self.windows = windows
+        self.longest = max(windows.values())
+        self.tail = pd.DataFrame(columns=TRANSACTION_COLUMNS)
+        if history is not None and not history.empty:
+            self._keep(history[TRANSACTION_COLUMNS])
+
+    def _keep(self, transactions):
+        transactions = transactions.assign(CREATED_DATE=pd.to_datetime(transactions["CREATED_DATE"], format="ISO8601"))
+        cutoff = transactions["CREATED_DATE"].max() - self.longest
+        self.tail = transactions[transactions["CREATED_DATE"] > cutoff].reset_index(drop=True)
+
+    def update(self, new_transactions):
+        """Features of the new transactions only, ready to be joined on ID and fed to Patrol."""
+        new = new_transactions[TRANSACTION_COLUMNS].assign(
+            CREATED_DATE=pd.to_datetime(new_transactions["CREATED_DATE"], format="ISO8601"))
+        known = self.tail[self.tail["USER_ID"].isin(new["USER_ID"])] if len(self.tail) else self.tail
+
+        combined = pd.concat([known, new], ignore_index=True) if len(known) else new
+        features = compute_velocity(combined, self.windows)
+        features = features[features["ID"].isin(new["ID"])].reset_index(drop=True)
+
+        self._keep(pd.concat([self.tail, new], ignore_index=True) if len(self.tail) else new)
+        return features
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rolling per-user velocity features of the transactions table")
+    parser.add_argument("--output", default=VELOCITY_FILE_PATH, help="CSV with one row of features per transaction")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    conn = connect()
+    try:
+        transactions = read_transactions(conn)
+    finally:
+        conn.close()
+
+    features = compute_velocity(transactions)
+    tmp_path = args.output + ".tmp"
+    features.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, args.output)
+    print(f"{len(features)} transactions written to {args.output} in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,62 @@
+import os
+import shutil
+import sqlite3
+import sys
+
+import pandas as pd
+import pytest
+
+# The scripts and the Patrol class import their siblings by module name, as when run from their folder
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for folder in ("scripts", "data"):
+    sys.path.insert(0, os.path.join(ROOT, folder))
+
+# Seeded synthetic tables, big enough for every country, type and week to show up
+SYNTHETIC_TRANSACTIONS = 20_000
+SYNTHETIC_FRAUD_RATE = 0.05
+
+
+@pytest.fixture(scope="session")
+def synthetic_dir(tmp_path_factory):
+    """users.csv, transactions.csv and fraudsters.csv of a small synthetic history."""
+    from synthetic import generate
+
+    folder = tmp_path_factory.mktemp("synthetic")
+    generate(str(folder), SYNTHETIC_TRANSACTIONS, seed=1, fraud_rate=SYNTHETIC_FRAUD_RATE, chunksize=7_000)
+    return folder
+
+
+@pytest.fixture(scope="session")
+def synthetic_db(synthetic_dir, tmp_path_factory):
+    """fincrime.db loaded from the synthetic CSVs by db_setup.py, never written to by the tests."""
+    from db_setup import setup_database
+
+    path = tmp_path_factory.mktemp("db") / "fincrime.db"
+    setup_database(str(synthetic_dir), chunksize=5_000, database_url=f"sqlite:///{path}")
+    return path
+
+
+def query_eda(path):
+    """base_2 as query_eda.sql computes it on the given database."""
+    with open(os.path.join(ROOT, "scripts", "query_eda.sql")) as fh:
+        query = fh.read()
+    conn = sqlite3.connect(path)
+    try:
+        return pd.read_sql_query(query, conn)
+    finally:
+        conn.close()
+
+
+@pytest.fixture(scope="session")
+def reference_base2(synthetic_db):
+    return query_eda(synthetic_db)
+
+
+@pytest.fixture
+def workdir(synthetic_db, tmp_path, monkeypatch):
+    """A working directory with its own copy of fincrime.db and a data/ folder, where the scripts'
+    relative default paths (sqlite:///fincrime.db, data/...) resolve."""
+    shutil.copy(synthetic_db, tmp_path / "fincrime.db")
+    (tmp_path / "data").mkdir()
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,99 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from alerts import ALERT_COLUMNS, MIN_PERIODS, AlertEngine, period_values, read_new_periods
+
+
+def segment_history(rates, country="GB", transaction_type="CARD_PAYMENT", transactions=1_000):
+    return pd.DataFrame({
+        "period": [f"2019-W{w:02d}" for w in range(10, 10 + len(rates))],
+        "country": country,
+        "transaction_type": transaction_type,
+        "nb_transaction": transactions,
+        "nb_transaction_fraud": [round(r * transactions) for r in rates],
+        "total_amount_fraud": [r * transactions * 40.0 for r in rates],
+    })
+
+
+def without_time(alerts):
+    return alerts.drop(columns="detected_at").reset_index(drop=True)
+
+
+def test_a_spike_alerts_without_dragging_the_baseline():
+    rates = [0.010, 0.012, 0.011, 0.009, 0.010, 0.011, 0.010, 0.012]
+    values = segment_history(rates + [0.080, 0.011])
+    engine = AlertEngine()
+    alerts = engine.ingest(values, include_last=True)
+
+    assert list(alerts.columns) == ALERT_COLUMNS
+    assert set(alerts["period"]) == {values["period"].iloc[len(rates)]}
+    assert set(alerts["metric"]) == {"fraud_rate", "fraud_amount"}
+    assert (alerts["z"] > 0).all()
+    # The spike is clipped before being folded in, the baseline stays near the usual rate
+    assert engine.state["fraud_rate_mean"].iloc[0] < 0.02
+
+
+def test_no_alert_before_the_warm_up():
+    values = segment_history([0.01] * (MIN_PERIODS - 1) + [0.5])
+    assert AlertEngine().ingest(values, include_last=True).empty
+
+
+def test_small_segments_have_no_rate():
+    values = segment_history([0.01] * 8 + [0.5], transactions=10)
+    alerts = AlertEngine().ingest(values, include_last=True)
+    assert "fraud_rate" not in set(alerts["metric"])
+
+
+@pytest.fixture(scope="module")
+def weekly_values(reference_base2):
+    return period_values(reference_base2)
+
+
+def test_period_by_period_equals_one_go(weekly_values, tmp_path):
+    at_once = AlertEngine()
+    all_alerts = at_once.ingest(weekly_values, include_last=True)
+
+    path = tmp_path / "alert_state.csv"
+    streamed = []
+    for period in sorted(weekly_values["period"].unique()):
+        engine = AlertEngine.load(path)
+        streamed.append(engine.ingest(weekly_values[weekly_values["period"] <= period], include_last=True))
+        engine.save(path)
+
+    pd.testing.assert_frame_equal(without_time(pd.concat(streamed, ignore_index=True)), without_time(all_alerts),
+                                  check_dtype=False)
+    pd.testing.assert_frame_equal(AlertEngine.load(path).state, at_once.state, check_exact=False)
+
+
+def test_watermark_skips_seen_periods(weekly_values):
+    engine = AlertEngine()
+    engine.ingest(weekly_values)
+    periods = sorted(weekly_values["period"].unique())
+    # The latest period may still be filling up
+    assert engine.watermark == periods[-2]
+
+    state = engine.state.copy()
+    assert engine.ingest(weekly_values[weekly_values["period"] < periods[-1]]).empty
+    pd.testing.assert_frame_equal(engine.state, state)
+
+
+def test_namibia_survives_the_state_file(tmp_path):
+    engine = AlertEngine()
+    engine.ingest(segment_history([0.01] * 3, country="NA"), include_last=True)
+    engine.save(tmp_path / "alert_state.csv")
+    assert AlertEngine.load(tmp_path / "alert_state.csv").state.index.tolist() == [("NA", "CARD_PAYMENT")]
+
+
+def test_sql_periods_equal_period_values(reference_base2, weekly_values):
+    conn = sqlite3.connect(":memory:")
+    try:
+        reference_base2.to_sql("base_2", conn, index=False)
+        after = sorted(weekly_values["period"].unique())[2]
+        from_sql = read_new_periods(conn, after)
+    finally:
+        conn.close()
+
+    expected = weekly_values[weekly_values["period"] > after].reset_index(drop=True)
+    pd.testing.assert_frame_equal(from_sql, expected, check_dtype=False)
@@ -0,0 +1,38 @@
+import pandas as pd
+import pytest
+
+from build_base2 import build_base2, week_partitions, write_csv
+from etl import connect
+
+COMPARED = ["iso_week", "week_date", "country", "transaction_type", "nb_users", "nb_fraudsters", "nb_transaction",
+            "nb_transaction_fraud", "total_amount_fraud", "total_amount_transactions",
+            "pct_completed", "pct_failed", "pct_cancelled", "pct_refunded"]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_build_equals_query_eda(synthetic_db, reference_base2, workers):
+    base2, _ = build_base2(f"sqlite:///{synthetic_db}", workers=workers)
+    # day_date is a bare column in query_eda.sql, any day of the group
+    pd.testing.assert_frame_equal(base2[COMPARED], reference_base2[COMPARED])
+
+
+def test_partitions_are_contiguous_weeks(synthetic_db):
+    conn = connect(f"sqlite:///{synthetic_db}")
+    try:
+        partitions = week_partitions(conn)
+        first, last = conn.execute("SELECT MIN(CREATED_DATE), MAX(CREATED_DATE) FROM transactions").fetchone()
+    finally:
+        conn.close()
+
+    starts = pd.to_datetime([start for start, _ in partitions])
+    assert (starts.weekday == 0).all()
+    assert all(end == next_start for (_, end), (next_start, _) in zip(partitions, partitions[1:]))
+    assert partitions[0][0] <= first and last < partitions[-1][1]
+
+
+def test_csv_roundtrip(synthetic_db, tmp_path):
+    base2, _ = build_base2(f"sqlite:///{synthetic_db}", workers=1)
+    write_csv(base2, str(tmp_path / "base_2.csv"))
+    written = pd.read_csv(tmp_path / "base_2.csv")
+    assert len(written) == len(base2)
+    assert written["nb_transaction"].sum() == base2["nb_transaction"].sum()
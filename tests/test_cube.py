@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cube import CUBE_MEASURES, Cube
+
+
+SLICES = [
+    {},
+    {"country": ["GB"]},
+    {"country": ["GB", "FR", "??"], "transaction_type": ["TOPUP", "CARD_PAYMENT"]},
+    {"iso_week": ["2019-W15", "2019-W16"], "transaction_type": ["ATM"]},
+    {"country": []},
+]
+
+
+def filtered(base2, selections):
+    mask = np.ones(len(base2), dtype=bool)
+    for dim, values in selections.items():
+        mask &= base2[dim].isin(values).to_numpy()
+    return base2[mask]
+
+
+@pytest.mark.parametrize("selections", SLICES)
+def test_totals_match_a_filtered_sum(reference_base2, selections):
+    cube = Cube(reference_base2)
+    expected = filtered(reference_base2, selections)[CUBE_MEASURES].sum()
+    for measure, total in cube.totals(**selections).items():
+        assert total == pytest.approx(expected[measure], abs=1e-6)
+
+
+@pytest.mark.parametrize("selections", SLICES)
+@pytest.mark.parametrize("by", [["iso_week"], ["country"], ["transaction_type", "country"], ["country", "iso_week"]])
+def test_query_matches_groupby(reference_base2, selections, by):
+    cube = Cube(reference_base2)
+    expected = filtered(reference_base2, selections).groupby(by)[CUBE_MEASURES].sum().reset_index()
+    result = cube.query(by=by, **selections)
+    pd.testing.assert_frame_equal(result.reset_index(drop=True), expected, check_dtype=False)
+
+
+def test_unknown_dimension_is_refused(reference_base2):
+    cube = Cube(reference_base2)
+    with pytest.raises(KeyError):
+        cube.totals(state=["x"])
+    with pytest.raises(KeyError):
+        cube.query(by="state")
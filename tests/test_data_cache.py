@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_cache import atomic_path, data_version, is_cache_fresh, parse_csv, read_base2, read_prepared
+from schema import BASE2_SCHEMA, apply_schema
+
+
+@pytest.fixture
+def base2_csv(reference_base2, tmp_path):
+    path = tmp_path / "base_2.csv"
+    reference_base2.to_csv(path, index=False)
+    return str(path)
+
+
+def test_cached_frame_equals_the_csv(base2_csv):
+    expected = parse_csv(base2_csv)
+    cold = read_base2(base2_csv)
+    warm = read_base2(base2_csv)
+    for frame in [cold, warm]:
+        pd.testing.assert_frame_equal(frame, expected, check_dtype=False, check_categorical=False)
+    assert data_version(cold) == data_version(warm)
+
+
+def test_touch_keeps_the_cache_and_edits_rebuild_it(base2_csv):
+    read_base2(base2_csv)
+    os.utime(base2_csv, ns=(0, 0))
+    assert is_cache_fresh(base2_csv)
+
+    edited = parse_csv(base2_csv).head(5)
+    edited.to_csv(base2_csv, index=False)
+    assert not is_cache_fresh(base2_csv)
+    assert len(read_base2(base2_csv)) == 5
+
+
+def test_prepared_frame_equals_the_schema(base2_csv):
+    expected = apply_schema(read_base2(base2_csv))
+    for _ in range(2):
+        prepared = read_prepared(base2_csv)
+        pd.testing.assert_frame_equal(prepared, expected, check_categorical=False)
+        assert prepared.attrs["schema_report"]["dtypes"] == expected.attrs["schema_report"]["dtypes"]
+
+
+def test_schema_keeps_the_values(reference_base2):
+    compact = apply_schema(reference_base2)
+    for col in BASE2_SCHEMA["dimensions"]:
+        assert isinstance(compact[col].dtype, pd.CategoricalDtype)
+        assert compact[col].astype(str).tolist() == reference_base2[col].astype(str).tolist()
+    for col in BASE2_SCHEMA["counts"]:
+        np.testing.assert_array_equal(compact[col], reference_base2[col])
+    for col in BASE2_SCHEMA["amounts"]:
+        assert compact[col].dtype == np.float64
+        np.testing.assert_array_equal(compact[col], reference_base2[col])
+    for col in BASE2_SCHEMA["ratios"]:
+        np.testing.assert_allclose(compact[col], reference_base2[col], atol=0.005)
+    assert compact.attrs["schema_report"]["bytes_saved"] > 0
+
+
+def test_atomic_path_leaves_nothing_on_failure(tmp_path):
+    path = tmp_path / "out.csv"
+    path.write_text("old")
+    with pytest.raises(ValueError):
+        with atomic_path(str(path)) as tmp:
+            with open(tmp, "w") as fh:
+                fh.write("half")
+            raise ValueError
+    assert path.read_text() == "old"
+    assert os.listdir(tmp_path) == ["out.csv"]
+
+    with atomic_path(str(path)) as tmp:
+        with open(tmp, "w") as fh:
+            fh.write("new")
+    assert path.read_text() == "new"
+    assert os.listdir(tmp_path) == ["out.csv"]
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from downsample import aggregate, bucket_end, bucket_start, choose_grain, lttb
+
+
+@pytest.mark.parametrize("max_points", [3, 10, 99])
+def test_lttb_keeps_the_budget_and_the_endpoints(max_points):
+    y = np.random.default_rng(0).normal(size=1000).cumsum()
+    kept = lttb(y, max_points)
+    assert len(kept) == max_points
+    assert kept[0] == 0 and kept[-1] == len(y) - 1
+    assert (np.diff(kept) > 0).all()
+
+
+@pytest.mark.parametrize("max_points", [-1, 0, 1, 2])
+def test_lttb_tiny_budget_keeps_only_the_endpoints(max_points):
+    assert list(lttb(np.arange(1000.0), max_points)) == [0, 999]
+
+
+def test_lttb_small_series_is_returned_whole():
+    assert list(lttb([1.0, 5.0, 2.0], 3)) == [0, 1, 2]
+    assert list(lttb([1.0, 5.0], 10)) == [0, 1]
+    assert list(lttb([4.0], 0)) == [0]
+    assert list(lttb([], 0)) == []
+
+
+def test_lttb_keeps_a_spike():
+    y = np.zeros(1000)
+    y[437] = 100.0
+    assert 437 in lttb(y, 20)
+
+
+def test_choose_grain_fits_the_budget():
+    start, end = "2018-01-01", "2019-06-30"
+    for max_points in [2, 10, 30, 100, 1000]:
+        grain = choose_grain(start, end, max_points)
+        buckets = bucket_start(pd.date_range(start, end), grain).nunique()
+        assert buckets <= max_points or grain == "year"
+    assert choose_grain(start, end, 1000) == "day"
+    assert choose_grain(start, end, 100) == "week"
+
+
+def test_aggregate_keeps_the_totals():
+    days = pd.date_range("2019-01-01", "2019-03-31")
+    frame = pd.DataFrame({"day_date": days, "amount": np.arange(len(days), dtype=np.float64)})
+    for grain in ["week", "month", "quarter"]:
+        buckets = aggregate(frame, "day_date", ["amount"], grain)
+        assert buckets["amount"].sum() == frame["amount"].sum()
+        assert (buckets["day_date"] == bucket_start(buckets["day_date"], grain)).all()
+        assert bucket_end(buckets["day_date"].iloc[0], grain) >= buckets["day_date"].iloc[0]
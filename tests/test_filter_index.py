@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from filter_index import INDEX_DIMENSIONS, FilterIndex
+
+
+def selections(base2, seed):
+    """Random picks of a few values of each dimension, some dimensions left unfiltered."""
+    rng = np.random.default_rng(seed)
+    picked = {}
+    for dim in INDEX_DIMENSIONS:
+        if rng.random() < 0.75:
+            values = base2[dim].unique()
+            picked[dim] = list(rng.choice(values, size=rng.integers(1, len(values) + 1), replace=False))
+    return picked
+
+
+def pandas_mask(base2, picked):
+    mask = np.ones(len(base2), dtype=bool)
+    for dim, values in picked.items():
+        mask &= base2[dim].isin(values).to_numpy()
+    return mask
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_bitmap_mask_matches_pandas(reference_base2, seed):
+    index = FilterIndex(reference_base2)
+    picked = selections(reference_base2, seed)
+    expected = pandas_mask(reference_base2, picked)
+    np.testing.assert_array_equal(index.mask(**picked), expected)
+    np.testing.assert_array_equal(index.positions(**picked), np.flatnonzero(expected))
+
+
+@pytest.mark.parametrize("n_rows", [1, 63, 64, 65, 130])
+def test_padding_bits_never_match(reference_base2, n_rows):
+    frame = reference_base2.iloc[:n_rows]
+    index = FilterIndex(frame)
+    assert index.mask().sum() == n_rows
+    assert list(index.positions()) == list(range(n_rows))
+
+
+def test_empty_or_unknown_selection_matches_nothing(reference_base2):
+    index = FilterIndex(reference_base2)
+    assert not index.mask(country=[]).any()
+    assert not index.mask(country=["??"]).any()
+    assert len(index.positions(country=[])) == 0
+    with pytest.raises(KeyError):
+        index.mask(state=["x"])
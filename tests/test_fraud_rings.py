@@ -0,0 +1,106 @@
+import sqlite3
+from collections import deque
+
+import numpy as np
+import pytest
+
+from fraud_rings import build_csr, connected_components, fraud_rings, key_edges, propagate_risk, read_tables
+
+
+def random_graph(seed, n_nodes=300, n_edges=250):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, n_nodes, (n_edges, 2)), n_nodes
+
+
+def neighbours(n_nodes, edges):
+    adjacency = [set() for _ in range(n_nodes)]
+    for u, v in edges:
+        if u != v:
+            adjacency[u].add(v)
+            adjacency[v].add(u)
+    return adjacency
+
+
+def distances(adjacency, source):
+    seen = {source: 0}
+    queue = deque([source])
+    while queue:
+        node = queue.popleft()
+        for other in adjacency[node]:
+            if other not in seen:
+                seen[other] = seen[node] + 1
+                queue.append(other)
+    return seen
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_components_equal_bfs(seed):
+    edges, n_nodes = random_graph(seed)
+    adjacency = neighbours(n_nodes, edges)
+    expected = [min(distances(adjacency, node)) for node in range(n_nodes)]
+    np.testing.assert_array_equal(connected_components(n_nodes, edges), expected)
+
+
+def test_no_edges():
+    np.testing.assert_array_equal(connected_components(4, np.empty((0, 2), dtype=np.int64)), np.arange(4))
+
+
+def test_csr_is_the_symmetric_adjacency():
+    edges, n_nodes = random_graph(7)
+    indptr, indices = build_csr(n_nodes, edges)
+    adjacency = neighbours(n_nodes, edges)
+    for node in range(n_nodes):
+        assert indices[indptr[node]:indptr[node + 1]].tolist() == sorted(adjacency[node])
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_risk_decays_with_the_distance(seed):
+    edges, n_nodes = random_graph(seed, n_edges=350)
+    rng = np.random.default_rng(seed)
+    seeds = np.where(rng.random(n_nodes) < 0.03, rng.choice([0.5, 1.0], n_nodes), 0.0)
+    decay, hops = 0.5, 3
+
+    adjacency = neighbours(n_nodes, edges)
+    expected = seeds.copy()
+    for source in np.flatnonzero(seeds):
+        for node, distance in distances(adjacency, source).items():
+            if distance <= hops:
+                expected[node] = max(expected[node], seeds[source] * decay ** distance)
+
+    risk = propagate_risk(*build_csr(n_nodes, edges), seeds, decay, hops)
+    np.testing.assert_allclose(risk, expected)
+
+
+def test_key_edges_keep_the_groups_and_skip_the_big_ones():
+    nodes = np.array([0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 3])
+    keys = np.array([1, 1, 1, 2, 2, 3, 4, 4, 4, 4, 2])
+    edges = key_edges(nodes, keys, max_group=3)
+    # Key 3 is a single node, key 4 has more than max_group nodes
+    labels = connected_components(10, edges)
+    assert labels.tolist() == [0, 0, 0, 3, 3, 5, 6, 7, 8, 9]
+    assert len(edges) == 3
+
+
+@pytest.fixture(scope="module")
+def rings(synthetic_db):
+    conn = sqlite3.connect(synthetic_db)
+    try:
+        users, transactions, fraudsters = read_tables(conn)
+    finally:
+        conn.close()
+    return fraud_rings(users, transactions, fraudsters), fraudsters
+
+
+def test_ring_counts_are_consistent(rings):
+    risk, fraudsters = rings
+    assert set(risk.loc[risk["is_fraudster"] == 1, "user_id"]) == set(fraudsters["USER_ID"])
+    by_ring = risk.groupby("ring_id").agg(size=("user_id", "size"), fraudsters=("is_fraudster", "sum"))
+    np.testing.assert_array_equal(risk["ring_size"], by_ring["size"].to_numpy()[risk["ring_id"]])
+    np.testing.assert_array_equal(risk["ring_fraudsters"], by_ring["fraudsters"].to_numpy()[risk["ring_id"]])
+
+
+def test_risk_stays_in_the_fraudsters_rings(rings):
+    risk, _ = rings
+    assert (risk.loc[risk["is_fraudster"] == 1, "risk"] == 1).all()
+    assert (risk.loc[risk["ring_fraudsters"] == 0, "risk"] == 0).all()
+    assert risk["risk"].between(0, 1).all()
@@ -0,0 +1,86 @@
+import copy
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from etl import GROUP_KEYS, build_sketches, connect, read_base
+from hll import Registers, SketchSet, build_registers, estimate, hash_values, relative_error
+
+
+def test_estimate_is_within_the_standard_error():
+    for n in [10, 1_000, 100_000]:
+        registers = build_registers(np.zeros(n, dtype=np.int64), 1, hash_values(np.arange(n)))
+        assert estimate(registers.merged([True])) == pytest.approx(n, rel=4 * relative_error())
+
+
+def test_merge_is_the_union():
+    ids = np.arange(20_000)
+    left = build_registers(np.zeros(12_000, dtype=np.int64), 1, hash_values(ids[:12_000]))
+    right = build_registers(np.zeros(12_000, dtype=np.int64), 1, hash_values(ids[8_000:]))
+    union = build_registers(np.zeros(len(ids), dtype=np.int64), 1, hash_values(ids))
+
+    merged = left.merge(right, [0], 1)
+    np.testing.assert_array_equal(merged.merged([True]), union.merged([True]))
+
+
+def test_sparse_layout_roundtrips():
+    rng = np.random.default_rng(0)
+    dense = np.where(rng.random((50, 2 ** 12)) < 0.05, rng.integers(1, 30, (50, 2 ** 12)), 0).astype(np.uint8)
+    dense[7] = 0
+    registers = Registers.from_dense(dense)
+    for g in range(len(dense)):
+        mask = np.zeros(len(dense), dtype=bool)
+        mask[g] = True
+        np.testing.assert_array_equal(registers.merged(mask), dense[g])
+
+    again = Registers.from_index_deltas(registers.offsets, registers.index_deltas(), registers.value)
+    np.testing.assert_array_equal(again.index, registers.index)
+
+
+@pytest.fixture(scope="module")
+def base_rows(synthetic_db):
+    conn = connect(f"sqlite:///{synthetic_db}")
+    try:
+        return read_base(conn)
+    finally:
+        conn.close()
+
+
+def test_group_sketches_match_exact_counts(base_rows):
+    sketches = build_sketches([base_rows])
+    for selections in [{}, {"country": ["GB"]}, {"transaction_type": ["TOPUP"], "iso_week": ["2019-W15"]}]:
+        mask = np.ones(len(base_rows), dtype=bool)
+        for dim, values in selections.items():
+            mask &= base_rows[dim].isin(values).to_numpy()
+        exact_users = base_rows.loc[mask, "user_id"].nunique()
+        exact_fraudsters = base_rows.loc[mask & (base_rows["is_fraudster"] == 1), "user_id"].nunique()
+        assert sketches.distinct("users", **selections) == pytest.approx(exact_users, rel=4 * relative_error(), abs=1)
+        assert sketches.distinct("fraudsters", **selections) == pytest.approx(exact_fraudsters, rel=4 * relative_error(), abs=1)
+
+
+def test_chunked_build_equals_one_pass(base_rows):
+    whole = build_sketches([base_rows])
+    chunked = build_sketches([base_rows.iloc[i:i + 3_000] for i in range(0, len(base_rows), 3_000)])
+    order = pd.MultiIndex.from_frame(chunked.keys[GROUP_KEYS]).get_indexer(pd.MultiIndex.from_frame(whole.keys[GROUP_KEYS]))
+    for name in ["users", "fraudsters"]:
+        for g in range(0, len(whole.keys), 17):
+            mask, other = np.zeros(len(whole.keys), bool), np.zeros(len(chunked.keys), bool)
+            mask[g], other[order[g]] = True, True
+            np.testing.assert_array_equal(whole.sketches[name].merged(mask), chunked.sketches[name].merged(other))
+
+
+def test_concat_equals_upserts_and_survives_save(base_rows, tmp_path):
+    weeks = [build_sketches([week]) for _, week in base_rows.groupby("iso_week", sort=True)]
+    concatenated = SketchSet.concat(copy.deepcopy(weeks))
+    upserted = weeks[0]
+    for week in weeks[1:]:
+        upserted = upserted.upsert(week)
+
+    concatenated.save(tmp_path / "sketches.npz")
+    loaded = SketchSet.load(tmp_path / "sketches.npz")
+    pd.testing.assert_frame_equal(loaded.keys.astype(str), upserted.keys.astype(str))
+    for name in ["users", "fraudsters"]:
+        for attribute in ["offsets", "index", "value"]:
+            np.testing.assert_array_equal(getattr(loaded.sketches[name], attribute),
+                                          getattr(upserted.sketches[name], attribute))
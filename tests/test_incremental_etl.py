@@ -0,0 +1,77 @@
+import pandas as pd
+import pytest
+
+from conftest import query_eda
+from etl import SKETCH_FILE_PATH, connect, sort_base2
+from hll import SketchSet
+from incremental_etl import export_base2, full_refresh, incremental_refresh, setup
+
+# day_date is a bare column in query_eda.sql, any day of the group
+COMPARED = ["iso_week", "week_date", "country", "transaction_type", "nb_users", "nb_fraudsters", "nb_transaction",
+            "nb_transaction_fraud", "total_amount_fraud", "total_amount_transactions",
+            "pct_completed", "pct_failed", "pct_cancelled", "pct_refunded"]
+
+SELECTIONS = [{}, {"country": ["GB", "FR"]}, {"transaction_type": ["CARD_PAYMENT"]}]
+
+
+def base2_table(conn):
+    return sort_base2(pd.read_sql_query("SELECT * FROM base_2", conn))[COMPARED]
+
+
+@pytest.fixture
+def refreshed(workdir, synthetic_dir):
+    """fincrime.db refreshed in full up to a cutoff, then by the delta after it and one late fraudster."""
+    transactions = pd.read_csv(synthetic_dir / "transactions.csv", dtype=str)
+    cutoff = transactions["CREATED_DATE"].sort_values().iloc[int(len(transactions) * 0.8)]
+    delta = transactions[transactions["CREATED_DATE"] > cutoff]
+    delta.to_csv(workdir / "delta.csv", index=False)
+    late_fraudster = pd.read_csv(synthetic_dir / "fraudsters.csv", dtype=str)["USER_ID"].iloc[0]
+
+    conn = connect()
+    conn.execute("DELETE FROM transactions WHERE CREATED_DATE > ?", (cutoff,))
+    conn.execute("DELETE FROM fraudsters WHERE USER_ID = ?", (late_fraudster,))
+    conn.commit()
+    setup(conn)
+    full_refresh(conn)
+    conn.commit()
+
+    report = incremental_refresh(conn, transactions_csv=str(workdir / "delta.csv"),
+                                 fraudsters_csv=str(synthetic_dir / "fraudsters.csv"))
+    assert report["new_transactions"] == len(delta)
+    assert report["new_fraudsters"] == 1
+    yield conn
+    conn.close()
+
+
+def test_incremental_equals_query_eda(refreshed, workdir):
+    reference = query_eda(workdir / "fincrime.db")[COMPARED]
+    pd.testing.assert_frame_equal(base2_table(refreshed), reference, check_dtype=False)
+
+
+def test_incremental_equals_full_refresh(refreshed):
+    incremental = base2_table(refreshed)
+    incremental_sketches = SketchSet.load(SKETCH_FILE_PATH)
+
+    full_refresh(refreshed)
+    pd.testing.assert_frame_equal(base2_table(refreshed), incremental)
+    full_sketches = SketchSet.load(SKETCH_FILE_PATH)
+    for selections in SELECTIONS:
+        for name in ["users", "fraudsters"]:
+            assert incremental_sketches.distinct(name, **selections) == full_sketches.distinct(name, **selections)
+
+
+def test_delta_is_ingested_once(refreshed, workdir, synthetic_dir):
+    before = base2_table(refreshed)
+    report = incremental_refresh(refreshed, transactions_csv=str(workdir / "delta.csv"),
+                                 fraudsters_csv=str(synthetic_dir / "fraudsters.csv"))
+    assert report == {"new_users": 0, "new_transactions": 0, "new_fraudsters": 0, "groups": 0}
+    pd.testing.assert_frame_equal(base2_table(refreshed), before)
+
+
+def test_export_is_ordered_like_query_eda(refreshed, workdir):
+    rows = export_base2(refreshed, str(workdir / "data" / "base_2.csv"))
+    exported = pd.read_csv(workdir / "data" / "base_2.csv", dtype={"iso_week": str})
+    assert rows == len(exported)
+    reference = query_eda(workdir / "fincrime.db")
+    assert exported[["iso_week", "country", "transaction_type"]].values.tolist() == \
+        reference[["iso_week", "country", "transaction_type"]].values.tolist()
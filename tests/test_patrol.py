@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from Patrol import Patrol
+
+
+class RateModel():
+    """Scores a transaction with the value of one of its features."""
+
+    def __init__(self, column="x"):
+        self.column = column
+        self.calls = 0
+
+    def predict_proba(self, X):
+        self.calls += 1
+        score = np.clip(X[self.column].to_numpy(dtype=np.float64), 0, 1)
+        return np.column_stack([1 - score, score])
+
+
+def frame(*scores):
+    return pd.DataFrame({"id": [f"t{i}" for i in range(len(scores))], "x": scores})
+
+
+@pytest.mark.parametrize("cache_size", [None, 16])
+def test_direct_data_assignment_scores_the_new_frame(cache_size):
+    patrol = Patrol(frame(0.1, 0.2), RateModel(), ["x"], transaction_column="id", cache_size=cache_size)
+    assert patrol.check_transaction("id", "t0") == "PASS"
+
+    patrol.data = frame(0.9, 0.95)
+    assert patrol.check_transaction("id", "t0") == "LOCK"
+    decisions, scores = patrol.check_transactions("id", ["t1", "t0"])
+    assert list(decisions) == ["LOCK", "LOCK"]
+    np.testing.assert_allclose(scores, [0.95, 0.9])
+
+
+def test_direct_data_assignment_drops_the_old_ids():
+    patrol = Patrol(frame(0.1, 0.2), RateModel(), ["x"], transaction_column="id", cache_size=16)
+    patrol.check_transaction("id", "t1")
+
+    patrol.data = frame(0.1)
+    with pytest.raises(Exception, match="No transaction"):
+        patrol.check_transaction("id", "t1")
+
+
+def test_direct_features_and_model_assignment():
+    data = frame(0.1, 0.2).assign(y=[0.8, 0.9])
+    patrol = Patrol(data, RateModel(), ["x"], transaction_column="id", cache_size=16)
+    assert patrol.check_transaction("id", "t0") == "PASS"
+
+    patrol.features = ["y"]
+    patrol.model = RateModel("y")
+    assert patrol.check_transaction("id", "t0") == "LOCK"
+
+
+def test_cache_hits_and_lru_eviction():
+    model = RateModel()
+    patrol = Patrol(frame(0.1, 0.2, 0.3), model, ["x"], transaction_column="id", cache_size=2)
+    for transaction_id in ["t0", "t1", "t0", "t2", "t1"]:
+        patrol.check_transaction("id", transaction_id)
+
+    # t1 was evicted by t2 (t0 was used more recently), so it is scored again
+    assert patrol.cache_info()["hits"] == 1
+    assert model.calls == 4
+
+
+def test_cache_matches_uncached_scores():
+    data = frame(*np.linspace(0, 1, 50))
+    ids = list(data["id"].sample(frac=1, random_state=0)) * 2
+    cached = Patrol(data, RateModel(), ["x"], cache_size=8).check_transactions("id", ids)
+    plain = Patrol(data, RateModel(), ["x"]).check_transactions("id", ids)
+    np.testing.assert_array_equal(cached[0], plain[0])
+    np.testing.assert_allclose(cached[1], plain[1])
+
+
+def test_batch_matches_single_checks():
+    data = frame(*np.linspace(0, 1, 20))
+    patrol = Patrol(data, RateModel(), ["x"], transaction_column="id")
+    decisions, _ = patrol.check_transactions("id", data["id"][::-1])
+    assert list(decisions) == [patrol.check_transaction("id", i) for i in data["id"][::-1]]
+
+
+def test_duplicated_ids_are_refused():
+    data = pd.DataFrame({"id": ["a", "a", "b"], "x": [0.1, 0.2, 0.3]})
+    patrol = Patrol(data, RateModel(), ["x"], transaction_column="id")
+    with pytest.raises(Exception, match="More transactions"):
+        patrol.check_transaction("id", "a")
+    assert patrol.check_transaction("id", "b") == "PASS"
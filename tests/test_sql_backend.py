@@ -0,0 +1,109 @@
+import sqlite3
+import threading
+
+import pandas as pd
+import pytest
+
+from cube import Cube
+from sql_backend import ConnectionPool, SqlCube
+
+SLICES = [
+    {},
+    {"country": ["GB", "FR", "??"], "transaction_type": ["TOPUP", "CARD_PAYMENT"]},
+    {"iso_week": ["2019-W15", "2019-W16"], "transaction_type": ["ATM"]},
+    {"country": []},
+]
+
+
+@pytest.fixture(scope="module")
+def pool(reference_base2, tmp_path_factory):
+    path = tmp_path_factory.mktemp("sql") / "fincrime.db"
+    conn = sqlite3.connect(path)
+    reference_base2.to_sql("base_2", conn, index=False)
+    conn.close()
+    pool = ConnectionPool(f"sqlite:///{path}", size=2)
+    yield pool
+    pool.close()
+
+
+@pytest.mark.parametrize("selections", SLICES)
+def test_sql_totals_equal_the_cube(reference_base2, pool, selections):
+    expected = Cube(reference_base2).totals(**selections)
+    totals = SqlCube(pool).totals(**selections)
+    assert totals.keys() == expected.keys()
+    for measure, total in totals.items():
+        assert total == pytest.approx(expected[measure], abs=1e-6)
+
+
+@pytest.mark.parametrize("selections", SLICES)
+@pytest.mark.parametrize("by", [["iso_week"], ["country", "transaction_type"]])
+def test_sql_query_equals_the_cube(reference_base2, pool, selections, by):
+    expected = Cube(reference_base2).query(by=by, **selections)
+    result = SqlCube(pool).query(by=by, **selections)
+    pd.testing.assert_frame_equal(result, expected.reset_index(drop=True), check_dtype=False)
+
+
+def test_row_chunks_cover_the_slice(reference_base2, pool):
+    selections = {"transaction_type": ["TOPUP"]}
+    rows = pd.concat(SqlCube(pool).row_chunks(chunksize=50, **selections), ignore_index=True)
+    expected = reference_base2[reference_base2["transaction_type"] == "TOPUP"]
+    assert len(rows) == len(expected)
+    assert rows["total_amount_transactions"].sum() == pytest.approx(expected["total_amount_transactions"].sum())
+
+
+def test_pool_is_read_only(pool):
+    with pool.connection() as conn:
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM base_2")
+
+
+def test_threads_share_the_pool(pool):
+    cube = SqlCube(pool)
+    expected = cube.totals()["nb_transaction"]
+    results, errors = [], []
+
+    def work():
+        try:
+            for _ in range(20):
+                results.append(cube.totals()["nb_transaction"])
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=work) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert results == [expected] * 120
+    assert pool._opened <= pool.size
+
+
+def test_close_wakes_the_waiters(reference_base2, tmp_path):
+    path = tmp_path / "fincrime.db"
+    conn = sqlite3.connect(path)
+    reference_base2.head(10).to_sql("base_2", conn, index=False)
+    conn.close()
+
+    pool = ConnectionPool(f"sqlite:///{path}", size=1)
+    errors = []
+
+    def wait():
+        try:
+            with pool.connection():
+                pass
+        except Exception as error:
+            errors.append(error)
+
+    with pool.connection():
+        waiter = threading.Thread(target=wait)
+        waiter.start()
+        waiter.join(0.2)
+        assert waiter.is_alive()
+        pool.close()
+        waiter.join(5)
+    assert not waiter.is_alive()
+    assert len(errors) == 1 and "closed" in str(errors[0])
+    with pytest.raises(Exception, match="closed"):
+        with pool.connection():
+            pass
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from velocity import WINDOWS, VelocityEngine, compute_velocity, feature_columns
+
+
+@pytest.fixture(scope="module")
+def transactions():
+    rng = np.random.default_rng(3)
+    n = 1_500
+    # Whole minutes over two weeks, so some transactions of a user share a timestamp
+    dates = pd.Timestamp("2019-04-01") + pd.to_timedelta(rng.integers(0, 14 * 24 * 60, n), unit="min")
+    frame = pd.DataFrame({
+        "ID": [f"t{i:05d}" for i in rng.permutation(n)],
+        "USER_ID": rng.choice([f"u{i}" for i in range(12)], n),
+        "CREATED_DATE": dates.strftime("%Y-%m-%d %H:%M:%S.000"),
+        "TYPE": rng.choice(["TOPUP", "CARD_PAYMENT", "TRANSFER"], n),
+        "AMOUNT_GBP": rng.gamma(2.0, 30.0, n).round(2),
+        "CURRENCY": rng.choice(["GBP", "EUR", "USD", "PLN", "RON", None], n, p=[.5, .2, .1, .1, .05, .05]),
+    })
+    frame.loc[rng.choice(n, 20, replace=False), "AMOUNT_GBP"] = np.nan
+    return frame
+
+
+def brute_force(transactions, windows=WINDOWS):
+    df = transactions.assign(CREATED_DATE=pd.to_datetime(transactions["CREATED_DATE"]))
+    df = df.sort_values(["USER_ID", "CREATED_DATE", "ID"]).reset_index(drop=True)
+    dates = df["CREATED_DATE"].to_numpy()
+    users = df["USER_ID"].to_numpy()
+    amounts = df["AMOUNT_GBP"].fillna(0).to_numpy()
+    topup = (df["TYPE"] == "TOPUP").to_numpy()
+    currencies = df["CURRENCY"].to_numpy()
+
+    columns = {c: [] for c in feature_columns(windows)}
+    for i in range(len(df)):
+        # Earlier rows of the user, ties in ID order, and the row itself
+        mine = np.flatnonzero(users[:i + 1] == users[i])
+        for name, window in windows.items():
+            w = mine[dates[mine] > dates[i] - window.to_timedelta64()]
+            columns[f"tx_count_{name}"].append(len(w))
+            columns[f"gbp_sum_{name}"].append(round(amounts[w].sum(), 2))
+            columns[f"topup_count_{name}"].append(int(topup[w].sum()))
+            columns[f"topup_gbp_sum_{name}"].append(round(amounts[w][topup[w]].sum(), 2))
+            columns[f"currencies_{name}"].append(len({c for c in currencies[w] if pd.notna(c)}))
+    return pd.concat([df[["ID", "USER_ID", "CREATED_DATE"]], pd.DataFrame(columns)], axis=1)
+
+
+def test_compute_velocity_equals_brute_force(transactions):
+    expected = brute_force(transactions)
+    pd.testing.assert_frame_equal(compute_velocity(transactions), expected, check_dtype=False)
+
+
+def test_short_windows(transactions):
+    windows = {"1min": pd.Timedelta(minutes=1), "90min": pd.Timedelta(minutes=90)}
+    pd.testing.assert_frame_equal(compute_velocity(transactions, windows), brute_force(transactions, windows),
+                                  check_dtype=False)
+
+
+def test_batches_equal_one_pass(transactions):
+    ordered = transactions.sort_values(["CREATED_DATE", "ID"]).reset_index(drop=True)
+    engine = VelocityEngine(ordered.iloc[:400])
+    batches = [engine.update(ordered.iloc[i:i + 150]) for i in range(400, len(ordered), 150)]
+
+    expected = compute_velocity(ordered).set_index("ID").loc[ordered["ID"].iloc[400:]]
+    streamed = pd.concat(batches).set_index("ID").loc[expected.index]
+    pd.testing.assert_frame_equal(streamed, expected)
+
+
+def test_engine_keeps_only_the_longest_window(transactions):
+    engine = VelocityEngine(transactions)
+    dates = engine.tail["CREATED_DATE"]
+    assert dates.min() > dates.max() - max(WINDOWS.values())